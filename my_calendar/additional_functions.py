@@ -1,8 +1,13 @@
 from calendar import monthrange
 import datetime
+import heapq
 import pytz
 
-from .models import Guest
+from django.urls import reverse
+
+from django.db.models import Q
+
+from .models import Guest, EventException
 
 COLORS = (
     "#E81AD4",
@@ -11,6 +16,15 @@ COLORS = (
     "#464AFF",
 )
 
+# color of events of calendars the user can't access
+OTHER_COLOR = "#FECA5C"
+
+# longest range of days returned by the JSON timeline
+MAX_RANGE_OF_DAYS = 62
+
+EVENTS_PER_PAGE = 20
+CURSOR_FORMAT = "%Y%m%dT%H%M%S.%fZ"
+
 def fill_month(date_):
     '''
     Function that returns list of days of month for given date
@@ -54,61 +68,406 @@ def fill_week(date_):
         first = first + datetime.timedelta(days=1)
     return days
 
-def event_dict(event, start, end, from_calendar):
-    dict = {
-        'pk': event.pk,
-        'title': event.title,
-        'start': event.start,
-        'end': event.end,
-        'all_day': event.all_day,
-        'color': event.calendar.color,
-    }
-    if from_calendar == True:
-        dict['class'] = event.calendar.pk
-        dict['color'] = event.calendar.color
-    else:
-        dict['class'] = 'other'
-        dict['color'] = "#FECA5C"
-    if event.all_day != True:
-        minutes_in_day = 1440
-        end_hour = end.hour
-        # if end_hour would be 0
-        # then events that end on midnight and after it, would have no height
-        if end_hour == 0:
-            end_hour = 24
-        height = ((end_hour - start.hour) * 60
-            + (end.minute - start.minute)) / minutes_in_day
-        start_seconds = (start.time().hour * 60
-            + start.time().minute)
-        top = start_seconds / minutes_in_day
-        dict['top'] = top
-        dict['height'] = height
-    return dict
+def get_days_of_view(view_type, date_):
+    '''
+    Function that returns list of days shown by month, week or day view.
+    '''
+    if view_type == 'month':
+        return fill_month(date_)
+    if view_type == 'week':
+        return fill_week(date_)
+    return [date_]
+
+def get_earlier_and_later(view_type, date_):
+    '''
+    Function that returns dates of the previous and the next period
+    of month, week or day view.
+    '''
+    if view_type == 'month':
+        earlier = (date_.replace(day=1) - datetime.timedelta(days=1)).replace(day=1)
+        later = date_.replace(day=monthrange(date_.year, date_.month)[1])
+        later = later + datetime.timedelta(days=1)
+        return earlier, later
+    if view_type == 'week':
+        return date_ - datetime.timedelta(days=7), date_ + datetime.timedelta(days=7)
+    return date_ - datetime.timedelta(days=1), date_ + datetime.timedelta(days=1)
+
+class TimelineEvent:
+    """
+    Fields of an event shown on the timeline, shared by its items
+    on all days the event overlaps.
+    calendar is the pk of the event's calendar or 'other' for events
+    of calendars the user can't access.
+    """
+    __slots__ = ('pk', 'title', 'start', 'end', 'all_day', 'calendar',
+        'color')
+
+    def __init__(self, event, from_calendar):
+        self.pk = event.pk
+        self.title = event.title
+        self.start = event.start
+        self.end = event.end
+        self.all_day = event.all_day
+        if from_calendar == True:
+            self.calendar = event.calendar_id
+            self.color = event.calendar.color
+        else:
+            self.calendar = 'other'
+            self.color = OTHER_COLOR
+
+
+class TimelineItem:
+    """
+    An event on one day of the timeline: the shared TimelineEvent,
+    the part of the event within the day and, unless the event lasts
+    all day, its top and height as fractions of the day and left and width
+    as fractions of the day's column, set by layout_day().
+    Fields are read like keys of a dict, e.g. item['class'],
+    which templates write as item.class.
+    """
+    __slots__ = ('event', 'day_start', 'day_end', 'top', 'height', 'left',
+        'width')
+
+    EVENT_KEYS = ('pk', 'title', 'start', 'end', 'all_day', 'class', 'color')
+    LAYOUT_KEYS = ('top', 'height', 'left', 'width')
+
+    def __init__(self, event, start, end):
+        self.event = event
+        self.day_start = start
+        self.day_end = end
+        self.top = self.height = None
+        self.left, self.width = 0.0, 1.0
+        if event.all_day != True:
+            minutes_in_day = 1440
+            end_hour = end.hour
+            # if end_hour would be 0
+            # then events that end on midnight and after it, would have no height
+            if end_hour == 0:
+                end_hour = 24
+            self.height = ((end_hour - start.hour) * 60
+                + (end.minute - start.minute)) / minutes_in_day
+            start_seconds = (start.time().hour * 60
+                + start.time().minute)
+            self.top = start_seconds / minutes_in_day
+
+    def keys(self):
+        if self.event.all_day == True:
+            return self.EVENT_KEYS
+        return self.EVENT_KEYS + self.LAYOUT_KEYS
+
+    def __getitem__(self, key):
+        if key == 'class':
+            return self.event.calendar
+        if key in self.EVENT_KEYS:
+            return getattr(self.event, key)
+        if key in self.LAYOUT_KEYS and self.event.all_day != True:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __repr__(self):
+        return '<TimelineItem {} {}>'.format(self.event.pk,
+            self.day_start.isoformat())
+
+    def as_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+def partition_intervals(intervals):
+    """
+    Gives every (start, end) interval, sorted by start, the lowest
+    column free at its start, so intervals of a column don't overlap.
+    Returns a list of (column, cluster) pairs, where clusters number
+    groups of transitively overlapping intervals; every cluster
+    has as many columns as the most intervals overlapping at once.
+    Takes O(n log n) time for n intervals.
+    """
+    columns = []
+    cluster = -1
+    cluster_end = None
+    # (end, column) of intervals of the cluster, the earliest end first
+    ends = []
+    free_columns = []
+    for start, end in intervals:
+        if cluster_end is None or start >= cluster_end:
+            cluster += 1
+            cluster_end = end
+            ends, free_columns = [], []
+        while ends and ends[0][0] <= start:
+            heapq.heappush(free_columns, heapq.heappop(ends)[1])
+        if free_columns:
+            column = heapq.heappop(free_columns)
+        else:
+            column = len(ends)
+        heapq.heappush(ends, (end, column))
+        cluster_end = max(cluster_end, end)
+        columns.append((column, cluster))
+    return columns
+
+def layout_day(items):
+    """
+    Places timed items of a day side by side where they overlap.
+    Items share the width of the day equally within their cluster
+    of partition_intervals().
+    """
+    timed = sorted((item for item in items if item.event.all_day != True),
+        key=lambda item: (item.day_start, item.day_start - item.day_end))
+    # exact times rather than fractions of the day, whose rounding
+    # would make back-to-back items overlap
+    columns = partition_intervals(
+        (item.day_start, item.day_end) for item in timed)
+    widths = {}
+    for column, cluster in columns:
+        widths[cluster] = max(widths.get(cluster, 0), column + 1)
+    for item, (column, cluster) in zip(timed, columns):
+        item.width = 1 / widths[cluster]
+        item.left = column / widths[cluster]
+
+def get_segments_of_week(week):
+    """
+    Returns bars of events of the days of a week, one for every event:
+    dicts with the event, the column of its first day in the week,
+    the number of days it spans and its lane, the row of bars
+    it is drawn in. Lanes are assigned greedily, the lowest free one
+    to bars ordered by their first days, longer bars first.
+    """
+    segments = []
+    by_event = {}
+    for column, dict_ in enumerate(week):
+        for item in dict_['events']:
+            # items of an event on all its days share one TimelineEvent
+            if item.event in by_event:
+                by_event[item.event]['span'] += 1
+            else:
+                by_event[item.event] = {'event': item.event,
+                    'column': column, 'span': 1}
+                segments.append(by_event[item.event])
+    segments.sort(key=lambda segment: (segment['column'], -segment['span']))
+    lanes = partition_intervals((segment['column'],
+        segment['column'] + segment['span']) for segment in segments)
+    for segment, (lane, cluster) in zip(segments, lanes):
+        segment['lane'] = lane
+    return segments
+
+def get_lanes_of_week(segments, length=7):
+    """
+    Returns rows of cells of the table of a week, a row for every lane
+    of segments: the segments and empty cells of days between them.
+    """
+    lanes = []
+    for segment in sorted(segments, key=lambda segment: segment['column']):
+        while len(lanes) <= segment['lane']:
+            lanes.append([])
+        lane = lanes[segment['lane']]
+        filled = sum(cell['span'] for cell in lane)
+        lane.extend({'event': None, 'span': 1}
+            for column in range(filled, segment['column']))
+        lane.append(segment)
+    for lane in lanes:
+        filled = sum(cell['span'] for cell in lane)
+        lane.extend({'event': None, 'span': 1}
+            for column in range(filled, length))
+    return lanes
+
+def get_weeks_of_month(days):
+    """
+    Splits days from get_events_from_days into weeks, each with its
+    days, segments from get_segments_of_week and lanes of cells,
+    so every event is drawn once per week as a bar across its days.
+    """
+    weeks = []
+    for i in range(0, len(days), 7):
+        week = days[i:i + 7]
+        segments = get_segments_of_week(week)
+        weeks.append({
+            'days': week,
+            'segments': segments,
+            'lanes': get_lanes_of_week(segments, len(week)),
+        })
+    return weeks
+
+def get_range_of_days(days, timezone):
+    """
+    Returns aware datetimes of the beginning of the first day
+    and the end of the last day in the given timezone.
+    """
+    start = timezone.localize(datetime.datetime.combine(days[0], datetime.time(0)))
+    end = datetime.datetime.combine(days[-1] + datetime.timedelta(days=1),
+        datetime.time(0))
+    end = timezone.localize(end)
+    return start, end
+
+def expand_occurrences(events, start, end):
+    """
+    Replaces repeating events with their occurrences
+    that overlap the [start, end) range.
+    Removed dates of all repeating events are read with a single query.
+    """
+    events = list(events)
+    recurring = [event.pk for event in events if event.is_recurring]
+    exceptions = {}
+    if recurring:
+        exceptions = EventException.get_dates_of_events(recurring)
+    occurrences = []
+    for event in events:
+        occurrences.extend(event.get_occurrences(start, end,
+            exceptions.get(event.pk, set())))
+    return occurrences
+
+def get_timeline_queryset(profile, start, end):
+    """
+    Returns a queryset of events that user can see in the [start, end) range,
+    with their calendars, needed for colors, read in the same query
+    and without long descriptions, which timeline doesn't show.
+    """
+    return profile.get_events_between(start, end).select_related(
+        'calendar').defer('desc')
+
+def get_timeline_events(profile, days, timezone):
+    """
+    Returns events and occurrences of repeating events
+    that user can see in the given days.
+    """
+    start, end = get_range_of_days(days, timezone)
+    return expand_occurrences(get_timeline_queryset(profile, start, end),
+        start, end)
 
 def get_events_from_days(days, user_events, timezone, profile):
+    """
+    Assigns events to the days they overlap as TimelineItems.
+    Days must be given in ascending order.
+    Events are sorted once by their beginning and the days are walked
+    with a sweep line, so every event is looked at only
+    when it enters and leaves the set of active events.
+    """
+    calendars_ids = profile.accessible_calendars_ids
+    user_events = sorted(user_events, key=lambda ev: (ev.start, ev.pk))
+    next_event = 0
+    # events overlapping the day with their shared timeline records
+    active = []
     final_days = []
     for day in days:
-        dict_ = {}
-        dict_['day'] = day
         start = datetime.datetime.combine(day, datetime.time(0))
         start = timezone.localize(start)
         end = start + datetime.timedelta(days=1)
+        while (next_event < len(user_events)
+                and user_events[next_event].start < end):
+            ev = user_events[next_event]
+            active.append((ev, TimelineEvent(ev,
+                ev.calendar_id in calendars_ids)))
+            next_event += 1
+        active = [(ev, record) for ev, record in active if ev.end > start]
         events = []
-        for ev in user_events:
-            calendar = ev.calendar
-            if (calendar in profile.get_calendars_to_modify()
-                or calendar in profile.get_calendars_to_read()):
-                from_calendar = True
-            else:
-                from_calendar = False
-            if ev.start < end and ev.end > start:
-                event = event_dict(ev, max(timezone.normalize(ev.start), start),
-                    min(timezone.normalize(ev.end), end), from_calendar)
-                events.append(event)
-        dict_['events'] = events
-        final_days.append(dict_)
+        for ev, record in active:
+            events.append(TimelineItem(record,
+                max(timezone.normalize(ev.start), start),
+                min(timezone.normalize(ev.end), end)))
+        layout_day(events)
+        final_days.append({'day': day, 'events': events})
     return final_days
 
+def days_to_json(days):
+    """
+    Returns days from get_events_from_days with links to days and events,
+    ready to be serialized by JsonResponse.
+    """
+    json_days = []
+    for dict_ in days:
+        events = []
+        for event in dict_['events']:
+            event = event.as_dict()
+            event['calendar'] = event['class']
+            event['url'] = reverse('my_calendar:event_view',
+                kwargs={'event_pk': event['pk']})
+            events.append(event)
+        json_days.append({
+            'day': dict_['day'],
+            'url': reverse('my_calendar:day', kwargs={'date': dict_['day']}),
+            'events': events,
+        })
+    return json_days
+
+def weeks_to_json(days):
+    """
+    Returns bars of events of weeks of the month view for days
+    from get_events_from_days, ready to be serialized by JsonResponse.
+    """
+    return [[{
+        'pk': segment['event'].pk,
+        'title': segment['event'].title,
+        'calendar': segment['event'].calendar,
+        'color': segment['event'].color,
+        'url': reverse('my_calendar:event_view',
+            kwargs={'event_pk': segment['event'].pk}),
+        'column': segment['column'],
+        'span': segment['span'],
+        'lane': segment['lane'],
+    } for segment in week['segments']] for week in get_weeks_of_month(days)]
+
+def encode_cursor(event):
+    """
+    Returns position of the event in listings ordered by (start, pk).
+    """
+    return encode_position(event.start, event.pk)
+
+def encode_position(start, pk):
+    """
+    Returns position between events ordered by (start, pk):
+    after events beginning before start or with smaller pk.
+    """
+    start = start.astimezone(pytz.utc).strftime(CURSOR_FORMAT)
+    return '{}_{}'.format(start, pk)
+
+def decode_cursor(cursor):
+    """
+    Returns start and pk encoded by encode_cursor.
+    Raises ValueError if the cursor is wrong.
+    """
+    start, pk = cursor.split('_')
+    start = pytz.utc.localize(datetime.datetime.strptime(start, CURSOR_FORMAT))
+    return start, int(pk)
+
+def get_page_of_events(events, newer=None, older=None, since=None,
+        per_page=EVENTS_PER_PAGE):
+    """
+    Returns a page of events ordered by (start, pk) and cursors
+    of the adjacent pages: events after the newer cursor or before
+    the older cursor or, without a cursor, the first events beginning
+    at since or later (the first of all events if since is None).
+    Pages are sought with conditions on (start, pk), so they are read
+    through the index of start no matter how deep they are.
+    Cursor of an adjacent page is None if there are no more events.
+    """
+    if older is not None:
+        start, pk = decode_cursor(older)
+        page = list(events.filter(Q(start__lte=start)
+            & (Q(start__lt=start) | Q(pk__lt=pk))).order_by(
+            '-start', '-pk')[:per_page + 1])
+        has_older, has_newer = len(page) > per_page, True
+        page = page[:per_page][::-1]
+    else:
+        has_older = newer is not None
+        if newer is not None:
+            start, pk = decode_cursor(newer)
+            events = events.filter(Q(start__gte=start)
+                & (Q(start__gt=start) | Q(pk__gt=pk)))
+        elif since is not None:
+            has_older = events.filter(start__lt=since).exists()
+            events = events.filter(start__gte=since)
+        page = list(events.order_by('start', 'pk')[:per_page + 1])
+        has_newer = len(page) > per_page
+        page = page[:per_page]
+    older = None
+    if has_older:
+        # with nothing since, older events are before since itself
+        older = encode_cursor(page[0]) if page else encode_position(since, 0)
+    return {
+        'events': page,
+        'older': older,
+        'newer': encode_cursor(page[-1]) if page and has_newer else None,
+    }
+
 def get_number_and_name_of_timezone(timezone_source):
     """
     Timezone source must be UserProfile or Event instance.
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import UserProfile, MyCalendar, Event, Guest
+from .models import UserProfile, MyCalendar, Event, EventException, Guest
 
 
-admin.site.register((UserProfile, MyCalendar, Event, Guest))
+admin.site.register((UserProfile, MyCalendar, Event, EventException, Guest))
@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class MyCalendarConfig(AppConfig):
     name = 'my_calendar'
+
+    def ready(self):
+        from . import conditional, search, timeline_cache, visibility
+        visibility.connect_signals()
+        timeline_cache.connect_signals()
+        conditional.connect_signals()
+        search.connect_signals()
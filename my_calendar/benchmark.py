@@ -0,0 +1,136 @@
+"""
+Benchmarks of views on generated datasets.
+
+Every view is requested with the test client; wall time is measured
+over a number of repeats, SQL queries and peak memory of Python
+allocations in one more request. Results are plain dicts,
+ready to be dumped as JSON and compared between runs.
+"""
+import datetime
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import UserProfile, MyCalendar, Event, Guest, EventVisibility
+from .dataset import Options, generate
+
+
+VIEWS = ('month', 'week', 'day', 'profile', 'event_view', 'calendar_view',
+    'search')
+# the middle of generated events
+BENCHMARK_DATE = datetime.date(2017, 6, 14)
+SEARCH_PHRASE = 'Meeting'
+
+def clear_data():
+    for model in (EventVisibility, Guest, Event, MyCalendar, UserProfile):
+        model.objects.all().delete()
+    UserProfile.user.field.related_model.objects.all().delete()
+
+def dataset_options(events, calendars, seed=0):
+    """
+    Returns options of a dataset with the given number of events spread
+    over the given number of calendars, all shared with every user,
+    so the first user sees all of them.
+    """
+    users = max(calendars, 1)
+    return Options(users=users, calendars_per_user=1,
+        readers_per_calendar=users - 1, modifiers_per_calendar=0,
+        events_per_calendar=events // users, seed=seed)
+
+def get_urls(profile):
+    """
+    Returns urls of benchmarked views for the user.
+    """
+    date = BENCHMARK_DATE.isoformat()
+    calendar = MyCalendar.objects.filter(owner=profile).first()
+    event = Event.objects.filter(calendar=calendar).order_by('pk').first()
+    return {
+        'month': reverse('my_calendar:month', kwargs={'date': date}),
+        'week': reverse('my_calendar:week', kwargs={'date': date}),
+        'day': reverse('my_calendar:day', kwargs={'date': date}),
+        'profile': reverse('my_calendar:profile',
+            kwargs={'username': profile.user.username}),
+        'event_view': reverse('my_calendar:event_view',
+            kwargs={'event_pk': event.pk}),
+        'calendar_view': reverse('my_calendar:calendar_view',
+            kwargs={'cal_pk': calendar.pk}),
+        'search': reverse('my_calendar:search') + '?phrase=' + SEARCH_PHRASE,
+    }
+
+def measure(client, url, repeats, keep_cache=False):
+    """
+    Returns statistics of requests of the url.
+    """
+    def get():
+        if not keep_cache:
+            for cache in caches.all():
+                cache.clear()
+        response = client.get(url)
+        # streaming and regular responses are read the same way
+        b''.join(response) if response.streaming else response.content
+        return response
+
+    times = []
+    for i in range(repeats):
+        started = time.perf_counter()
+        response = get()
+        times.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        response = get()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'url': url,
+        'status': response.status_code,
+        'repeats': repeats,
+        'times_ms': [round(value, 3) for value in times],
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(min(times), 3),
+        'queries': len(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+def run(sizes, calendars, views=VIEWS, repeats=5, keep_cache=False,
+        seed=0, stdout=None):
+    """
+    Benchmarks the views on a dataset of every combination of sizes
+    (numbers of events) and numbers of shared calendars.
+    Existing data of the database is removed.
+    """
+    results = []
+    for events in sizes:
+        for shared in calendars:
+            clear_data()
+            generate(dataset_options(events, shared, seed))
+            profile = UserProfile.objects.select_related('user').order_by(
+                'pk').first()
+            client = Client()
+            client.force_login(profile.user)
+            urls = get_urls(profile)
+            for view in views:
+                result = measure(client, urls[view], repeats, keep_cache)
+                result.update(view=view, events=Event.objects.count(),
+                    calendars=shared)
+                results.append(result)
+                if stdout is not None:
+                    stdout.write("{view:>14} {events:>7} events "
+                        "{calendars:>4} calendars: {median_ms:>9.2f} ms "
+                        "{queries:>4} queries {peak_memory_kb:>9.1f} kB".format(
+                            **result))
+    return {
+        'started': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'keep_cache': keep_cache,
+        'results': results,
+    }
@@ -0,0 +1,95 @@
+"""
+ETags and modification times for conditional GET of calendar pages.
+
+ETags are built from versions of timeline_cache, updated_at of calendars
+and users read from the database, so they are the same in every process
+and checking them doesn't query events. Pages of an event also depend
+on updated_at of the event, which is touched when its guests or removed
+occurrences change.
+Handlers are connected in MyCalendarConfig.ready().
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from .models import UserProfile, MyCalendar, Event, EventException, Guest
+from .timeline_cache import get_user_versions
+
+
+def get_profile(request):
+    if not request.user.is_authenticated():
+        return None
+    return UserProfile.objects.filter(user=request.user).first()
+
+def make_etag(request, profile, parts):
+    """
+    Returns ETag of a page of the user built of the given parts.
+    Pages with forms depend on the CSRF cookie, so it is included too.
+    """
+    parts = [str(profile.pk)] + [str(part) for part in parts]
+    parts += get_user_versions(profile)
+    parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+    return hashlib.md5(' '.join(parts).encode('utf-8')).hexdigest()
+
+def timeline_etag(view_type):
+    """
+    Returns ETag function for the month, week or day view.
+    """
+    def etag(request, date):
+        profile = get_profile(request)
+        if profile is None:
+            return None
+        # wrong dates are replaced with today
+        return make_etag(request, profile,
+            [view_type, date, datetime.datetime.now().date()])
+    return etag
+
+def timeline_json_etag(request):
+    profile = get_profile(request)
+    if profile is None:
+        return None
+    return make_etag(request, profile, ['json'] + sorted(request.GET.items())
+        + [datetime.datetime.now().date()])
+
+def calendar_etag(request, cal_pk):
+    """
+    The calendar page has no Last-Modified, its list of events
+    begins today, so it changes when the date of the user changes.
+    """
+    profile = get_profile(request)
+    if profile is None:
+        return None
+    updated_at = MyCalendar.objects.filter(pk=cal_pk).values_list(
+        'updated_at', flat=True).first()
+    return make_etag(request, profile, ['calendar', cal_pk, updated_at,
+        profile.get_today()])
+
+def event_last_modified(request, event_pk):
+    if not request.user.is_authenticated():
+        return None
+    return Event.objects.filter(pk=event_pk).values_list(
+        'updated_at', flat=True).first()
+
+def event_etag(request, event_pk):
+    profile = get_profile(request)
+    # errors of the submitted form are shown only once
+    if profile is None or 'form_errors' in request.session:
+        return None
+    return make_etag(request, profile, ['event', event_pk,
+        event_last_modified(request, event_pk)])
+
+
+def touch_event(sender, instance, **kwargs):
+    Event.objects.filter(pk=instance.event_id).update(
+        updated_at=timezone.now())
+
+def connect_signals():
+    # calendars and users are touched by handlers of timeline_cache
+    for signal in (post_save, post_delete):
+        signal.connect(touch_event, sender=Guest,
+            dispatch_uid='conditional_guest_changed')
+        signal.connect(touch_event, sender=EventException,
+            dispatch_uid='conditional_exception_changed')
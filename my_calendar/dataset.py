@@ -0,0 +1,207 @@
+"""
+Generator of synthetic users, calendars, events and guests,
+used to reproduce scaling problems and as data of benchmarks.
+
+Everything is created with bulk_create. Primary keys are assigned here,
+because bulk_create doesn't return them on every backend,
+and sequences are reset afterwards. The same seed on the same database
+gives the same data.
+"""
+import datetime
+import random
+import pytz
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import UserProfile, MyCalendar, Event, Guest
+from .additional_functions import COLORS
+from . import visibility
+
+
+TIMEZONES = ('Europe/Warsaw', 'Europe/London', 'America/New_York',
+    'America/Los_Angeles', 'Asia/Tokyo', 'Australia/Sydney', 'UTC')
+WORDS = ('meeting', 'lunch', 'review', 'call', 'workshop', 'trip', 'party',
+    'training', 'dentist', 'planning', 'retro', 'concert', 'football',
+    'birthday', 'deadline', 'interview', 'conference', 'demo', 'sprint')
+PASSWORD = 'password'
+
+class Options:
+    """
+    Sizes and shapes of generated data.
+    """
+
+    def __init__(self, users=10, calendars_per_user=2, readers_per_calendar=3,
+            modifiers_per_calendar=1, events_per_calendar=100,
+            guests_per_event=2, invited_events_ratio=0.3,
+            all_day_ratio=0.1, multi_day_ratio=0.05, recurring_ratio=0.05,
+            start=datetime.date(2017, 1, 1), days=365, seed=0,
+            username_prefix='user', batch_size=1000):
+        self.users = users
+        self.calendars_per_user = calendars_per_user
+        self.readers_per_calendar = readers_per_calendar
+        self.modifiers_per_calendar = modifiers_per_calendar
+        self.events_per_calendar = events_per_calendar
+        self.guests_per_event = guests_per_event
+        self.invited_events_ratio = invited_events_ratio
+        self.all_day_ratio = all_day_ratio
+        self.multi_day_ratio = multi_day_ratio
+        self.recurring_ratio = recurring_ratio
+        self.start = start
+        self.days = days
+        self.seed = seed
+        self.username_prefix = username_prefix
+        self.batch_size = batch_size
+
+def next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+def timezone_number(name):
+    return next(number for number, tz in UserProfile.TIMEZONES if tz == name)
+
+def random_timing(rng, options, tz):
+    """
+    Returns start, end and all_day of an event:
+    mostly short meetings during working hours,
+    with some all day and multi-day events.
+    """
+    day = options.start + datetime.timedelta(days=rng.randrange(options.days))
+    kind = rng.random()
+    if kind < options.all_day_ratio + options.multi_day_ratio:
+        days = 1
+        if kind >= options.all_day_ratio:
+            days = rng.randint(2, 7)
+        start = tz.localize(datetime.datetime.combine(day, datetime.time(0)))
+        # all day events end in the last minute of their last day
+        end = tz.localize(datetime.datetime.combine(
+            day + datetime.timedelta(days=days - 1), datetime.time(23, 59)))
+        return start, end, True
+    hour = min(23, max(0, int(rng.gauss(13, 3))))
+    time = datetime.time(hour, rng.choice((0, 15, 30, 45)))
+    start = tz.localize(datetime.datetime.combine(day, time))
+    # durations cluster around an hour with a long tail
+    minutes = 15 * max(1, min(32, int(rng.lognormvariate(1.4, 0.6))))
+    return start, start + datetime.timedelta(minutes=minutes), False
+
+def make_event(rng, options, pk, calendar_id, tz):
+    start, end, all_day = random_timing(rng, options, tz)
+    event = Event(pk=pk, calendar_id=calendar_id,
+        title=' '.join(rng.sample(WORDS, 2)).capitalize(),
+        desc=' '.join(rng.choice(WORDS) for i in range(rng.randint(0, 30))),
+        timezone=timezone_number(tz.zone), start=start, end=end,
+        all_day=all_day)
+    if rng.random() < options.recurring_ratio:
+        event.recurrence = rng.choice((Event.DAILY, Event.WEEKLY,
+            Event.MONTHLY))
+        event.recurrence_interval = rng.randint(1, 2)
+        if rng.random() < 0.8:
+            event.recurrence_count = rng.randint(2, 20)
+    event.series_end = event.get_series_end()
+    return event
+
+def reset_sequences(models):
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+def generate(options, stdout=None):
+    """
+    Creates data described by options.
+    Returns a dict with numbers of created objects.
+    """
+    rng = random.Random(options.seed)
+    counts = {}
+
+    def report(name, created):
+        counts[name] = counts.get(name, 0) + created
+        if stdout is not None:
+            stdout.write("Created {} {}.".format(counts[name], name))
+
+    with transaction.atomic():
+        first_user = next_pk(User)
+        password = make_password(PASSWORD)
+        users = [User(pk=first_user + i, password=password,
+            username='{}{}'.format(options.username_prefix, first_user + i),
+            first_name=rng.choice(WORDS).capitalize(),
+            last_name=rng.choice(WORDS).capitalize(),
+            email='{}{}@example.com'.format(options.username_prefix,
+                first_user + i))
+            for i in range(options.users)]
+        User.objects.bulk_create(users)
+        report('users', len(users))
+
+        first_profile = next_pk(UserProfile)
+        profiles = [UserProfile(pk=first_profile + i, user_id=user.pk,
+            timezone=timezone_number(rng.choice(TIMEZONES)))
+            for i, user in enumerate(users)]
+        UserProfile.objects.bulk_create(profiles)
+        report('profiles', len(profiles))
+        profiles_ids = [profile.pk for profile in profiles]
+
+        calendar_pk = next_pk(MyCalendar)
+        calendars = []
+        readers = []
+        modifiers = []
+        for profile in profiles:
+            others = [pk for pk in profiles_ids if pk != profile.pk]
+            for i in range(options.calendars_per_user):
+                calendar = MyCalendar(pk=calendar_pk, owner_id=profile.pk,
+                    name=rng.choice(WORDS).capitalize(),
+                    color=rng.choice(COLORS))
+                calendar_pk += 1
+                calendars.append((calendar, profile))
+                shared = rng.sample(others,
+                    min(len(others), options.readers_per_calendar))
+                editors = shared[:options.modifiers_per_calendar]
+                # owner reads and modifies own calendars, like in CalendarForm
+                for pk in [profile.pk] + shared:
+                    readers.append(MyCalendar.readers.through(
+                        mycalendar_id=calendar.pk, userprofile_id=pk))
+                for pk in [profile.pk] + editors:
+                    modifiers.append(MyCalendar.modifiers.through(
+                        mycalendar_id=calendar.pk, userprofile_id=pk))
+        MyCalendar.objects.bulk_create([calendar for calendar, _ in calendars])
+        MyCalendar.readers.through.objects.bulk_create(readers)
+        MyCalendar.modifiers.through.objects.bulk_create(modifiers)
+        report('calendars', len(calendars))
+        timezones = dict((profile.pk, pytz.timezone(
+            profile.get_timezone_display())) for profile in profiles)
+
+    # events are created in batches to keep memory bounded,
+    # Django splits each of them into statements small enough for the backend
+    event_pk = next_pk(Event)
+    events = []
+    guests = []
+
+    def flush():
+        with transaction.atomic():
+            Event.objects.bulk_create(events)
+            Guest.objects.bulk_create(guests)
+        report('events', len(events))
+        report('guests', len(guests))
+        del events[:]
+        del guests[:]
+
+    for calendar, owner in calendars:
+        tz = timezones[owner.pk]
+        for i in range(options.events_per_calendar):
+            events.append(make_event(rng, options, event_pk, calendar.pk, tz))
+            if rng.random() < options.invited_events_ratio:
+                invited = rng.sample(profiles_ids,
+                    min(len(profiles_ids), options.guests_per_event))
+                for pk in invited:
+                    guests.append(Guest(event_id=event_pk, user_id=pk,
+                        attending_status=rng.choice(
+                            Guest.ATTENDING_STATUS_CHOICES)[0]))
+            event_pk += 1
+            if len(events) >= options.batch_size:
+                flush()
+    flush()
+
+    reset_sequences([User, UserProfile, MyCalendar, Event])
+    if counts['events'] and visibility.event_visibility_index_enabled():
+        visibility.rebuild(options.batch_size)
+    return counts
@@ -2,15 +2,61 @@ import datetime
 import pytz
 
 from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
 from django.contrib.auth.models import User
 from django import forms
 
-from .models import Event, Guest, UserProfile, MyCalendar
+from .models import Event, Guest, UserProfile, MyCalendar, EventException
 
 WRONG_TIMEZONE_ERROR = "Wrong timezone was chosen."
 NO_ACCESS_TO_CALENDAR = "You have no access to this calendar."
 DUPLICATE_GUEST_ERROR = "This user is already guest added to this event."
 WRONG_ATTENDING_STATUS_ERROR = "Wrong attending status was chosen."
+NOT_UTF8_FILE_ERROR = "File must be encoded in UTF-8."
+NO_OCCURRENCE_ERROR = "The event doesn't take place on this date."
+DUPLICATE_EXCEPTION_ERROR = "This occurrence is already deleted."
+
+
+class UserAutocompleteMixin:
+    """
+    Select of users, which renders only the selected options.
+    Other users are looked up by user_autocomplete.js
+    in the user_lookup view while typing, so pages don't contain
+    every user of the system.
+    """
+
+    def __init__(self, attrs=None, *args, **kwargs):
+        attrs = dict(attrs or {})
+        attrs['class'] = 'user-autocomplete'
+        attrs['data-url'] = reverse_lazy('my_calendar:user_lookup')
+        super().__init__(attrs, *args, **kwargs)
+
+    def render_options(self, selected_choices):
+        # submitted values aren't validated yet
+        selected = set()
+        for value in selected_choices:
+            try:
+                selected.add(int(value))
+            except (TypeError, ValueError):
+                pass
+        choices = self.choices
+        queryset = []
+        if selected:
+            queryset = choices.queryset.filter(pk__in=selected).select_related(
+                'user')
+        self.choices = [choices.choice(obj) for obj in queryset]
+        try:
+            return super().render_options(selected_choices)
+        finally:
+            self.choices = choices
+
+
+class UserAutocomplete(UserAutocompleteMixin, forms.Select):
+    pass
+
+
+class UserAutocompleteMultiple(UserAutocompleteMixin, forms.SelectMultiple):
+    pass
 
 
 class RegisterForm(forms.ModelForm):
@@ -37,8 +83,8 @@ class CalendarForm(forms.ModelForm):
         model = MyCalendar
         fields = ('name', 'color', 'readers', 'modifiers')
         widgets = {
-            'readers': forms.CheckboxSelectMultiple,
-            'modifiers': forms.CheckboxSelectMultiple,
+            'readers': UserAutocompleteMultiple,
+            'modifiers': UserAutocompleteMultiple,
         }
 
     def __init__(self, owner=None, *args, **kwargs):
@@ -68,7 +114,9 @@ class EventForm(forms.ModelForm):
 
     class Meta:
         model = Event
-        fields = ('calendar', 'start', 'end', 'title', 'desc', 'all_day', 'timezone')
+        fields = ('calendar', 'start', 'end', 'title', 'desc', 'all_day',
+            'timezone', 'recurrence', 'recurrence_interval',
+            'recurrence_count', 'recurrence_until')
         error_messages = {
             'timezone': {'invalid_choice': WRONG_TIMEZONE_ERROR}
         }
@@ -85,12 +133,13 @@ class EventForm(forms.ModelForm):
         super(EventForm, self).__init__(*args, **kwargs)
         self.fields['calendar'].queryset = user.get_calendars_to_modify()
         self.fields['calendar'].empty_label = 'Select calendar'
+        self.fields['recurrence'].choices = Event.RECURRENCE_CHOICES
 
     def is_valid(self, user):
         valid = super(EventForm, self).is_valid()
 
         if ('calendar' in self.cleaned_data and
-                user not in self.cleaned_data['calendar'].modifiers.all()):
+                not user.can_modify_calendar(self.cleaned_data['calendar'])):
             self.add_error('calendar', NO_ACCESS_TO_CALENDAR)
             valid = False
         return valid
@@ -123,6 +172,9 @@ class GuestForm(forms.ModelForm):
     class Meta:
         model = Guest
         fields = ('user',)
+        widgets = {
+            'user': UserAutocomplete,
+        }
 
     def __init__(self, event, *args, **kwargs):
         super(GuestForm, self).__init__(*args, **kwargs)
@@ -133,3 +185,33 @@ class GuestForm(forms.ModelForm):
             self.instance.validate_unique()
         except ValidationError as e:
             self.add_error('user', DUPLICATE_GUEST_ERROR)
+
+
+class EventExceptionForm(forms.ModelForm):
+    """
+    Deletes a single occurrence of a repeating event.
+    """
+
+    class Meta:
+        model = EventException
+        fields = ('date',)
+
+    def __init__(self, event, *args, **kwargs):
+        super(EventExceptionForm, self).__init__(*args, **kwargs)
+        self.instance.event = event
+
+    def clean_date(self):
+        date_ = self.cleaned_data['date']
+        if not self.instance.event.occurs_on(date_):
+            raise ValidationError(NO_OCCURRENCE_ERROR)
+        return date_
+
+    def validate_unique(self):
+        try:
+            self.instance.validate_unique()
+        except ValidationError:
+            self.add_error('date', DUPLICATE_EXCEPTION_ERROR)
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(label="iCalendar file")
@@ -0,0 +1,468 @@
+"""
+Export and import of events in the iCalendar format (RFC 5545).
+
+Events are read in batches of primary keys and written line by line,
+so exporting a big calendar needs constant memory.
+Times are written in the event's timezone with its Olson name as TZID,
+defined by a VTIMEZONE with the zone's transitions from pytz.
+
+Imported files are parsed line by line and events are validated like
+in forms, then created with bulk_create in batches. The whole file
+is imported in one transaction, so a file which can't be read
+to the end leaves nothing behind.
+"""
+import bisect
+import datetime
+import re
+import pytz
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Max, Min
+
+from .models import Event, EventException
+from .timeline_cache import touch_calendars
+from . import visibility
+
+
+PRODID = '-//django_calendar//my_calendar//EN'
+EXPORT_BATCH_SIZE = 500
+# fields needed to write an event
+EXPORT_FIELDS = ('pk', 'title', 'desc', 'timezone', 'start', 'end', 'all_day',
+    'recurrence', 'recurrence_interval', 'recurrence_count',
+    'recurrence_until', 'updated_at')
+FREQUENCIES = {
+    Event.DAILY: 'DAILY',
+    Event.WEEKLY: 'WEEKLY',
+    Event.MONTHLY: 'MONTHLY',
+}
+
+def escape_text(value):
+    return (value.replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+def fold(line):
+    """
+    Returns content line split into lines of at most 75 octets,
+    ended with CRLF.
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # don't split multi-octet characters
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        # continuation lines start with a space
+        limit = 74
+    return '\r\n '.join(parts) + '\r\n'
+
+def format_utc(value):
+    return value.astimezone(pytz.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def format_date(value):
+    return value.strftime('%Y%m%d')
+
+def format_time(name, value, tz, all_day):
+    """
+    Returns a DATE-TIME (or DATE for all day events) property
+    in the given timezone.
+    """
+    local = value.astimezone(tz)
+    if all_day:
+        return '{};VALUE=DATE:{}'.format(name, format_date(local))
+    if tz.zone == 'UTC':
+        return '{}:{}'.format(name, format_utc(value))
+    return '{};TZID={}:{}'.format(name, tz.zone,
+        local.strftime('%Y%m%dT%H%M%S'))
+
+def format_offset(offset):
+    seconds = int(offset.total_seconds())
+    sign = '-' if seconds < 0 else '+'
+    hours, rest = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    if seconds:
+        return '{}{:02}{:02}{:02}'.format(sign, hours, minutes, seconds)
+    return '{}{:02}{:02}'.format(sign, hours, minutes)
+
+def observance_lines(kind, start, offset_from, offset_to, name):
+    yield 'BEGIN:{}'.format(kind)
+    yield 'DTSTART:{}'.format(start.strftime('%Y%m%dT%H%M%S'))
+    yield 'TZOFFSETFROM:{}'.format(format_offset(offset_from))
+    yield 'TZOFFSETTO:{}'.format(format_offset(offset_to))
+    yield 'TZNAME:{}'.format(name)
+    yield 'END:{}'.format(kind)
+
+def timezone_lines(tz, since):
+    """
+    Yields unfolded content lines of a VTIMEZONE defining tz
+    from the UTC datetime since, with every transition of pytz
+    after it. Transitions are known until 2037, enough for
+    repeating events, which clients expand in the following years
+    with the last offsets.
+    """
+    yield 'BEGIN:VTIMEZONE'
+    yield 'TZID:{}'.format(tz.zone)
+    times = getattr(tz, '_utc_transition_times', None)
+    if not times:
+        # zones with a single offset
+        offset = tz.utcoffset(datetime.datetime(2000, 1, 1))
+        yield from observance_lines('STANDARD', datetime.datetime(1970, 1, 1),
+            offset, offset, tz.tzname(datetime.datetime(2000, 1, 1)))
+    else:
+        since = since.astimezone(pytz.utc).replace(tzinfo=None)
+        # the transition in force at since and all later ones
+        first = max(0, bisect.bisect_right(times, since) - 1)
+        previous = tz._transition_info[max(0, first - 1)][0]
+        for index in range(first, len(times)):
+            offset, dst, name = tz._transition_info[index]
+            # the first transition of pytz is at datetime.min
+            start = max(times[index], datetime.datetime(1601, 1, 1))
+            yield from observance_lines('DAYLIGHT' if dst else 'STANDARD',
+                start + previous, previous, offset, name)
+            previous = offset
+    yield 'END:VTIMEZONE'
+
+def get_timezones(events):
+    """
+    Returns pytz timezones used by TZID of the events with the beginning
+    of the earliest event in each of them. All day events and events
+    in UTC don't use TZID.
+    """
+    timezones = []
+    rows = events.filter(all_day=False).order_by().values(
+        'timezone').annotate(first=Min('start'))
+    names = dict(Event.TIMEZONES)
+    for row in sorted(rows, key=lambda row: names[row['timezone']]):
+        tz = pytz.timezone(names[row['timezone']])
+        if tz.zone != 'UTC':
+            timezones.append((tz, row['first']))
+    return timezones
+
+def event_lines(event, excluded_dates=()):
+    """
+    Yields unfolded content lines of a VEVENT.
+    """
+    tz = pytz.timezone(event.get_timezone_display())
+    end = event.end
+    if event.all_day:
+        # DTEND of all day events is exclusive
+        end = event.end.astimezone(tz) + datetime.timedelta(days=1)
+    yield 'BEGIN:VEVENT'
+    yield 'UID:event-{}@my_calendar'.format(event.pk)
+    yield 'DTSTAMP:{}'.format(format_utc(event.updated_at))
+    yield 'LAST-MODIFIED:{}'.format(format_utc(event.updated_at))
+    yield format_time('DTSTART', event.start, tz, event.all_day)
+    yield format_time('DTEND', end, tz, event.all_day)
+    yield 'SUMMARY:{}'.format(escape_text(event.title))
+    if event.desc:
+        yield 'DESCRIPTION:{}'.format(escape_text(event.desc))
+    if event.is_recurring:
+        rule = 'FREQ={};INTERVAL={}'.format(
+            FREQUENCIES[event.recurrence], event.recurrence_interval)
+        if event.recurrence_count is not None:
+            rule += ';COUNT={}'.format(event.recurrence_count)
+        if event.recurrence_until is not None:
+            if event.all_day:
+                until = format_date(event.recurrence_until)
+            else:
+                # the whole last day is included, UNTIL must be in UTC
+                until = format_utc(tz.localize(datetime.datetime.combine(
+                    event.recurrence_until, datetime.time(23, 59, 59))))
+            rule += ';UNTIL={}'.format(until)
+        yield 'RRULE:{}'.format(rule)
+        local_time = event.start.astimezone(tz).time()
+        for date in sorted(excluded_dates):
+            excluded = tz.localize(datetime.datetime.combine(date, local_time))
+            yield format_time('EXDATE', excluded, tz, event.all_day)
+    yield 'END:VEVENT'
+
+def iterate_events(events, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields events of the queryset with dates of their removed occurrences,
+    reading batch_size events at a time.
+    """
+    events = events.only(*EXPORT_FIELDS).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(events.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        exceptions = EventException.get_dates_of_events(
+            [event.pk for event in batch if event.is_recurring])
+        for event in batch:
+            yield event, exceptions.get(event.pk, set())
+        last_pk = batch[-1].pk
+
+def export_events(events, name=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Lazily yields folded lines of a VCALENDAR with the given events.
+    """
+    yield fold('BEGIN:VCALENDAR')
+    yield fold('VERSION:2.0')
+    yield fold('PRODID:{}'.format(PRODID))
+    yield fold('CALSCALE:GREGORIAN')
+    if name:
+        yield fold('X-WR-CALNAME:{}'.format(escape_text(name)))
+    # every TZID must be defined in the file
+    for tz, since in get_timezones(events):
+        yield ''.join(fold(line) for line in timezone_lines(tz, since))
+    for event, excluded_dates in iterate_events(events, batch_size):
+        # one chunk per event keeps the response stream small
+        yield ''.join(fold(line) for line in event_lines(event, excluded_dates))
+    yield fold('END:VCALENDAR')
+
+
+IMPORT_BATCH_SIZE = 500
+UNKNOWN_TIMEZONE_ERROR = "Unknown timezone {}."
+WRONG_VALUE_ERROR = "Wrong value of {}."
+MISSING_START_ERROR = "Event has no DTSTART."
+UNSUPPORTED_RECURRENCE_ERROR = "Recurrence rule {} is not supported."
+TIMEZONES_NUMBERS = dict((name, number) for number, name in Event.TIMEZONES)
+RECURRENCES = dict((name, number) for number, name in FREQUENCIES.items())
+DURATION_RE = re.compile(
+    r'^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?'
+    r'(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$')
+
+def unescape_text(value):
+    return re.sub(r'\\([\\;,nN])',
+        lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+def unfold(lines):
+    """
+    Yields numbers and content of unfolded lines.
+    Lines may be bytes, e.g. of an uploaded file, or strings.
+    """
+    current = None
+    current_number = 0
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current_number, current
+        current = line
+        current_number = number
+    if current:
+        yield current_number, current
+
+def parse_line(line):
+    """
+    Returns name, parameters and value of a content line.
+    """
+    name_and_params, _, value = line.partition(':')
+    # quoted parameter values may contain colons
+    while name_and_params.count('"') % 2 and value:
+        rest, _, value = value.partition(':')
+        name_and_params += ':' + rest
+    name, *params = name_and_params.split(';')
+    params = dict(param.partition('=')[::2] for param in params)
+    params = dict((key.upper(), param_value.strip('"'))
+        for key, param_value in params.items())
+    return name.upper(), params, value
+
+def parse_components(lines, component='VEVENT'):
+    """
+    Lazily yields line numbers and properties of top level components
+    of the given type. Properties are a dict mapping names
+    to lists of (parameters, value) pairs, nested components are skipped.
+    """
+    properties = None
+    depth = 0
+    for number, line in unfold(lines):
+        name, params, value = parse_line(line)
+        if name == 'BEGIN':
+            if properties is not None:
+                depth += 1
+            elif value.upper() == component:
+                properties = {}
+                start_number = number
+        elif name == 'END' and properties is not None:
+            if depth:
+                depth -= 1
+            else:
+                yield start_number, properties
+                properties = None
+        elif properties is not None and not depth:
+            properties.setdefault(name, []).append((params, value))
+
+def parse_time(params, value, default_timezone):
+    """
+    Returns aware datetime (or date, for DATE values) and timezone
+    of a DATE-TIME or DATE property.
+    """
+    tz = default_timezone
+    if 'TZID' in params:
+        if params['TZID'] not in TIMEZONES_NUMBERS:
+            raise ValidationError(UNKNOWN_TIMEZONE_ERROR.format(params['TZID']))
+        tz = pytz.timezone(params['TZID'])
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        return datetime.datetime.strptime(value, '%Y%m%d').date(), tz
+    if value.endswith('Z'):
+        value = datetime.datetime.strptime(value, '%Y%m%dT%H%M%SZ')
+        return pytz.utc.localize(value), (tz if 'TZID' in params else pytz.utc)
+    return tz.localize(datetime.datetime.strptime(value, '%Y%m%dT%H%M%S')), tz
+
+def local_midnight(value, tz):
+    """
+    Returns the beginning of the day of the date (or datetime) in timezone.
+    """
+    if isinstance(value, datetime.datetime):
+        value = value.astimezone(tz).date()
+    return tz.localize(datetime.datetime.combine(value, datetime.time(0)))
+
+def parse_duration(value):
+    match = DURATION_RE.match(value)
+    if not match or value in ('P', 'PT'):
+        raise ValueError(value)
+    parts = dict((key, int(number)) for key, number in match.groupdict().items()
+        if key != 'sign' and number)
+    duration = datetime.timedelta(**parts)
+    return -duration if match.group('sign') == '-' else duration
+
+def parse_rule(value, event, tz):
+    parts = dict(part.partition('=')[::2] for part in value.upper().split(';'))
+    if (parts.get('FREQ') not in RECURRENCES
+            or set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'WKST'}):
+        raise ValidationError(UNSUPPORTED_RECURRENCE_ERROR.format(value))
+    event.recurrence = RECURRENCES[parts['FREQ']]
+    event.recurrence_interval = int(parts.get('INTERVAL', 1))
+    if 'COUNT' in parts:
+        event.recurrence_count = int(parts['COUNT'])
+    if 'UNTIL' in parts:
+        until, _ = parse_time({}, parts['UNTIL'], tz)
+        if isinstance(until, datetime.datetime):
+            until = until.astimezone(tz).date()
+        event.recurrence_until = until
+
+def first_value(properties, name):
+    values = properties.get(name)
+    return values[0] if values else None
+
+def event_from_properties(properties, calendar, default_timezone=pytz.utc):
+    """
+    Returns a validated unsaved event and dates of its removed occurrences.
+    Raises ValidationError with messages for the user.
+    """
+    property_name = 'DTSTART'
+    try:
+        if 'DTSTART' not in properties:
+            raise ValidationError(MISSING_START_ERROR)
+        start, tz = parse_time(*first_value(properties, 'DTSTART'),
+            default_timezone=default_timezone)
+        all_day = not isinstance(start, datetime.datetime)
+        if all_day:
+            start = local_midnight(start, tz)
+        event = Event(calendar=calendar, start=start, end=start,
+            all_day=all_day, timezone=TIMEZONES_NUMBERS.get(tz.zone,
+                Event.UTC_index))
+        if 'DTEND' in properties:
+            property_name = 'DTEND'
+            end, _ = parse_time(*first_value(properties, 'DTEND'),
+                default_timezone=tz)
+            if all_day:
+                end = local_midnight(end, tz)
+            elif not isinstance(end, datetime.datetime):
+                raise ValueError(end)
+            event.end = end
+        elif 'DURATION' in properties:
+            property_name = 'DURATION'
+            duration = parse_duration(first_value(properties, 'DURATION')[1])
+            event.end = start + duration
+        if all_day:
+            # DTEND of all day events is exclusive, they last at least a day;
+            # the last minute is stored, so they overlap only their own days
+            next_day = local_midnight(start + datetime.timedelta(days=1), tz)
+            event.end = (max(event.end, next_day)
+                - datetime.timedelta(minutes=1))
+        event.title = unescape_text(
+            (first_value(properties, 'SUMMARY') or ({}, ''))[1])
+        event.desc = unescape_text(
+            (first_value(properties, 'DESCRIPTION') or ({}, ''))[1])
+        excluded_dates = set()
+        if 'RRULE' in properties:
+            property_name = 'RRULE'
+            parse_rule(first_value(properties, 'RRULE')[1], event, tz)
+            property_name = 'EXDATE'
+            for params, values in properties.get('EXDATE', []):
+                for value in values.split(','):
+                    date, _ = parse_time(params, value, tz)
+                    if isinstance(date, datetime.datetime):
+                        date = date.astimezone(tz).date()
+                    excluded_dates.add(date)
+    except ValueError:
+        raise ValidationError(WRONG_VALUE_ERROR.format(property_name))
+    # calendar is checked once for the whole import
+    event.full_clean(exclude=['calendar'])
+    event.series_end = event.get_series_end()
+    return event, excluded_dates
+
+class ImportResult:
+    """
+    Numbers of created events and errors of skipped ones.
+    Errors are (line number, summary, messages) tuples.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+def save_batch(events):
+    """
+    Creates events of the batch with their removed occurrences.
+    Django splits rows into statements small enough for the backend.
+    """
+    single = [event for event, excluded_dates in events if not excluded_dates]
+    Event.objects.bulk_create(single)
+    exceptions = []
+    # primary keys of bulk created rows aren't known on every backend
+    for event, excluded_dates in events:
+        if excluded_dates:
+            event.save()
+            exceptions.extend(EventException(event=event, date=date)
+                for date in excluded_dates)
+    EventException.objects.bulk_create(exceptions)
+
+def import_events(lines, calendar, batch_size=IMPORT_BATCH_SIZE,
+        default_timezone=pytz.utc):
+    """
+    Imports VEVENTs of iCalendar lines into the calendar.
+    Events with errors are skipped and reported, the rest is saved
+    batch_size events at a time, all in one transaction.
+    Errors of reading lines, e.g. UnicodeDecodeError, are raised
+    and nothing is imported.
+    Returns ImportResult.
+    """
+    result = ImportResult()
+    batch = []
+    with transaction.atomic():
+        # visibility rows are added only for events created by the import
+        last_pk = Event.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        for number, properties in parse_components(lines):
+            try:
+                batch.append(event_from_properties(properties, calendar,
+                    default_timezone))
+            except ValidationError as error:
+                summary = unescape_text(
+                    (first_value(properties, 'SUMMARY') or ({}, ''))[1])
+                result.errors.append((number, summary, error.messages))
+            if len(batch) >= batch_size:
+                save_batch(batch)
+                last_pk = visibility.add_events_after(calendar, last_pk)
+                result.created += len(batch)
+                batch = []
+        if batch:
+            save_batch(batch)
+            visibility.add_events_after(calendar, last_pk)
+            result.created += len(batch)
+        if result.created:
+            touch_calendars([calendar.pk])
+    return result
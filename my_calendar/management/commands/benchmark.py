@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from my_calendar import benchmark
+
+
+def numbers(value):
+    return [int(number) for number in value.split(',')]
+
+
+class Command(BaseCommand):
+    help = ("Measures time, SQL queries and memory of views on generated "
+        "data in a test database and writes the results as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=numbers, default=[1000, 10000],
+            help="Comma separated numbers of events, e.g. 1000,10000,100000.")
+        parser.add_argument('--calendars', type=numbers, default=[1, 10],
+            help="Comma separated numbers of calendars shared with the user.")
+        parser.add_argument('--views', default=','.join(benchmark.VIEWS),
+            help="Comma separated names of views.")
+        parser.add_argument('--repeats', type=int, default=5)
+        parser.add_argument('--keep-cache', action='store_true',
+            help="Don't clear caches before requests.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None,
+            help="Path of the JSON file, by default results are printed.")
+
+    def handle(self, *args, **options):
+        views = options['views'].split(',')
+        unknown = set(views) - set(benchmark.VIEWS)
+        if unknown:
+            raise CommandError("Unknown views: {}.".format(
+                ', '.join(sorted(unknown))))
+        setup_test_environment()
+        # never touch real data, e.g. in-memory database for SQLite
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            results = benchmark.run(options['events'], options['calendars'],
+                views=views, repeats=options['repeats'],
+                keep_cache=options['keep_cache'], seed=options['seed'],
+                stdout=self.stdout if options['verbosity'] > 0 else None)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file_:
+                file_.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,73 @@
+import datetime
+import time
+import pytz
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from my_calendar.models import UserProfile
+from my_calendar.additional_functions import (fill_month, fill_week,
+    get_range_of_days, get_timeline_queryset)
+
+
+class Command(BaseCommand):
+    """
+    Prints the query plan and the average execution time
+    of the query used by timeline views.
+    To compare the plans with and without timeline indexes, run it
+    on a copy of the database before and after dropping the indexes
+    of events created by migrations 0020 and 0027 (their names are
+    printed by `sqlmigrate my_calendar 0027`) with DROP INDEX.
+    Migrating back instead would drop columns the query filters on.
+    """
+    help = "Explains the range query of month/week/day views for given user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--view', choices=('month', 'week', 'day'),
+            default='month')
+        parser.add_argument('--date', help="Date in YYYY-MM-DD format.")
+        parser.add_argument('--repeat', type=int, default=20,
+            help="How many times the query is executed to measure time.")
+        parser.add_argument('--analyze', action='store_true',
+            help="Use EXPLAIN ANALYZE on PostgreSQL.")
+
+    def handle(self, *args, **options):
+        try:
+            profile = UserProfile.objects.get(
+                user__username=options['username'])
+        except UserProfile.DoesNotExist:
+            raise CommandError("User %s does not exist." % options['username'])
+        if options['date']:
+            date_ = datetime.datetime.strptime(options['date'], "%Y-%m-%d").date()
+        else:
+            date_ = datetime.date.today()
+        days = {
+            'month': fill_month,
+            'week': fill_week,
+            'day': lambda x: [x],
+        }[options['view']](date_)
+        timezone = pytz.timezone(profile.get_timezone_display())
+        queryset = get_timeline_queryset(profile,
+            *get_range_of_days(days, timezone))
+        sql, params = queryset.query.sql_with_params()
+
+        if connection.vendor == 'sqlite':
+            explain = 'EXPLAIN QUERY PLAN '
+        elif connection.vendor == 'postgresql':
+            explain = 'EXPLAIN ANALYZE ' if options['analyze'] else 'EXPLAIN '
+        else:
+            explain = 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(explain + sql, params)
+            for row in cursor.fetchall():
+                self.stdout.write(' '.join(str(column) for column in row))
+
+            times = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                cursor.execute(sql, params)
+                rows = len(cursor.fetchall())
+                times.append(time.perf_counter() - start)
+        self.stdout.write("{} rows, average {:.3f} ms, best {:.3f} ms".format(
+            rows, sum(times) / len(times) * 1000, min(times) * 1000))
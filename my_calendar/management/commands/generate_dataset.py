@@ -0,0 +1,70 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from my_calendar.dataset import Options, generate
+
+
+class Command(BaseCommand):
+    help = ("Generates users, shared calendars, events and guests "
+        "with deterministic random data.")
+
+    def add_arguments(self, parser):
+        defaults = Options()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--calendars-per-user', type=int,
+            default=defaults.calendars_per_user)
+        parser.add_argument('--readers-per-calendar', type=int,
+            default=defaults.readers_per_calendar,
+            help="Number of other users that can read each calendar.")
+        parser.add_argument('--modifiers-per-calendar', type=int,
+            default=defaults.modifiers_per_calendar,
+            help="Number of readers that can also modify each calendar.")
+        parser.add_argument('--events-per-calendar', type=int,
+            default=defaults.events_per_calendar)
+        parser.add_argument('--guests-per-event', type=int,
+            default=defaults.guests_per_event)
+        parser.add_argument('--invited-events-ratio', type=float,
+            default=defaults.invited_events_ratio,
+            help="Part of events that have guests.")
+        parser.add_argument('--all-day-ratio', type=float,
+            default=defaults.all_day_ratio)
+        parser.add_argument('--multi-day-ratio', type=float,
+            default=defaults.multi_day_ratio)
+        parser.add_argument('--recurring-ratio', type=float,
+            default=defaults.recurring_ratio)
+        parser.add_argument('--start', default=defaults.start.isoformat(),
+            help="First day of events, YYYY-MM-DD.")
+        parser.add_argument('--days', type=int, default=defaults.days,
+            help="Number of days events are spread over.")
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--username-prefix',
+            default=defaults.username_prefix)
+        parser.add_argument('--batch-size', type=int,
+            default=defaults.batch_size)
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.datetime.strptime(options['start'],
+                "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError("Wrong start date {}.".format(options['start']))
+        counts = generate(Options(
+            users=options['users'],
+            calendars_per_user=options['calendars_per_user'],
+            readers_per_calendar=options['readers_per_calendar'],
+            modifiers_per_calendar=options['modifiers_per_calendar'],
+            events_per_calendar=options['events_per_calendar'],
+            guests_per_event=options['guests_per_event'],
+            invited_events_ratio=options['invited_events_ratio'],
+            all_day_ratio=options['all_day_ratio'],
+            multi_day_ratio=options['multi_day_ratio'],
+            recurring_ratio=options['recurring_ratio'],
+            start=start,
+            days=options['days'],
+            seed=options['seed'],
+            username_prefix=options['username_prefix'],
+            batch_size=options['batch_size'],
+        ), stdout=self.stdout if options['verbosity'] > 1 else None)
+        self.stdout.write(", ".join("{} {}".format(number, name)
+            for name, number in sorted(counts.items())) + " created.")
@@ -0,0 +1,44 @@
+import pytz
+
+from django.core.management.base import BaseCommand, CommandError
+
+from my_calendar.models import MyCalendar
+from my_calendar.ics import import_events, IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Imports events of an iCalendar file into a calendar."
+
+    def add_arguments(self, parser):
+        parser.add_argument('calendar', type=int,
+            help="Primary key of the calendar.")
+        parser.add_argument('path', help="Path of the .ics file.")
+        parser.add_argument('--batch-size', type=int,
+            default=IMPORT_BATCH_SIZE,
+            help="Number of events parsed and saved at a time; "
+                "Django splits each batch into statements for the database.")
+        parser.add_argument('--timezone', default=None,
+            help="Timezone of times without one, "
+                "by default timezone of the calendar's owner.")
+
+    def handle(self, *args, **options):
+        try:
+            calendar = MyCalendar.objects.select_related('owner').get(
+                pk=options['calendar'])
+        except MyCalendar.DoesNotExist:
+            raise CommandError("Calendar {} doesn't exist.".format(
+                options['calendar']))
+        try:
+            timezone = pytz.timezone(options['timezone']
+                or calendar.owner.get_timezone_display())
+        except pytz.UnknownTimeZoneError:
+            raise CommandError("Unknown timezone {}.".format(
+                options['timezone']))
+        with open(options['path'], encoding='utf-8') as file_:
+            result = import_events(file_, calendar,
+                batch_size=options['batch_size'], default_timezone=timezone)
+        for line, summary, messages in result.errors:
+            self.stderr.write("Line {} ({}): {}".format(
+                line, summary, ' '.join(messages)))
+        self.stdout.write("Imported {} events, skipped {}.".format(
+            result.created, len(result.errors)))
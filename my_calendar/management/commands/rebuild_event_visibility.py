@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from my_calendar import visibility
+
+
+class Command(BaseCommand):
+    help = "Recreates the denormalized event visibility table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+            help="Number of events indexed in a single transaction.")
+
+    def handle(self, *args, **options):
+        created = visibility.rebuild(options['batch_size'],
+            stdout=self.stdout if options['verbosity'] > 1 else None)
+        self.stdout.write("Created {} visibility rows.".format(created))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from my_calendar import search
+
+
+class Command(BaseCommand):
+    help = ("Recreates missing full-text search tables, triggers and indexes "
+        "and fills the tables again.")
+
+    def handle(self, *args, **options):
+        with connection.schema_editor() as schema_editor:
+            search.install(schema_editor)
+        self.stdout.write("Search index rebuilt.")
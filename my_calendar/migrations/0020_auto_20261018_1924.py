@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 19:24
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_calendar', '0019_auto_20180610_1603'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('calendar', 'end'), ('calendar', 'start')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='guest',
+            index_together=set([('user', 'event')]),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 19:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_calendar', '0020_auto_20261018_1924'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventVisibility',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('via', models.IntegerField(choices=[(1, 'Reader'), (2, 'Modifier'), (3, 'Guest')])),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='my_calendar.MyCalendar')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='eventvisibility',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='my_calendar.Event'),
+        ),
+        migrations.AddField(
+            model_name='eventvisibility',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='my_calendar.UserProfile'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventvisibility',
+            unique_together=set([('user', 'event', 'via')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='eventvisibility',
+            index_together=set([('user', 'start'), ('user', 'end')]),
+        ),
+    ]
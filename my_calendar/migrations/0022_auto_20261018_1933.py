@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 19:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_calendar', '0021_auto_20261018_1930'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventException',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='recurrence',
+            field=models.IntegerField(blank=True, choices=[(0, 'Does not repeat'), (1, 'Daily'), (2, 'Weekly'), (3, 'Monthly')], default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='recurrence_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='recurrence_interval',
+            field=models.PositiveIntegerField(blank=True, default=1),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='recurrence_until',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='series_end',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventexception',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='my_calendar.Event'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventexception',
+            unique_together=set([('event', 'date')]),
+        ),
+    ]
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# full-text tables and triggers of SQLite and indexes of PostgreSQL
+# as they were created by this migration,
+# later versions are installed by my_calendar.search.install()
+SQLITE_STATEMENTS = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS my_calendar_event_search '
+        'USING fts5("title", "desc", content=\'my_calendar_event\', '
+        "content_rowid='id', tokenize='unicode61 remove_diacritics "
+        "1')",
+    'CREATE TRIGGER IF NOT EXISTS my_calendar_event_search_insert'
+        ' AFTER INSERT ON my_calendar_event BEGIN INSERT INTO '
+        'my_calendar_event_search(rowid, "title", "desc") VALUES '
+        '(new.id, new."title", new."desc"); END',
+    'CREATE TRIGGER IF NOT EXISTS my_calendar_event_search_delete'
+        ' AFTER DELETE ON my_calendar_event BEGIN INSERT INTO '
+        'my_calendar_event_search(my_calendar_event_search, rowid, '
+        '"title", "desc") VALUES (\'delete\', old.id, old."title", '
+        'old."desc"); END',
+    'CREATE TRIGGER IF NOT EXISTS my_calendar_event_search_update'
+        ' AFTER UPDATE ON my_calendar_event BEGIN INSERT INTO '
+        'my_calendar_event_search(my_calendar_event_search, rowid, '
+        '"title", "desc") VALUES (\'delete\', old.id, old."title", '
+        'old."desc"); INSERT INTO my_calendar_event_search(rowid, '
+        '"title", "desc") VALUES (new.id, new."title", new."desc"); '
+        'END',
+    'INSERT INTO '
+        'my_calendar_event_search(my_calendar_event_search) VALUES '
+        "('rebuild')",
+    'CREATE VIRTUAL TABLE IF NOT EXISTS '
+        'my_calendar_mycalendar_search USING fts5("name", '
+        "content='my_calendar_mycalendar', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 1')",
+    'CREATE TRIGGER IF NOT EXISTS '
+        'my_calendar_mycalendar_search_insert AFTER INSERT ON '
+        'my_calendar_mycalendar BEGIN INSERT INTO '
+        'my_calendar_mycalendar_search(rowid, "name") VALUES (new.id,'
+        ' new."name"); END',
+    'CREATE TRIGGER IF NOT EXISTS '
+        'my_calendar_mycalendar_search_delete AFTER DELETE ON '
+        'my_calendar_mycalendar BEGIN INSERT INTO '
+        'my_calendar_mycalendar_search(my_calendar_mycalendar_search,'
+        ' rowid, "name") VALUES (\'delete\', old.id, old."name"); END',
+    'CREATE TRIGGER IF NOT EXISTS '
+        'my_calendar_mycalendar_search_update AFTER UPDATE ON '
+        'my_calendar_mycalendar BEGIN INSERT INTO '
+        'my_calendar_mycalendar_search(my_calendar_mycalendar_search,'
+        ' rowid, "name") VALUES (\'delete\', old.id, old."name"); '
+        'INSERT INTO my_calendar_mycalendar_search(rowid, "name") '
+        'VALUES (new.id, new."name"); END',
+    'INSERT INTO '
+        'my_calendar_mycalendar_search(my_calendar_mycalendar_search)'
+        " VALUES ('rebuild')",
+    'CREATE VIRTUAL TABLE IF NOT EXISTS my_calendar_user_search '
+        'USING fts5("username", "first_name", "last_name", '
+        "content='auth_user', content_rowid='id', tokenize='unicode61"
+        " remove_diacritics 1')",
+    'CREATE TRIGGER IF NOT EXISTS my_calendar_user_search_insert '
+        'AFTER INSERT ON auth_user BEGIN INSERT INTO '
+        'my_calendar_user_search(rowid, "username", "first_name", '
+        '"last_name") VALUES (new.id, new."username", '
+        'new."first_name", new."last_name"); END',
+    'CREATE TRIGGER IF NOT EXISTS my_calendar_user_search_delete '
+        'AFTER DELETE ON auth_user BEGIN INSERT INTO '
+        'my_calendar_user_search(my_calendar_user_search, rowid, '
+        '"username", "first_name", "last_name") VALUES (\'delete\', '
+        'old.id, old."username", old."first_name", old."last_name"); '
+        'END',
+    'CREATE TRIGGER IF NOT EXISTS my_calendar_user_search_update '
+        'AFTER UPDATE ON auth_user BEGIN INSERT INTO '
+        'my_calendar_user_search(my_calendar_user_search, rowid, '
+        '"username", "first_name", "last_name") VALUES (\'delete\', '
+        'old.id, old."username", old."first_name", old."last_name"); '
+        'INSERT INTO my_calendar_user_search(rowid, "username", '
+        '"first_name", "last_name") VALUES (new.id, new."username", '
+        'new."first_name", new."last_name"); END',
+    'INSERT INTO my_calendar_user_search(my_calendar_user_search)'
+        " VALUES ('rebuild')",
+]
+
+SQLITE_DROP_STATEMENTS = [
+    'DROP TRIGGER IF EXISTS my_calendar_event_search_insert',
+    'DROP TRIGGER IF EXISTS my_calendar_event_search_delete',
+    'DROP TRIGGER IF EXISTS my_calendar_event_search_update',
+    'DROP TABLE IF EXISTS my_calendar_event_search',
+    'DROP TRIGGER IF EXISTS my_calendar_mycalendar_search_insert',
+    'DROP TRIGGER IF EXISTS my_calendar_mycalendar_search_delete',
+    'DROP TRIGGER IF EXISTS my_calendar_mycalendar_search_update',
+    'DROP TABLE IF EXISTS my_calendar_mycalendar_search',
+    'DROP TRIGGER IF EXISTS my_calendar_user_search_insert',
+    'DROP TRIGGER IF EXISTS my_calendar_user_search_delete',
+    'DROP TRIGGER IF EXISTS my_calendar_user_search_update',
+    'DROP TABLE IF EXISTS my_calendar_user_search',
+]
+
+POSTGRESQL_STATEMENTS = [
+    'CREATE INDEX IF NOT EXISTS my_calendar_event_search ON '
+        'my_calendar_event USING gin '
+        '(to_tsvector(\'simple\'::regconfig, COALESCE("title", \'\') || \''
+        ' \' || COALESCE("desc", \'\')))',
+    'CREATE INDEX IF NOT EXISTS my_calendar_mycalendar_search ON '
+        'my_calendar_mycalendar USING gin '
+        '(to_tsvector(\'simple\'::regconfig, COALESCE("name", \'\')))',
+    'CREATE INDEX IF NOT EXISTS my_calendar_user_search ON '
+        "auth_user USING gin (to_tsvector('simple'::regconfig, "
+        'COALESCE("username", \'\') || \' \' || COALESCE("first_name", '
+        '\'\') || \' \' || COALESCE("last_name", \'\')))',
+]
+
+POSTGRESQL_DROP_STATEMENTS = [
+    'DROP INDEX IF EXISTS my_calendar_event_search',
+    'DROP INDEX IF EXISTS my_calendar_mycalendar_search',
+    'DROP INDEX IF EXISTS my_calendar_user_search',
+]
+
+
+def has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+def install_search(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        statements = POSTGRESQL_STATEMENTS
+    elif connection.vendor == 'sqlite' and has_fts5(connection):
+        statements = SQLITE_STATEMENTS
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+def uninstall_search(apps, schema_editor):
+    statements = {
+        'postgresql': POSTGRESQL_DROP_STATEMENTS,
+        'sqlite': SQLITE_DROP_STATEMENTS,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0008_alter_user_username_max_length'),
+        ('my_calendar', '0023_auto_20261018_1939'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# indexes of prefixes of users' names as they were created by this migration
+SQLITE_STATEMENTS = [
+    'CREATE INDEX IF NOT EXISTS my_calendar_user_username_prefix '
+        'ON auth_user (username COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS '
+        'my_calendar_user_first_name_prefix ON auth_user (first_name '
+        'COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS my_calendar_user_last_name_prefix'
+        ' ON auth_user (last_name COLLATE NOCASE)',
+]
+
+POSTGRESQL_STATEMENTS = [
+    'CREATE INDEX IF NOT EXISTS my_calendar_user_username_prefix '
+        'ON auth_user (UPPER(username::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS '
+        'my_calendar_user_first_name_prefix ON auth_user '
+        '(UPPER(first_name::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS my_calendar_user_last_name_prefix'
+        ' ON auth_user (UPPER(last_name::text) text_pattern_ops)',
+]
+
+DROP_STATEMENTS = [
+    'DROP INDEX IF EXISTS my_calendar_user_username_prefix',
+    'DROP INDEX IF EXISTS my_calendar_user_first_name_prefix',
+    'DROP INDEX IF EXISTS my_calendar_user_last_name_prefix',
+]
+
+
+def create_indexes(apps, schema_editor):
+    statements = {
+        'postgresql': POSTGRESQL_STATEMENTS,
+        'sqlite': SQLITE_STATEMENTS,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        for statement in DROP_STATEMENTS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_calendar', '0024_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
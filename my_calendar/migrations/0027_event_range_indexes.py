@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 20:41
+from __future__ import unicode_literals
+
+import datetime
+import pytz
+
+from django.db import migrations, models
+
+
+# copy of models.FOREVER, the migration mustn't change with it
+FOREVER = pytz.utc.localize(datetime.datetime(9999, 12, 31))
+
+def end_endless_series(apps, schema_editor):
+    Event = apps.get_model('my_calendar', 'Event')
+    Event.objects.exclude(recurrence=0).filter(recurrence_count__isnull=True,
+        recurrence_until__isnull=True).update(series_end=FOREVER)
+
+def empty_endless_series(apps, schema_editor):
+    Event = apps.get_model('my_calendar', 'Event')
+    Event.objects.filter(series_end=FOREVER).update(series_end=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_calendar', '0026_userprofile_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(end_endless_series, empty_endless_series),
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('calendar', 'recurrence', 'end'), ('calendar', 'recurrence', 'series_end'), ('calendar', 'start')]),
+        ),
+    ]
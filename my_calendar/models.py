@@ -1,14 +1,35 @@
+from calendar import monthrange
 from pytz import common_timezones_set
+import copy
 import datetime
+import itertools
+import pytz
 import re
 
+from django.utils.functional import cached_property
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Q
 
 
 END_BEFORE_START_ERROR = "The event must end after its beginning."
+RECURRENCE_INTERVAL_ERROR = "Recurrence interval must be at least 1."
+RECURRENCE_COUNT_ERROR = "Number of occurrences must be at least 1."
+RECURRENCE_UNTIL_ERROR = "The recurrence must end after the beginning of the event."
+
+# end of the last occurrence of events that repeat forever
+FOREVER = pytz.utc.localize(datetime.datetime(9999, 12, 31))
+
+def event_visibility_index_enabled():
+    """
+    Denormalized EventVisibility table is used (and maintained)
+    only when EVENT_VISIBILITY_INDEX setting is on.
+    """
+    return getattr(settings, 'EVENT_VISIBILITY_INDEX', False)
 
 class UserProfile(models.Model):
     """
@@ -21,6 +42,8 @@ class UserProfile(models.Model):
     TIMEZONES = tuple((i + 1, tz) for i, tz in enumerate(TIMEZONES))
     UTC_index = next(x[0] for x in reversed(TIMEZONES) if x[1] == 'UTC')
     timezone = models.IntegerField(choices=TIMEZONES, default=UTC_index)
+    # also touched when events the user is invited to change
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def get_own_calendars(self):
         """
@@ -40,31 +63,127 @@ class UserProfile(models.Model):
         """
         return MyCalendar.objects.filter(readers=self)
 
-    def get_all_events(self):
+    @cached_property
+    def calendars_ids_to_read(self):
+        """
+        Set of ids of calendars that user can read.
+        Computed once per profile instance, i.e. once per request.
+        """
+        return set(self.calendars_to_read.values_list('pk', flat=True))
+
+    @cached_property
+    def calendars_ids_to_modify(self):
+        """
+        Set of ids of calendars that user can modify.
+        Computed once per profile instance, i.e. once per request.
+        """
+        return set(self.calendars_to_modify.values_list('pk', flat=True))
+
+    @property
+    def accessible_calendars_ids(self):
+        return self.calendars_ids_to_read | self.calendars_ids_to_modify
+
+    def can_read_calendar(self, calendar):
+        return calendar.pk in self.accessible_calendars_ids
+
+    def can_modify_calendar(self, calendar):
+        return calendar.pk in self.calendars_ids_to_modify
+
+    def can_modify_event(self, event):
+        return event.calendar_id in self.calendars_ids_to_modify
+
+    def get_accessible_calendars(self):
+        """
+        Returns a queryset of calendars that user can read or modify.
+        """
+        return MyCalendar.objects.filter(pk__in=self.accessible_calendars_ids)
+
+    def get_accessible_events(self):
+        """
+        Returns a queryset of events that user has access to:
+        events from calendars that user can read or modify
+        and events that user is invited to.
+        """
+        if event_visibility_index_enabled():
+            return Event.objects.filter(pk__in=EventVisibility.objects.filter(
+                user=self).values('event'))
+        # subqueries instead of joins let the database use indexes
+        # of every branch and make distinct() unnecessary
+        return Event.objects.filter(
+            Q(calendar__in=self.get_calendars_to_read().values('pk'))
+            | Q(calendar__in=self.get_calendars_to_modify().values('pk'))
+            | Q(pk__in=Guest.objects.filter(user=self).values('event')))
+
+    def get_events_between(self, start, end):
+        """
+        Returns a queryset of accessible events
+        that overlap the [start, end) range.
+        Both bounds should be aware datetimes.
+        """
+        if event_visibility_index_enabled():
+            return Event.objects.filter(pk__in=EventVisibility.objects.filter(
+                user=self, start__lt=end, end__gt=start).values('event'))
+        # every range is joined with every branch of accessible events
+        # in a flat OR, so each term can use an index of its own:
+        # events of calendars are bounded by the range, invited events
+        # only by the user's invitations
+        calendars = [
+            Q(calendar__in=self.get_calendars_to_read().values('pk')),
+            Q(calendar__in=self.get_calendars_to_modify().values('pk'))]
+        invited = Q(pk__in=Guest.objects.filter(user=self).values('event'))
+        condition = Q()
+        in_any_range = Q()
+        for range_ in Event.overlapping(start, end):
+            for calendar in calendars:
+                condition |= calendar & range_
+            in_any_range |= range_
+        return Event.objects.filter(condition | (invited & in_any_range))
+
+    def can_read_event(self, event):
+        """
+        Checks if user has access to the event with a single query.
+        """
+        return self.get_accessible_events().filter(pk=event.pk).exists()
+
+    def get_today(self):
         """
-        Returns events that user has access to.
+        Returns the current date in user's timezone.
         """
-        events = set()
-        for calendar in (self.get_calendars_to_modify()
-            | self.get_calendars_to_read()):
-            events_ = Event.objects.filter(calendar=calendar)
-            for ev in events_:
-                events.add(ev)
-        guests = Guest.objects.filter(user=self)
-        for guest in guests:
-            events.add(guest.event)
-        return events
+        user_timezone = pytz.timezone(self.get_timezone_display())
+        return now().astimezone(user_timezone).date()
 
     def get_upcoming_events(self, amount):
-        all_events = self.get_all_events()
-        upcoming_events = []
-        for event in all_events:
-            start = event.start.replace(tzinfo=None)
-            now = datetime.datetime.now()
-            if (event.all_day and start.date() >= now.date()) or start >= now:
-                upcoming_events.append(event)
-        upcoming_events.sort(key=lambda x: x.start)
-        return upcoming_events[-amount:]
+        """
+        Returns a list of the nearest events that haven't started yet.
+        All-day events are upcoming for the whole day of their beginning
+        in user's timezone.
+        Repeating events are represented by their nearest occurrences.
+        """
+        now = datetime.datetime.now(pytz.utc)
+        user_timezone = pytz.timezone(self.get_timezone_display())
+        today = now.astimezone(user_timezone).date()
+        beginning_of_today = user_timezone.localize(
+            datetime.datetime.combine(today, datetime.time(0)))
+
+        def is_upcoming(event):
+            return (event.start >= now
+                or (event.all_day and event.start >= beginning_of_today))
+
+        events = self.get_accessible_events()
+        upcoming = list(events.filter(recurrence=Event.NEVER).filter(
+            Q(start__gte=now)
+            | Q(all_day=True, start__gte=beginning_of_today)
+        ).order_by('start', 'pk')[:amount])
+        series = events.exclude(recurrence=Event.NEVER).filter(
+            series_end__gt=beginning_of_today)
+        exceptions = EventException.get_dates_of_events(series)
+        for event in series:
+            occurrences = event.get_occurrences(beginning_of_today,
+                excluded=exceptions.get(event.pk, set()))
+            upcoming.extend(itertools.islice(
+                (ev for ev in occurrences if is_upcoming(ev)), amount))
+        upcoming.sort(key=lambda ev: (ev.start, ev.pk))
+        return upcoming[:amount]
 
     def __str__(self):
         return self.user.first_name + ' ' + self.user.last_name
@@ -92,6 +211,8 @@ class MyCalendar(models.Model):
         UserProfile, related_name='calendars_to_modify', blank=True)
     readers = models.ManyToManyField(
         UserProfile, related_name='calendars_to_read', blank=True)
+    # also touched when events are deleted or calendar is shared
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -116,17 +237,224 @@ class Event(models.Model):
     end = models.DateTimeField()
     all_day = models.BooleanField(default=False)
 
+    NEVER = 0
+    DAILY = 1
+    WEEKLY = 2
+    MONTHLY = 3
+    RECURRENCE_CHOICES = (
+        (NEVER, "Does not repeat"),
+        (DAILY, "Daily"),
+        (WEEKLY, "Weekly"),
+        (MONTHLY, "Monthly"),
+    )
+    recurrence = models.IntegerField(choices=RECURRENCE_CHOICES,
+        default=NEVER, blank=True)
+    recurrence_interval = models.PositiveIntegerField(default=1, blank=True)
+    recurrence_count = models.PositiveIntegerField(null=True, blank=True)
+    recurrence_until = models.DateField(null=True, blank=True)
+    # end of the last occurrence of a repeating event, kept for range queries;
+    # FOREVER for events that repeat forever and empty for single events
+    series_end = models.DateTimeField(null=True, blank=True, editable=False)
+    # also touched when guests or exceptions change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # range overlap lookups of timeline views go through calendar
+        # and recurrence: single events by end, repeating ones by series_end
+        index_together = (('calendar', 'start'),
+            ('calendar', 'recurrence', 'end'),
+            ('calendar', 'recurrence', 'series_end'))
+
     def clean(self):
+        if self.recurrence is None:
+            self.recurrence = self.NEVER
+        if self.recurrence_interval is None:
+            self.recurrence_interval = 1
+        if self.recurrence_interval < 1:
+            raise ValidationError(_(RECURRENCE_INTERVAL_ERROR))
+        if self.recurrence_count is not None and self.recurrence_count < 1:
+            raise ValidationError(_(RECURRENCE_COUNT_ERROR))
         if self.start and self.end:
             if self.all_day:
                 if self.start.date() > self.end.date():
                     raise ValidationError(_(END_BEFORE_START_ERROR))
             elif self.start > self.end:
                 raise ValidationError(_(END_BEFORE_START_ERROR))
+            if (self.recurrence_until
+                    and self.recurrence_until < self.start.date()):
+                raise ValidationError(_(RECURRENCE_UNTIL_ERROR))
+
+    def save(self, *args, **kwargs):
+        self.series_end = self.get_series_end()
+        super(Event, self).save(*args, **kwargs)
+
+    @classmethod
+    def overlapping(cls, start, end):
+        """
+        Returns a list of Q objects selecting events that overlap
+        the [start, end) range: single events by their end and every kind
+        of repeating events by the end of their last occurrence.
+        Each of them matches an index on the range, so they are meant
+        to be joined with OR together with other conditions of a branch
+        rather than used as a single filter.
+        """
+        ranges = [Q(recurrence=cls.NEVER, end__gt=start)]
+        ranges += [Q(recurrence=value, series_end__gt=start)
+            for value, _ in cls.RECURRENCE_CHOICES if value != cls.NEVER]
+        return [range_ & Q(start__lt=end) for range_ in ranges]
+
+    @property
+    def is_recurring(self):
+        return self.recurrence != self.NEVER
+
+    def get_series_end(self):
+        """
+        Returns the end of the last occurrence of a repeating event,
+        FOREVER if it repeats forever or None if the event doesn't repeat.
+        A series without any occurrences ends with the event itself.
+        """
+        if not self.is_recurring:
+            return None
+        if self.recurrence_count is None and self.recurrence_until is None:
+            return FOREVER
+        last = None
+        for start in self._occurrence_starts():
+            last = start
+        if last is None:
+            return self.end
+        return last + (self.end - self.start)
+
+    def _occurrence_starts(self, after=None, excluded=()):
+        """
+        Lazily yields beginnings of occurrences in ascending order.
+        Occurrences are computed in event's timezone, so they keep
+        their local hour across DST changes.
+        If after is given, occurrences ending before it may be skipped
+        without being generated.
+        Excluded dates still count towards recurrence_count, like in RFC 5545.
+        """
+        tz = pytz.timezone(self.get_timezone_display())
+        local_start = self.start.astimezone(tz).replace(tzinfo=None)
+        interval = self.recurrence_interval or 1
+        duration = self.end - self.start
+
+        first = 0
+        if after is not None and self.recurrence_count is None:
+            # the first possibly overlapping occurrence, with a day of margin
+            # for DST and timezone shifts
+            local_after = after.astimezone(tz).replace(tzinfo=None)
+            behind = local_after - duration - local_start
+            if self.recurrence == self.MONTHLY:
+                months = ((local_after.year - local_start.year) * 12
+                    + local_after.month - local_start.month)
+                months -= (duration.days // 28) + 2
+                first = max(0, months // interval)
+            else:
+                step = datetime.timedelta(days=interval)
+                if self.recurrence == self.WEEKLY:
+                    step *= 7
+                first = max(0, behind // step - 1)
+
+        index = first
+        generated = 0
+        while True:
+            if self.recurrence == self.MONTHLY:
+                month = local_start.month - 1 + index * interval
+                year = local_start.year + month // 12
+                month = month % 12 + 1
+                index += 1
+                # months without such a day are skipped
+                if local_start.day > monthrange(year, month)[1]:
+                    continue
+                local = local_start.replace(year=year, month=month)
+            else:
+                days = index * interval
+                if self.recurrence == self.WEEKLY:
+                    days *= 7
+                local = local_start + datetime.timedelta(days=days)
+                index += 1
+            generated += 1
+            if (self.recurrence_count is not None
+                    and generated > self.recurrence_count):
+                return
+            if (self.recurrence_until is not None
+                    and local.date() > self.recurrence_until):
+                return
+            if local.date() in excluded:
+                continue
+            yield tz.localize(local).astimezone(pytz.utc)
+
+    def occurs_on(self, date_):
+        """
+        Checks if an occurrence of a repeating event begins on the date
+        in event's timezone, also if the occurrence was removed.
+        """
+        if not self.is_recurring:
+            return False
+        tz = pytz.timezone(self.get_timezone_display())
+        after = tz.localize(datetime.datetime.combine(date_, datetime.time(0)))
+        for start in self._occurrence_starts(after):
+            local_date = start.astimezone(tz).date()
+            if local_date >= date_:
+                return local_date == date_
+        return False
+
+    def get_occurrences(self, start=None, end=None, excluded=None):
+        """
+        Lazily yields copies of the event moved to its occurrences
+        that overlap the [start, end) range (both bounds are optional).
+        Single events yield at most themselves.
+        excluded is a set of dates of removed occurrences,
+        if it isn't given it is read from the database.
+        """
+        if not self.is_recurring:
+            if ((start is None or self.end > start)
+                    and (end is None or self.start < end)):
+                yield self
+            return
+        if excluded is None:
+            excluded = set(self.exceptions.values_list('date', flat=True))
+        duration = self.end - self.start
+        for occurrence_start in self._occurrence_starts(start, excluded):
+            if end is not None and occurrence_start >= end:
+                return
+            if start is not None and occurrence_start + duration <= start:
+                continue
+            occurrence = copy.copy(self)
+            occurrence.start = occurrence_start
+            occurrence.end = occurrence_start + duration
+            yield occurrence
 
     def __str__(self):
         return self.title
 
+class EventException(models.Model):
+    """
+    Removed occurrence of a repeating event.
+    Date is the date of the occurrence's beginning in event's timezone.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE,
+        related_name='exceptions')
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ('event', 'date')
+
+    @classmethod
+    def get_dates_of_events(cls, events):
+        """
+        Returns a dict mapping pks of given events
+        to sets of their removed dates, using a single query.
+        """
+        dates = {}
+        for event_id, date in cls.objects.filter(event__in=events).values_list(
+                'event_id', 'date'):
+            dates.setdefault(event_id, set()).add(date)
+        return dates
+
+    def __str__(self):
+        return '{} ({})'.format(self.event, self.date)
+
 class Guest(models.Model):
     """
     Owner of an event can invite other users to it.
@@ -150,7 +478,39 @@ class Guest(models.Model):
         (NOT_GOING, "Not going"),
     )
     attending_status = models.IntegerField(choices=ATTENDING_STATUS_CHOICES, default=UNKNOWN)
+    updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         unique_together = ('event', 'user')
+        # index of unique_together starts with event, lookups by user need
+        # their own one
+        index_together = ('user', 'event')
         # unique_together changes default ordering e.g. for objects.all()
         ordering = ['id']
+
+
+class EventVisibility(models.Model):
+    """
+    Denormalized index of events visible to users.
+    There is one row per user, event and the way user has access to it,
+    so timeline queries can be a single range scan of this table.
+    Rows are kept up to date by signals (see visibility.py)
+    and can be rebuilt with rebuild_event_visibility command.
+    """
+    READER = 1
+    MODIFIER = 2
+    GUEST = 3
+    VIA_CHOICES = (
+        (READER, "Reader"),
+        (MODIFIER, "Modifier"),
+        (GUEST, "Guest"),
+    )
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    calendar = models.ForeignKey(MyCalendar, on_delete=models.CASCADE)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    via = models.IntegerField(choices=VIA_CHOICES)
+
+    class Meta:
+        unique_together = ('user', 'event', 'via')
+        index_together = (('user', 'start'), ('user', 'end'))
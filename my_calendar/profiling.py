@@ -0,0 +1,87 @@
+"""
+Profiling of chosen requests with cProfile.
+
+A fraction of all requests and every request to the listed URL names
+are profiled. Profiles of requests slower than the threshold are saved
+as .prof files, readable by pstats or snakeviz, and the functions
+with the longest cumulative time are logged.
+Everything is turned on with the REQUEST_PROFILING setting.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import time
+
+from django.conf import settings
+from django.urls import resolve, Resolver404
+
+
+logger = logging.getLogger('my_calendar.profiling')
+
+def is_enabled():
+    return getattr(settings, 'REQUEST_PROFILING', False)
+
+def get_url_name(request):
+    """
+    Returns namespaced name of the URL of request, e.g. my_calendar:month.
+    """
+    try:
+        return resolve(request.path_info).view_name
+    except Resolver404:
+        return None
+
+def should_profile(request):
+    url_names = getattr(settings, 'REQUEST_PROFILING_URL_NAMES', ())
+    if get_url_name(request) in url_names:
+        return True
+    return random.random() < getattr(settings, 'REQUEST_PROFILING_RATE', 0)
+
+def get_directory():
+    return getattr(settings, 'REQUEST_PROFILING_DIR',
+        os.path.join(settings.BASE_DIR, 'profiles'))
+
+def summary(profile, limit):
+    """
+    Returns a table of limit functions with the longest cumulative time.
+    """
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+def save(profile, request, duration):
+    """
+    Dumps profile into a new file of the profiles directory
+    and returns its path.
+    """
+    directory = get_directory()
+    os.makedirs(directory, exist_ok=True)
+    name = '{}-{}-{}-{}ms.prof'.format(time.strftime('%Y%m%d-%H%M%S'),
+        (get_url_name(request) or 'unknown').replace(':', '-'), os.getpid(),
+        int(duration * 1000))
+    path = os.path.join(directory, name)
+    profile.dump_stats(path)
+    return path
+
+def profile_request(get_response, request):
+    """
+    Returns response of the request made under the profiler.
+    """
+    profile = cProfile.Profile()
+    started = time.perf_counter()
+    profile.enable()
+    try:
+        return get_response(request)
+    finally:
+        profile.disable()
+        duration = time.perf_counter() - started
+        if duration * 1000 >= getattr(settings, 'REQUEST_PROFILING_SLOW_MS',
+                1000):
+            path = save(profile, request, duration)
+            logger.warning('%s %s took %.1f ms, profile saved to %s\n%s',
+                request.method, request.path, duration * 1000, path,
+                summary(profile, getattr(settings, 'REQUEST_PROFILING_TOP',
+                    20)))
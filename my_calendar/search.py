@@ -0,0 +1,307 @@
+"""
+Ranked full-text search of events, calendars and users
+and prefix lookups of users for autocompletion.
+
+On PostgreSQL documents are matched with SearchVector and ordered
+by SearchRank, GIN indexes of the same expressions make it fast.
+On SQLite they are looked up in FTS5 tables of titles and names,
+which are kept up to date by triggers. Other databases fall back
+to case-insensitive substring matching of every word.
+Users are looked up by prefixes of their names ignoring case,
+supported by case-insensitive indexes of the name columns.
+Tables, triggers and indexes are created by install(), called
+by the rebuild_search_index command and after migrations, because
+SQLite drops triggers and indexes of tables remade by migrations.
+"""
+import re
+from functools import reduce
+from operator import and_
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.db import connection, connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import F, Q
+from django.db.models.signals import post_migrate
+
+from .models import UserProfile
+
+
+RESULTS_PER_PAGE = 20
+# names and titles are in many languages, so words aren't stemmed
+CONFIG = 'simple'
+
+# names of full-text tables or indexes
+EVENT_SEARCH = 'my_calendar_event_search'
+CALENDAR_SEARCH = 'my_calendar_mycalendar_search'
+USER_SEARCH = 'my_calendar_user_search'
+
+# table, searched columns and name of the full-text table or index
+DOCUMENTS = (
+    ('my_calendar_event', ('title', 'desc'), EVENT_SEARCH),
+    ('my_calendar_mycalendar', ('name',), CALENDAR_SEARCH),
+    ('auth_user', ('username', 'first_name', 'last_name'), USER_SEARCH),
+)
+
+# triggers of every full-text table of SQLite
+TRIGGERS = ('insert', 'delete', 'update')
+# migration creating the tables, triggers and indexes
+MIGRATION = ('my_calendar', '0024_search')
+
+WORD_RE = re.compile(r'\w+')
+
+USERS_PER_PAGE = 10
+# greater than any character, so prefix + LAST_CHARACTER is greater
+# than all words starting with prefix
+LAST_CHARACTER = '\U0010ffff'
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+def get_words(phrase):
+    return WORD_RE.findall(phrase or '')
+
+def sqlite_statements(table, columns, name):
+    """
+    Returns statements creating an external content FTS5 table of columns
+    and triggers copying changes of table to it.
+    """
+    columns = ', '.join('"{}"'.format(column) for column in columns)
+    new = ', '.join('new.{}'.format(column) for column in columns.split(', '))
+    old = ', '.join('old.{}'.format(column) for column in columns.split(', '))
+    insert = 'INSERT INTO {name}(rowid, {columns}) VALUES (new.id, {new});'
+    delete = ("INSERT INTO {name}({name}, rowid, {columns}) "
+        "VALUES ('delete', old.id, {old});")
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5({columns}, "
+            "content='{table}', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 1')",
+        "CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table} "
+            "BEGIN " + insert + " END",
+        "CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table} "
+            "BEGIN " + delete + " END",
+        "CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE ON {table} "
+            "BEGIN " + delete + " " + insert + " END",
+        "INSERT INTO {name}({name}) VALUES ('rebuild')",
+    ]
+    return [statement.format(name=name, table=table, columns=columns,
+        new=new, old=old) for statement in statements]
+
+def postgresql_vector(columns):
+    """
+    Returns SQL of the vector built by SearchVector(*columns, config=CONFIG),
+    so indexes of it are used by search queries.
+    """
+    return "to_tsvector('{}'::regconfig, {})".format(CONFIG,
+        " || ' ' || ".join(
+            "COALESCE(\"{}\", '')".format(column) for column in columns))
+
+def prefix_index_name(column):
+    return 'my_calendar_user_{}_prefix'.format(column)
+
+def prefix_index_statements(vendor):
+    """
+    Returns statements creating indexes used by case-insensitive
+    prefix lookups of users' names.
+    """
+    statements = []
+    for column in USER_NAME_FIELDS:
+        name = prefix_index_name(column)
+        if vendor == 'postgresql':
+            # matches UPPER("column"::text) LIKE UPPER(%s) of istartswith
+            statements.append('CREATE INDEX IF NOT EXISTS {} ON auth_user '
+                '(UPPER({}::text) text_pattern_ops)'.format(name, column))
+        elif vendor == 'sqlite':
+            # lookup_users compares names with NOCASE collation
+            statements.append('CREATE INDEX IF NOT EXISTS {} ON auth_user '
+                '({} COLLATE NOCASE)'.format(name, column))
+    return statements
+
+def install(schema_editor):
+    """
+    Creates full-text tables and triggers on SQLite or indexes on PostgreSQL
+    and indexes of prefixes of users' names.
+    On SQLite the tables are also filled with existing rows.
+    Tables and triggers, which already exist, are kept.
+    """
+    connection_ = schema_editor.connection
+    for table, columns, name in DOCUMENTS:
+        if connection_.vendor == 'postgresql':
+            schema_editor.execute(
+                'CREATE INDEX IF NOT EXISTS {} ON {} USING gin ({})'.format(
+                    name, table, postgresql_vector(columns)))
+        elif connection_.vendor == 'sqlite' and has_fts5(connection_):
+            for statement in sqlite_statements(table, columns, name):
+                schema_editor.execute(statement)
+    for statement in prefix_index_statements(connection_.vendor):
+        schema_editor.execute(statement)
+
+def uninstall(schema_editor):
+    connection_ = schema_editor.connection
+    for table, columns, name in DOCUMENTS:
+        if connection_.vendor == 'postgresql':
+            schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+        elif connection_.vendor == 'sqlite':
+            for trigger in TRIGGERS:
+                schema_editor.execute('DROP TRIGGER IF EXISTS {}_{}'.format(
+                    name, trigger))
+            schema_editor.execute('DROP TABLE IF EXISTS {}'.format(name))
+    for column in USER_NAME_FIELDS:
+        if connection_.vendor in ('postgresql', 'sqlite'):
+            schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+                prefix_index_name(column)))
+
+def has_fts5(connection_):
+    with connection_.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+def fts_names():
+    """
+    Returns names of full-text tables of SQLite and of their triggers.
+    """
+    names = []
+    for table, columns, name in DOCUMENTS:
+        names.append(name)
+        names.extend('{}_{}'.format(name, trigger) for trigger in TRIGGERS)
+    return names
+
+def get_missing_sqlite_names(connection_):
+    """
+    Returns names of full-text tables, triggers and indexes,
+    which should exist in the SQLite database, but don't.
+    """
+    names = [prefix_index_name(column) for column in USER_NAME_FIELDS]
+    if has_fts5(connection_):
+        names += fts_names()
+    with connection_.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master "
+            "WHERE type IN ('table', 'trigger', 'index')")
+        existing = {row[0] for row in cursor.fetchall()}
+    return [name for name in names if name not in existing]
+
+def uses_fts_tables():
+    """
+    Checks once per database if FTS5 tables and triggers keeping them
+    up to date were created by install(). Without triggers the tables
+    would go stale, so searches fall back to substring matching.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in uses_fts_tables.databases:
+        uses_fts_tables.databases[name] = has_fts5(connection) and not (
+            set(fts_names()) & set(get_missing_sqlite_names(connection)))
+    return uses_fts_tables.databases[name]
+uses_fts_tables.databases = {}
+
+def reinstall_missing(sender, using, **kwargs):
+    """
+    Recreates tables, triggers and indexes of SQLite, which migrations
+    dropped with tables they remade, e.g. to add a column,
+    and fills the full-text tables again.
+    """
+    connection_ = connections[using]
+    if connection_.vendor != 'sqlite':
+        return
+    if MIGRATION not in MigrationRecorder(connection_).applied_migrations():
+        return
+    if get_missing_sqlite_names(connection_):
+        with connection_.schema_editor() as schema_editor:
+            install(schema_editor)
+    uses_fts_tables.databases.pop(connection_.settings_dict['NAME'], None)
+
+def connect_signals():
+    # sent after all migrations, once per application
+    post_migrate.connect(reinstall_missing,
+        sender=apps.get_app_config('my_calendar'),
+        dispatch_uid='search_reinstall_missing')
+
+def search(queryset, phrase, fields, name, join_column='id'):
+    """
+    Returns objects of queryset matching all words of phrase
+    in any of fields, the best matches first.
+    name is the full-text table of fields and join_column is the column
+    of queryset's table with ids of its rows.
+    """
+    words = get_words(phrase)
+    if not words:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(' '.join(words), config=CONFIG)
+        vector = SearchVector(*fields, config=CONFIG)
+        return queryset.annotate(search=vector).filter(search=query).annotate(
+            rank=SearchRank(F('search'), query)).order_by('-rank', 'pk')
+    if uses_fts_tables():
+        # every word is matched as a prefix, e.g. "meet"* matches meeting
+        query = ' '.join('"{}"*'.format(word) for word in words)
+        table = queryset.model._meta.db_table
+        return queryset.extra(tables=[name],
+            where=['{}.rowid = {}.{}'.format(name, table, join_column),
+                '{} MATCH %s'.format(name)],
+            params=[query],
+            select={'search_rank': 'bm25({})'.format(name)},
+        ).order_by('search_rank', 'pk')
+    return queryset.filter(reduce(and_, (
+        reduce(Q.__or__, (Q(**{field + '__icontains': word})
+            for field in fields))
+        for word in words))).order_by('pk')
+
+def search_events(profile, phrase):
+    """
+    Returns events accessible to the user matching phrase
+    in their titles or descriptions.
+    """
+    return search(profile.get_accessible_events(), phrase,
+        ('title', 'desc'), EVENT_SEARCH)
+
+def search_calendars(profile, phrase):
+    """
+    Returns calendars accessible to the user matching phrase in their names.
+    """
+    return search(profile.get_accessible_calendars(), phrase,
+        ('name',), CALENDAR_SEARCH)
+
+def search_users(phrase):
+    """
+    Returns profiles of users matching phrase in usernames,
+    first or last names.
+    """
+    fields = ('user__username', 'user__first_name', 'user__last_name')
+    if connection.vendor == 'postgresql' and get_words(phrase):
+        # vectors of users are indexed in their own table
+        users = search(User.objects.all(), phrase,
+            ('username', 'first_name', 'last_name'), USER_SEARCH)
+        query = SearchQuery(' '.join(get_words(phrase)), config=CONFIG)
+        return UserProfile.objects.filter(
+            user__in=users.values('pk')).select_related('user').annotate(
+            rank=SearchRank(SearchVector(*fields, config=CONFIG), query)
+            ).order_by('-rank', 'pk')
+    return search(UserProfile.objects.select_related('user'), phrase,
+        fields, USER_SEARCH, join_column='user_id')
+
+def lookup_users(prefix, page=1):
+    """
+    Returns a page of profiles of users whose username, first or last name
+    starts with prefix, ignoring case, and if there are more of them.
+    """
+    prefix = (prefix or '').strip()
+    if not prefix:
+        return [], False
+    profiles = UserProfile.objects.select_related('user')
+    if connection.vendor == 'sqlite':
+        # LIKE with a parameter never uses indexes on SQLite,
+        # a range of the NOCASE index selects the same rows
+        profiles = profiles.extra(where=[' OR '.join(
+            '("auth_user"."{0}" >= %s COLLATE NOCASE '
+            'AND "auth_user"."{0}" < %s COLLATE NOCASE)'.format(field)
+            for field in USER_NAME_FIELDS)],
+            params=[prefix, prefix + LAST_CHARACTER] * len(USER_NAME_FIELDS))
+    else:
+        profiles = profiles.filter(reduce(Q.__or__, (
+            Q(**{'user__{}__istartswith'.format(field): prefix})
+            for field in USER_NAME_FIELDS)))
+    profiles = profiles.order_by('user__username', 'pk')
+    start = (page - 1) * USERS_PER_PAGE
+    # one more row tells if there is a next page, without counting all
+    profiles = list(profiles[start:start + USERS_PER_PAGE + 1])
+    return profiles[:USERS_PER_PAGE], len(profiles) > USERS_PER_PAGE
@@ -0,0 +1,17 @@
+// Loading further pages of events of the calendar without reloading the page.
+// Fragments end with their own "More events" link, if there are more events.
+$("#events").on("click", "#more_events", function(clickEvent) {
+    const link = $(this);
+    clickEvent.preventDefault();
+    $.get(link.attr("href")).done(function(fragment) {
+        link.replaceWith(fragment);
+        let more = $("#more_events");
+        if(more.length) {
+            $("#newer_events").attr("href", more.data("page"));
+        } else {
+            $("#newer_events").parent().remove();
+        }
+    }).fail(function() {
+        location.href = link.data("page");
+    });
+});
@@ -7,3 +7,167 @@ $(".calendar-checkbox").change(function() {
         events.hide("scale", duration = "slow");
     }
 });
+
+// Switching periods without reloading the page.
+// Periods are fetched as JSON and the neighbouring ones are prefetched,
+// so arrows usually don't wait for the server at all.
+(function() {
+    const timeline = $("#timeline");
+    if(!timeline.length) {
+        return;
+    }
+    const view = timeline.data("view");
+    const apiUrl = timeline.data("url");
+    const weekdays = ["Monday", "Tuesday", "Wednesday", "Thursday",
+                      "Friday", "Saturday", "Sunday"];
+    // requests of periods by date, shared by prefetching and navigation
+    let periods = {};
+
+    function fetchPeriod(date) {
+        if(!periods[date]) {
+            periods[date] = $.getJSON(apiUrl, {view: view, date: date});
+            periods[date].fail(function() {
+                delete periods[date];
+            });
+        }
+        return periods[date];
+    }
+
+    function withDate(url, date) {
+        return url.replace(/[0-9-]+$/, date);
+    }
+
+    function eventElement(event, day, absolute) {
+        let box = $("<div>")
+            .addClass("event well well-supersmall calendar-" + event.calendar)
+            .attr("id", "event-" + event.pk + "-" + day.day.replace(/-/g, "/"))
+            .css("color", event.color)
+            .text(event.title);
+        if(absolute) {
+            box.css({
+                position: "absolute",
+                top: "calc(" + event.top + " * 100%)",
+                height: "calc(" + event.height + " * 100%)",
+                left: "calc(" + event.left + " * 100%)",
+                width: "calc(" + event.width + " * 100%)",
+            });
+        }
+        return $("<a>").attr("href", event.url).append(box);
+    }
+
+    function renderMonth(data) {
+        let body = $("#table-month tbody").empty();
+        data.weeks.forEach(function(segments, week) {
+            let days = data.days.slice(week * 7, week * 7 + 7);
+            let row = $("<tr>").addClass("month--days").appendTo(body);
+            days.forEach(function(day) {
+                row.append($("<td>").append(
+                    $("<a>").attr("href", day.url).text(day.day.slice(8, 10))));
+            });
+            // segments come ordered by their first days
+            let lanes = [];
+            segments.forEach(function(segment) {
+                while(lanes.length <= segment.lane) {
+                    lanes.push({row: $("<tr>").addClass("month--lane"), filled: 0});
+                }
+                let lane = lanes[segment.lane];
+                for(; lane.filled < segment.column; lane.filled++) {
+                    lane.row.append($("<td>"));
+                }
+                lane.row.append($("<td>").attr("colspan", segment.span).append(
+                    $("<div>")
+                        .addClass("well well-supersmall calendar-" + segment.calendar)
+                        .append($("<a>").attr("href", segment.url).append(
+                            $("<span>").css("color", segment.color)
+                                .text(segment.title)))));
+                lane.filled += segment.span;
+            });
+            lanes.forEach(function(lane) {
+                for(; lane.filled < days.length; lane.filled++) {
+                    lane.row.append($("<td>"));
+                }
+                body.append(lane.row);
+            });
+        });
+    }
+
+    function renderHours(data, allDayCells, hourColumns) {
+        allDayCells.empty();
+        hourColumns.empty();
+        data.days.forEach(function(day, index) {
+            let allDay = allDayCells.eq(index);
+            let column = hourColumns.eq(view == "day" ? 0 : index);
+            day.events.forEach(function(event) {
+                if(event.all_day) {
+                    allDay.append(eventElement(event, day, false));
+                } else {
+                    column.append(eventElement(event, day, true));
+                }
+            });
+        });
+    }
+
+    function render(data) {
+        if(view == "month") {
+            renderMonth(data);
+        } else {
+            if(view == "week") {
+                $(".timeline--header .timeline--day-column a").each(function(index) {
+                    $(this).attr("href", data.days[index].url)
+                        .text(weekdays[index]);
+                });
+            }
+            renderHours(data, $(".all-day > div").slice(1),
+                $(".timeline--events"));
+        }
+        $(".timeline--date-range").text(data.title);
+        $(".calendar-checkbox").each(function() {
+            if(!this.checked) {
+                $("." + this.id).hide();
+            }
+        });
+        timeline.data("date", data.date);
+        ["earlier", "later"].forEach(function(id) {
+            let link = $("#" + id);
+            link.attr("href", withDate(link.attr("href"), data[id]))
+                .data("date", data[id]);
+        });
+        ["month", "week", "day"].forEach(function(id) {
+            let link = $("#" + id);
+            link.attr("href", withDate(link.attr("href"), data.date));
+        });
+    }
+
+    function prefetchNeighbours() {
+        fetchPeriod($("#earlier").data("date"));
+        fetchPeriod($("#later").data("date"));
+    }
+
+    function show(date, push) {
+        return fetchPeriod(date).done(function(data) {
+            render(data);
+            if(push) {
+                history.pushState({date: data.date}, "",
+                    withDate(location.pathname, data.date));
+            }
+            prefetchNeighbours();
+        });
+    }
+
+    $("#earlier, #later").click(function(clickEvent) {
+        const link = $(this);
+        clickEvent.preventDefault();
+        show(link.data("date"), true).fail(function() {
+            // fall back to the server rendered page
+            location.href = link.attr("href");
+        });
+    });
+
+    $(window).on("popstate", function(popEvent) {
+        const state = popEvent.originalEvent.state;
+        show(state ? state.date : timeline.data("initial-date"), false);
+    });
+
+    timeline.data("initial-date", timeline.data("date"));
+    prefetchNeighbours();
+})();
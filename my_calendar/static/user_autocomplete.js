@@ -0,0 +1,94 @@
+// Autocompletion of users in selects rendered by UserAutocomplete widgets.
+// Selects contain only chosen users, others are looked up while typing,
+// so forms don't have to list every user of the system.
+(function() {
+    const delay = 250;
+
+    function setUp(select) {
+        const url = select.data("url");
+        const multiple = select.prop("multiple");
+        let chosen = $("<div>").addClass("user-autocomplete--chosen");
+        let input = $("<input>").attr({type: "text", placeholder: "Type a name"})
+            .addClass("form-control");
+        let results = $("<div>").addClass("list-group user-autocomplete--results");
+        let timer = null;
+        let request = null;
+
+        function renderChosen() {
+            chosen.empty();
+            select.find("option:selected").each(function() {
+                const option = $(this);
+                let remove = $("<a>").attr("href", "#").html("&times;")
+                    .click(function(clickEvent) {
+                        clickEvent.preventDefault();
+                        option.remove();
+                        renderChosen();
+                    });
+                chosen.append($("<span>").addClass("label label-default")
+                    .text(option.text() + " ").append(remove), " ");
+            });
+        }
+
+        function choose(user) {
+            if(!multiple) {
+                select.empty();
+            }
+            if(!select.find("option[value='" + user.id + "']").length) {
+                select.append($("<option>").val(user.id).text(user.text));
+            }
+            select.find("option[value='" + user.id + "']").prop("selected", true);
+            renderChosen();
+            input.val("");
+            results.empty();
+        }
+
+        function lookup(page) {
+            if(request) {
+                request.abort();
+            }
+            request = $.getJSON(url, {q: input.val(), page: page});
+            request.done(function(data) {
+                if(page == 1) {
+                    results.empty();
+                }
+                results.find(".user-autocomplete--more").remove();
+                data.results.forEach(function(user) {
+                    results.append($("<a>").attr("href", "#")
+                        .addClass("list-group-item")
+                        .text(user.text + " (" + user.username + ")")
+                        .click(function(clickEvent) {
+                            clickEvent.preventDefault();
+                            choose(user);
+                        }));
+                });
+                if(data.more) {
+                    results.append($("<a>").attr("href", "#")
+                        .addClass("list-group-item user-autocomplete--more")
+                        .text("More...")
+                        .click(function(clickEvent) {
+                            clickEvent.preventDefault();
+                            lookup(page + 1);
+                        }));
+                }
+            });
+        }
+
+        input.on("input", function() {
+            clearTimeout(timer);
+            if(!$.trim(input.val())) {
+                results.empty();
+                return;
+            }
+            timer = setTimeout(function() {
+                lookup(1);
+            }, delay);
+        });
+
+        select.hide().after(chosen, input, results);
+        renderChosen();
+    }
+
+    $("select.user-autocomplete").each(function() {
+        setUp($(this));
+    });
+})();
@@ -0,0 +1,320 @@
+import datetime
+import pickle
+import pytz
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from my_calendar.models import (UserProfile, MyCalendar, Event)
+from my_calendar.additional_functions import (fill_month,
+    get_events_from_days, layout_day, get_weeks_of_month, get_page_of_events, encode_cursor, decode_cursor)
+
+
+class GetEventsFromDaysTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='John')
+        self.profile = UserProfile.objects.create(user=user)
+        self.calendar = MyCalendar.objects.create(owner=self.profile,
+            name="Cindirella", color="#E81AD4")
+        self.calendar.readers.add(self.profile)
+        other = UserProfile.objects.create(
+            user=User.objects.create(username='Other'))
+        self.other_calendar = MyCalendar.objects.create(owner=other,
+            name="Other", color="#E81AD4")
+        self.timezone = pytz.utc
+        self.days = fill_month(datetime.date(2016, 12, 13))
+
+    def create_event(self, start, end, calendar=None):
+        start = self.timezone.localize(start)
+        end = self.timezone.localize(end)
+        return Event.objects.create(calendar=calendar or self.calendar,
+            title="Some title", start=start, end=end)
+
+    def events_of_day(self, final_days, day):
+        for dict_ in final_days:
+            if dict_['day'] == day:
+                return [event['pk'] for event in dict_['events']]
+
+    def test_multi_day_event_in_every_day_it_touches(self):
+        event = self.create_event(datetime.datetime(2016, 12, 12, 20),
+            datetime.datetime(2016, 12, 15, 1))
+        final_days = get_events_from_days(self.days, [event],
+            self.timezone, self.profile)
+        for day in range(12, 16):
+            self.assertEqual(self.events_of_day(final_days,
+                datetime.date(2016, 12, day)), [event.pk])
+        self.assertEqual(self.events_of_day(final_days,
+            datetime.date(2016, 12, 16)), [])
+
+    def test_event_ending_at_midnight_not_in_next_day(self):
+        event = self.create_event(datetime.datetime(2016, 12, 13, 20),
+            datetime.datetime(2016, 12, 14))
+        final_days = get_events_from_days(self.days, [event],
+            self.timezone, self.profile)
+        self.assertEqual(self.events_of_day(final_days,
+            datetime.date(2016, 12, 13)), [event.pk])
+        self.assertEqual(self.events_of_day(final_days,
+            datetime.date(2016, 12, 14)), [])
+
+    def test_events_of_day_sorted_by_beginning(self):
+        later = self.create_event(datetime.datetime(2016, 12, 13, 15),
+            datetime.datetime(2016, 12, 13, 16))
+        earlier = self.create_event(datetime.datetime(2016, 12, 13, 9),
+            datetime.datetime(2016, 12, 13, 10))
+        final_days = get_events_from_days(self.days, [later, earlier],
+            self.timezone, self.profile)
+        self.assertEqual(self.events_of_day(final_days,
+            datetime.date(2016, 12, 13)), [earlier.pk, later.pk])
+
+    def test_events_from_other_calendars_marked_as_other(self):
+        event = self.create_event(datetime.datetime(2016, 12, 13, 9),
+            datetime.datetime(2016, 12, 13, 10), self.other_calendar)
+        final_days = get_events_from_days(self.days, [event],
+            self.timezone, self.profile)
+        for dict_ in final_days:
+            if dict_['events']:
+                self.assertEqual(dict_['events'][0]['class'], 'other')
+
+    def test_days_of_multi_day_event_share_its_record(self):
+        event = self.create_event(datetime.datetime(2016, 12, 12, 20),
+            datetime.datetime(2016, 12, 14, 1))
+        final_days = get_events_from_days(self.days, [event],
+            self.timezone, self.profile)
+        items = [item for dict_ in final_days for item in dict_['events']]
+        self.assertEqual(len(items), 3)
+        self.assertIs(items[0].event, items[1].event)
+        self.assertIs(items[1].event, items[2].event)
+        self.assertEqual([(item.day_start.hour, item.day_end.hour)
+            for item in items], [(20, 0), (0, 0), (0, 1)])
+        # the shared record survives pickling by the timeline cache
+        items = pickle.loads(pickle.dumps(items, pickle.HIGHEST_PROTOCOL))
+        self.assertIs(items[0].event, items[2].event)
+
+    def test_items_read_like_dicts(self):
+        event = self.create_event(datetime.datetime(2016, 12, 13, 6),
+            datetime.datetime(2016, 12, 13, 12))
+        final_days = get_events_from_days(self.days, [event],
+            self.timezone, self.profile)
+        item = [item for dict_ in final_days for item in dict_['events']][0]
+        self.assertEqual(item.as_dict(), {
+            'pk': event.pk,
+            'title': 'Some title',
+            'start': event.start,
+            'end': event.end,
+            'all_day': False,
+            'class': self.calendar.pk,
+            'color': self.calendar.color,
+            'top': 0.25,
+            'height': 0.25,
+            'left': 0,
+            'width': 1,
+        })
+        self.assertIn('top', item)
+        with self.assertRaises(KeyError):
+            item['desc']
+
+    def test_all_day_items_without_layout(self):
+        event = self.create_event(datetime.datetime(2016, 12, 13),
+            datetime.datetime(2016, 12, 14))
+        event.all_day = True
+        final_days = get_events_from_days(self.days, [event],
+            self.timezone, self.profile)
+        item = [item for dict_ in final_days for item in dict_['events']][0]
+        self.assertNotIn('top', item.as_dict())
+        with self.assertRaises(KeyError):
+            item['height']
+
+    def test_number_of_queries_does_not_depend_on_events(self):
+        events = [self.create_event(datetime.datetime(2016, 12, day, 9),
+            datetime.datetime(2016, 12, day + 2, 10)) for day in range(1, 20)]
+        # readable and modifiable calendars of the profile
+        with self.assertNumQueries(2):
+            get_events_from_days(self.days, events, self.timezone,
+                self.profile)
+
+
+class LayoutDayTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='John')
+        self.profile = UserProfile.objects.create(user=user)
+        self.calendar = MyCalendar.objects.create(owner=self.profile,
+            name="Cindirella", color="#E81AD4")
+        self.calendar.readers.add(self.profile)
+        self.day = datetime.date(2016, 12, 13)
+
+    def items(self, *hours):
+        """
+        Returns items of the day of events lasting the given (start, end)
+        hours, ordered like the hours.
+        """
+        events = []
+        for start, end in hours:
+            events.append(Event.objects.create(calendar=self.calendar,
+                title="Some title",
+                start=pytz.utc.localize(datetime.datetime.combine(self.day,
+                    datetime.time(start))),
+                end=pytz.utc.localize(datetime.datetime.combine(self.day,
+                    datetime.time(end)))))
+        items = get_events_from_days([self.day], events, pytz.utc,
+            self.profile)[0]['events']
+        by_pk = {item['pk']: item for item in items}
+        return [by_pk[event.pk] for event in events]
+
+    def layout(self, items):
+        return [(item['left'], item['width']) for item in items]
+
+    def test_separate_events_take_whole_width(self):
+        items = self.items((9, 10), (10, 11), (12, 13))
+        self.assertEqual(self.layout(items), [(0, 1)] * 3)
+
+    def test_overlapping_events_share_width(self):
+        items = self.items((9, 11), (10, 12), (10, 11))
+        self.assertEqual(self.layout(items),
+            [(0, 1 / 3), (1 / 3, 1 / 3), (2 / 3, 1 / 3)])
+
+    def test_freed_columns_are_reused(self):
+        # the third event begins when the first ends, so the cluster
+        # needs only two columns
+        items = self.items((9, 11), (10, 13), (11, 12), (14, 15))
+        self.assertEqual(self.layout(items),
+            [(0, 0.5), (0.5, 0.5), (0, 0.5), (0, 1)])
+
+    def test_back_to_back_events_share_column(self):
+        items = self.items((10, 12), (10, 11), (11, 13))
+        self.assertEqual(self.layout(items),
+            [(0, 0.5), (0.5, 0.5), (0.5, 0.5)])
+
+    def test_all_day_items_are_skipped(self):
+        items = self.items((9, 11), (10, 12))
+        items[1].event.all_day = True
+        layout_day(items)
+        self.assertEqual(items[0]['width'], 1)
+
+
+class GetWeeksOfMonthTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='John')
+        self.profile = UserProfile.objects.create(user=user)
+        self.calendar = MyCalendar.objects.create(owner=self.profile,
+            name="Cindirella", color="#E81AD4")
+        self.calendar.readers.add(self.profile)
+        self.days = fill_month(datetime.date(2016, 12, 13))
+
+    def create_event(self, first_day, last_day):
+        return Event.objects.create(calendar=self.calendar,
+            title="Some title",
+            start=pytz.utc.localize(datetime.datetime(2016, 12, first_day, 9)),
+            end=pytz.utc.localize(datetime.datetime(2016, 12, last_day, 10)))
+
+    def get_weeks(self, events):
+        return get_weeks_of_month(get_events_from_days(self.days, events,
+            pytz.utc, self.profile))
+
+    def segments(self, week):
+        return [(segment['event'].pk, segment['column'], segment['span'],
+            segment['lane']) for segment in week['segments']]
+
+    def test_weeks_of_days(self):
+        weeks = self.get_weeks([])
+        self.assertEqual(len(weeks), 5)
+        self.assertEqual([dict_['day'] for dict_ in weeks[1]['days']],
+            self.days[7:14])
+        self.assertEqual(weeks[1]['lanes'], [])
+
+    def test_event_spans_its_days_once_per_week(self):
+        # from Thursday to Tuesday of the next week
+        event = self.create_event(8, 13)
+        weeks = self.get_weeks([event])
+        self.assertEqual(self.segments(weeks[1]), [(event.pk, 3, 4, 0)])
+        self.assertEqual(self.segments(weeks[2]), [(event.pk, 0, 2, 0)])
+
+    def test_overlapping_events_in_lanes(self):
+        long_ = self.create_event(13, 16)
+        short = self.create_event(14, 14)
+        later = self.create_event(17, 18)
+        segments = self.segments(self.get_weeks([long_, short, later])[2])
+        self.assertEqual(segments, [(long_.pk, 1, 4, 0),
+            (short.pk, 2, 1, 1), (later.pk, 5, 2, 0)])
+
+    def test_lanes_fill_the_week(self):
+        first = self.create_event(13, 14)
+        second = self.create_event(14, 14)
+        lanes = self.get_weeks([first, second])[2]['lanes']
+        self.assertEqual([[cell['span'] for cell in lane] for lane in lanes],
+            [[1, 2, 1, 1, 1, 1], [1, 1, 1, 1, 1, 1, 1]])
+        self.assertEqual([bool(cell['event']) for cell in lanes[1]],
+            [False, False, True, False, False, False, False])
+
+
+class GetPageOfEventsTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='John')
+        profile = UserProfile.objects.create(user=user)
+        self.calendar = MyCalendar.objects.create(owner=profile,
+            name="Cindirella", color="#E81AD4")
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 15, 12))
+        # pairs of events beginning at the same time
+        self.events = [Event.objects.create(calendar=self.calendar,
+            title='Event {}'.format(i),
+            start=start + datetime.timedelta(days=i // 2),
+            end=start + datetime.timedelta(days=i // 2, hours=1))
+            for i in range(7)]
+        self.queryset = Event.objects.filter(calendar=self.calendar)
+
+    def test_first_page(self):
+        page = get_page_of_events(self.queryset, per_page=3)
+        self.assertEqual(page['events'], self.events[:3])
+        self.assertIsNone(page['older'])
+        self.assertEqual(page['newer'], encode_cursor(self.events[2]))
+
+    def test_walks_forward_and_back_through_equal_starts(self):
+        pages = []
+        page = get_page_of_events(self.queryset, per_page=3)
+        while True:
+            pages.append(page['events'])
+            if page['newer'] is None:
+                break
+            page = get_page_of_events(self.queryset, newer=page['newer'],
+                per_page=3)
+        self.assertEqual(pages, [self.events[:3], self.events[3:6],
+            self.events[6:]])
+        page = get_page_of_events(self.queryset, older=page['older'],
+            per_page=3)
+        self.assertEqual(page['events'], self.events[3:6])
+        self.assertEqual(page['newer'], encode_cursor(self.events[5]))
+        page = get_page_of_events(self.queryset, older=page['older'],
+            per_page=3)
+        self.assertEqual(page['events'], self.events[:3])
+        self.assertIsNone(page['older'])
+
+    def test_first_page_since(self):
+        since = self.events[2].start
+        page = get_page_of_events(self.queryset, since=since, per_page=3)
+        self.assertEqual(page['events'], self.events[2:5])
+        page = get_page_of_events(self.queryset, older=page['older'],
+            per_page=3)
+        self.assertEqual(page['events'], self.events[:2])
+        self.assertIsNone(page['older'])
+        page = get_page_of_events(self.queryset,
+            since=self.events[0].start, per_page=3)
+        self.assertIsNone(page['older'])
+
+    def test_nothing_since(self):
+        since = self.events[-1].start + datetime.timedelta(days=1)
+        page = get_page_of_events(self.queryset, since=since, per_page=3)
+        self.assertEqual(page['events'], [])
+        self.assertIsNone(page['newer'])
+        page = get_page_of_events(self.queryset, older=page['older'],
+            per_page=3)
+        self.assertEqual(page['events'], self.events[4:])
+
+    def test_cursor(self):
+        event = self.events[3]
+        self.assertEqual(decode_cursor(encode_cursor(event)),
+            (event.start, event.pk))
+        with self.assertRaises(ValueError):
+            decode_cursor('20170315_1')
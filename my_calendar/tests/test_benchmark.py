@@ -0,0 +1,27 @@
+import json
+
+from django.test import TestCase
+
+from my_calendar import benchmark
+
+
+class BenchmarkTest(TestCase):
+
+    def test_measures_every_view_on_every_dataset(self):
+        results = benchmark.run([20, 40], [1, 3], repeats=1)
+        json.dumps(results)
+        self.assertEqual(len(results['results']), 4 * len(benchmark.VIEWS))
+        for result in results['results']:
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['peak_memory_kb'], 0)
+        self.assertEqual(
+            set((result['events'], result['calendars'])
+                for result in results['results']),
+            {(20, 1), (18, 3), (40, 1), (39, 3)})
+
+    def test_dataset_calendars_are_shared_with_the_first_user(self):
+        benchmark.clear_data()
+        benchmark.generate(benchmark.dataset_options(30, 3))
+        profile = benchmark.UserProfile.objects.order_by('pk').first()
+        self.assertEqual(len(profile.accessible_calendars_ids), 3)
@@ -0,0 +1,123 @@
+import datetime
+import pytz
+from unittest import mock
+
+from django.contrib.auth import get_user
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from my_calendar.views import month
+from my_calendar.models import UserProfile, MyCalendar, Event, Guest
+from my_calendar.timeline_cache import get_cache
+from .test_views_base import BaseViewTest
+
+
+class ConditionalGetTest(BaseViewTest):
+
+    def setUp(self):
+        self.user_registers()
+        self.profile = UserProfile.objects.get(user=get_user(self.client))
+        self.calendar = MyCalendar.objects.create(owner=self.profile,
+            name='Work', color='#000FFF')
+        self.calendar.readers.add(self.profile)
+        self.calendar.modifiers.add(self.profile)
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 15, 12))
+        self.event = Event.objects.create(calendar=self.calendar,
+            title='Meeting', start=start,
+            end=start + datetime.timedelta(hours=1))
+        self.other = UserProfile.objects.create(
+            user=User.objects.create(username='other'))
+        self.url = '/month/2017-03-15'
+        self.template = 'my_calendar/month.html'
+        self.function = month
+
+    def get_again(self, url):
+        """
+        Requests url with ETag of the previous response.
+        """
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified_pages(self):
+        urls = ['/month/2017-03-15', '/week/2017-03-15', '/day/2017-03-15',
+            '/calendar/{}'.format(self.calendar.pk),
+            '/event/{}'.format(self.event.pk)]
+        for url in urls:
+            response = self.get_again(url)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_changed_event_modifies_pages(self):
+        urls = ['/month/2017-03-15', '/calendar/{}'.format(self.calendar.pk),
+            '/event/{}'.format(self.event.pk)]
+        for url in urls:
+            etag = self.client.get(url)['ETag']
+            self.event.title = 'Lunch {}'.format(url)
+            self.event.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_new_guest_modifies_event_page(self):
+        url = '/event/{}'.format(self.event.pk)
+        etag = self.client.get(url)['ETag']
+        Guest.objects.create(event=self.event, user=self.other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_sharing_modifies_calendar_page(self):
+        url = '/calendar/{}'.format(self.calendar.pk)
+        etag = self.client.get(url)['ETag']
+        self.calendar.readers.add(self.other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_timeline_etag_is_read_from_database(self):
+        url = '/month/2017-03-15'
+        etag = self.client.get(url)['ETag']
+        # as saved by another process, which can't reach this cache
+        get_cache().clear()
+        MyCalendar.objects.filter(pk=self.calendar.pk).update(
+            updated_at=self.calendar.updated_at + datetime.timedelta(
+                seconds=1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_again(url).status_code, 304)
+        get_cache().clear()
+        self.assertEqual(self.get_again(url).status_code, 304)
+
+    def test_calendar_page_changes_with_date(self):
+        url = '/calendar/{}'.format(self.calendar.pk)
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        later = timezone.now() + datetime.timedelta(days=2)
+        with mock.patch('my_calendar.models.now', return_value=later):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_users_do_not_modify_pages(self):
+        urls = ['/calendar/{}'.format(self.calendar.pk),
+            '/event/{}'.format(self.event.pk)]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        other_calendar = MyCalendar.objects.create(owner=self.other,
+            name='Home', color='#FFF000')
+        Guest.objects.create(user=self.other, event=Event.objects.create(
+            calendar=other_calendar, title='Lunch', start=self.event.start,
+            end=self.event.end))
+        UserProfile.objects.create(user=User.objects.create(username='new'))
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_pages_differ_between_users(self):
+        url = '/month/2017-03-15'
+        etag = self.client.get(url)['ETag']
+        self.client.logout()
+        self.user_registers(username='Jane')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_last_modified_of_event_page(self):
+        url = '/event/{}'.format(self.event.pk)
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
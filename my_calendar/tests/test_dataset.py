@@ -0,0 +1,66 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from my_calendar.models import UserProfile, MyCalendar, Event, Guest
+from my_calendar.dataset import Options, generate
+
+
+class GenerateDatasetTest(TestCase):
+
+    def test_creates_requested_amounts(self):
+        counts = generate(Options(users=5, calendars_per_user=2,
+            readers_per_calendar=2, modifiers_per_calendar=1,
+            events_per_calendar=30, batch_size=7))
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(UserProfile.objects.count(), 5)
+        self.assertEqual(MyCalendar.objects.count(), 10)
+        self.assertEqual(Event.objects.count(), 300)
+        self.assertEqual(counts['events'], 300)
+        self.assertEqual(Guest.objects.count(), counts['guests'])
+        for calendar in MyCalendar.objects.all():
+            self.assertEqual(calendar.readers.count(), 3)
+            self.assertEqual(calendar.modifiers.count(), 2)
+            self.assertIn(calendar.owner, calendar.modifiers.all())
+
+    def test_events_are_valid(self):
+        generate(Options(users=3, events_per_calendar=50, recurring_ratio=0.3))
+        for event in Event.objects.all():
+            event.full_clean()
+            self.assertTrue(event.end > event.start)
+            self.assertEqual(event.series_end, event.get_series_end())
+        self.assertTrue(Event.objects.filter(all_day=True).exists())
+        self.assertTrue(Event.objects.exclude(recurrence=Event.NEVER).exists())
+
+    def test_same_seed_gives_same_data(self):
+        fields = ('title', 'start', 'end', 'calendar_id')
+        generate(Options(users=3, events_per_calendar=10, seed=7))
+        first = list(Event.objects.order_by('pk').values_list(*fields))
+        Event.objects.all().delete()
+        generate(Options(users=3, events_per_calendar=10, seed=7,
+            username_prefix='again'))
+        second = list(Event.objects.order_by('pk').values_list(*fields))
+        self.assertEqual([event[:3] for event in first],
+            [event[:3] for event in second])
+
+    def test_new_objects_can_be_saved_after_generation(self):
+        generate(Options(users=2, events_per_calendar=3))
+        calendar = MyCalendar.objects.first()
+        event = Event.objects.create(calendar=calendar, title='New',
+            start=calendar.event_set.first().start,
+            end=calendar.event_set.first().end)
+        self.assertEqual(event.pk, Event.objects.count())
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('generate_dataset', users=2, events_per_calendar=5,
+            stdout=out)
+        self.assertIn("20 events", out.getvalue())
+
+    def test_batches_bigger_than_database_limits(self):
+        # SQLite accepts at most 999 parameters in a single insert
+        counts = generate(Options(users=2, events_per_calendar=300,
+            batch_size=1000))
+        self.assertEqual(counts['events'], 1200)
@@ -6,7 +6,8 @@ from django.contrib.auth import get_user
 from django.test import TestCase
 
 from my_calendar.models import (UserProfile, MyCalendar, Event, Guest,
-    END_BEFORE_START_ERROR)
+    END_BEFORE_START_ERROR, RECURRENCE_INTERVAL_ERROR, RECURRENCE_UNTIL_ERROR,
+    RECURRENCE_COUNT_ERROR)
 from my_calendar.forms import (
     RegisterForm, EventForm, GuestForm, ProfileForm, CalendarForm,
     AttendingStatusForm,
@@ -80,6 +81,26 @@ class CalendarFormTest(TestCase):
         self.assertEqual(list(form.fields['readers'].queryset), without_owner)
         self.assertEqual(list(form.fields['modifiers'].queryset), without_owner)
 
+    def test_renders_only_chosen_users(self):
+        profiles = []
+        for i in range(3):
+            user = User.objects.create(username='user{}'.format(i),
+                first_name='Name{}'.format(i))
+            profiles.append(UserProfile.objects.create(user=user))
+        calendar = MyCalendar.objects.create(owner=profiles[0],
+            name="Cindirella", color="#E81AD4")
+        calendar.readers.add(profiles[1])
+        form = CalendarForm(owner=profiles[0], instance=calendar)
+        # chosen users of each field and their names
+        with self.assertNumQueries(3):
+            readers = str(form['readers'])
+            modifiers = str(form['modifiers'])
+        self.assertIn('class="user-autocomplete"', readers)
+        self.assertIn('data-url="/users.json"', readers)
+        self.assertIn('Name1', readers)
+        self.assertNotIn('Name2', readers)
+        self.assertNotIn('<option', modifiers)
+
 
 class EventFormTest(TestCase):
 
@@ -202,6 +223,51 @@ class EventFormTest(TestCase):
         self.assertFalse(form.is_valid(user=self.profile))
         self.assertIn(WRONG_TIMEZONE_ERROR, form.errors['timezone'])
 
+    def test_saves_recurrence(self):
+        form = EventForm(data={
+            'calendar': 1,
+            'title': 'Episode 9',
+            'desc': 'Bla',
+            'all_day': False,
+            'start': '2016-12-13 15:19',
+            'end': '2016-12-13 16:13',
+            'timezone': '374',
+            'recurrence': Event.WEEKLY,
+            'recurrence_interval': '2',
+            'recurrence_count': '3',
+            'recurrence_until': '',
+        }, user=self.profile)
+        self.assertTrue(form.is_valid(user=self.profile))
+        event = form.save()
+        self.assertEqual(event.recurrence, Event.WEEKLY)
+        self.assertEqual(event.recurrence_interval, 2)
+        self.assertEqual(event.series_end,
+            event.end + datetime.timedelta(weeks=4))
+
+    def test_recurrence_interval_and_until_validated(self):
+        data = {
+            'calendar': 1,
+            'title': 'Episode 9',
+            'desc': 'Bla',
+            'all_day': False,
+            'start': '2016-12-13 15:19',
+            'end': '2016-12-13 16:13',
+            'timezone': '374',
+            'recurrence': Event.DAILY,
+            'recurrence_interval': '0',
+        }
+        form = EventForm(data=data, user=self.profile)
+        self.assertFalse(form.is_valid(user=self.profile))
+        self.assertIn(RECURRENCE_INTERVAL_ERROR, form.non_field_errors())
+        data.update(recurrence_interval='1', recurrence_until='2016-12-01')
+        form = EventForm(data=data, user=self.profile)
+        self.assertFalse(form.is_valid(user=self.profile))
+        self.assertIn(RECURRENCE_UNTIL_ERROR, form.non_field_errors())
+        data.update(recurrence_until='', recurrence_count='0')
+        form = EventForm(data=data, user=self.profile)
+        self.assertFalse(form.is_valid(user=self.profile))
+        self.assertIn(RECURRENCE_COUNT_ERROR, form.non_field_errors())
+
 
 class GuestFormTest(TestCase):
 
@@ -233,6 +299,11 @@ class GuestFormTest(TestCase):
         self.assertFalse(form.is_valid())
         self.assertIn(DUPLICATE_GUEST_ERROR, form.errors['user'])
 
+    def test_renders_only_chosen_user(self):
+        self.assertNotIn('<option', str(GuestForm(event=self.event)['user']))
+        form = GuestForm(event=self.event, data={'user': 1})
+        self.assertIn('<option value="1" selected="selected">', str(form['user']))
+
     def test_no_event_raise_error(self):
         with self.assertRaises(TypeError):
             form = GuestForm(data={'user': 1})
@@ -0,0 +1,356 @@
+import datetime
+import io
+import pytz
+import tempfile
+
+from django.contrib.auth import get_user
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from my_calendar.models import (UserProfile, MyCalendar, Event,
+    EventException, Guest, EventVisibility, END_BEFORE_START_ERROR,
+    RECURRENCE_COUNT_ERROR)
+from my_calendar.additional_functions import get_events_from_days
+from my_calendar.forms import NOT_UTF8_FILE_ERROR
+from my_calendar.ics import (fold, escape_text, export_events, import_events,
+    UNKNOWN_TIMEZONE_ERROR, UNSUPPORTED_RECURRENCE_ERROR)
+
+
+class FormattingTest(TestCase):
+
+    def test_escapes_text(self):
+        self.assertEqual(escape_text('a;b,c\\d\ne'), 'a\\;b\\,c\\\\d\\ne')
+
+    def test_folds_long_lines(self):
+        line = 'DESCRIPTION:' + 'ą' * 100
+        folded = fold(line)
+        self.assertTrue(folded.endswith('\r\n'))
+        parts = folded[:-2].split('\r\n')
+        for part in parts:
+            self.assertLessEqual(len(part.encode('utf-8')), 75)
+        self.assertEqual(''.join(part[1:] if i else part
+            for i, part in enumerate(parts)), line)
+
+
+class IcsTestCase(TestCase):
+
+    def setUp(self):
+        self.client.post(
+            '/register', data={
+                'username': 'John123',
+                'password': 'password',
+                'email': 'example@email.com',
+                'first_name': 'John',
+                'last_name': 'Doe',
+                'timezone': '374',
+        })
+        self.profile = UserProfile.objects.get(user=get_user(self.client))
+        self.calendar = MyCalendar.objects.create(owner=self.profile,
+            name='Work', color='#000FFF')
+        self.calendar.readers.add(self.profile)
+        self.warsaw = next(number for number, name in Event.TIMEZONES
+            if name == 'Europe/Warsaw')
+
+    def create_event(self, **kwargs):
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 15, 12))
+        data = {
+            'calendar': self.calendar,
+            'title': 'Meeting',
+            'start': start,
+            'end': start + datetime.timedelta(hours=1),
+            'timezone': self.warsaw,
+        }
+        data.update(kwargs)
+        return Event.objects.create(**data)
+
+    def export(self, events=None):
+        if events is None:
+            events = Event.objects.all()
+        return ''.join(export_events(events, batch_size=2))
+
+
+class ExportTest(IcsTestCase):
+
+    def test_exports_event_in_its_timezone(self):
+        event = self.create_event(desc='Room 1, floor 2')
+        ics = self.export()
+        self.assertTrue(ics.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(ics.endswith('END:VCALENDAR\r\n'))
+        self.assertIn('UID:event-{}@my_calendar\r\n'.format(event.pk), ics)
+        self.assertIn('DTSTART;TZID=Europe/Warsaw:20170315T130000\r\n', ics)
+        self.assertIn('DTEND;TZID=Europe/Warsaw:20170315T140000\r\n', ics)
+        self.assertIn('DESCRIPTION:Room 1\\, floor 2\r\n', ics)
+
+    def test_exports_all_day_event_as_dates(self):
+        self.create_event(all_day=True)
+        ics = self.export()
+        self.assertIn('DTSTART;VALUE=DATE:20170315\r\n', ics)
+        self.assertIn('DTEND;VALUE=DATE:20170316\r\n', ics)
+        self.assertNotIn('BEGIN:VTIMEZONE', ics)
+
+    def test_defines_timezones_of_events(self):
+        self.create_event()
+        self.create_event(title='Later')
+        utc = next(number for number, name in Event.TIMEZONES
+            if name == 'UTC')
+        self.create_event(title='In UTC', timezone=utc)
+        ics = self.export()
+        self.assertEqual(ics.count('BEGIN:VTIMEZONE'), 1)
+        timezone = ics[ics.index('BEGIN:VTIMEZONE'):ics.index('BEGIN:VEVENT')]
+        self.assertTrue(timezone.startswith(
+            'BEGIN:VTIMEZONE\r\nTZID:Europe/Warsaw\r\n'
+            # the offset in force at the beginning of the first event
+            'BEGIN:STANDARD\r\nDTSTART:20161030T030000\r\n'
+            'TZOFFSETFROM:+0200\r\nTZOFFSETTO:+0100\r\nTZNAME:CET\r\n'
+            'END:STANDARD\r\n'
+            'BEGIN:DAYLIGHT\r\nDTSTART:20170326T020000\r\n'
+            'TZOFFSETFROM:+0100\r\nTZOFFSETTO:+0200\r\nTZNAME:CEST\r\n'
+            'END:DAYLIGHT\r\n'))
+        self.assertTrue(timezone.endswith('END:VTIMEZONE\r\n'))
+        self.assertIn('DTSTART:20170315T120000Z\r\n', ics)
+
+    def test_exports_recurrence_and_removed_occurrences(self):
+        event = self.create_event(recurrence=Event.WEEKLY,
+            recurrence_interval=2, recurrence_until=datetime.date(2017, 5, 1))
+        EventException.objects.create(event=event,
+            date=datetime.date(2017, 3, 29))
+        ics = self.export()
+        self.assertIn(
+            'RRULE:FREQ=WEEKLY;INTERVAL=2;UNTIL=20170501T215959Z\r\n', ics)
+        self.assertIn('EXDATE;TZID=Europe/Warsaw:20170329T130000\r\n', ics)
+
+    def test_exports_all_events_in_batches(self):
+        for i in range(5):
+            self.create_event(title='Event {}'.format(i))
+        ics = self.export()
+        self.assertEqual(ics.count('BEGIN:VEVENT'), 5)
+        for i in range(5):
+            self.assertIn('SUMMARY:Event {}\r\n'.format(i), ics)
+
+    def test_calendar_export_view(self):
+        self.create_event()
+        response = self.client.get(
+            '/calendar/{}/export.ics'.format(self.calendar.pk))
+        self.assertEqual(response['Content-Type'],
+            'text/calendar; charset=utf-8')
+        ics = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('X-WR-CALNAME:Work\r\n', ics)
+        self.assertIn('SUMMARY:Meeting\r\n', ics)
+
+    def test_calendar_export_denied_without_access(self):
+        other = UserProfile.objects.create(
+            user=User.objects.create(username='other'))
+        calendar = MyCalendar.objects.create(owner=other, name='Private',
+            color='#000FFF')
+        response = self.client.get('/calendar/{}/export.ics'.format(calendar.pk))
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_of_all_user_events(self):
+        self.create_event()
+        other = UserProfile.objects.create(
+            user=User.objects.create(username='other'))
+        calendar = MyCalendar.objects.create(owner=other, name='Private',
+            color='#000FFF')
+        invited = self.create_event(calendar=calendar, title='Party')
+        self.create_event(calendar=calendar, title='Secret')
+        Guest.objects.create(event=invited, user=self.profile)
+        response = self.client.get('/export.ics')
+        ics = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('SUMMARY:Meeting\r\n', ics)
+        self.assertIn('SUMMARY:Party\r\n', ics)
+        self.assertNotIn('Secret', ics)
+
+
+ICS = '''BEGIN:VCALENDAR\r
+VERSION:2.0\r
+BEGIN:VTIMEZONE\r
+TZID:Europe/Warsaw\r
+BEGIN:STANDARD\r
+DTSTART:19701025T030000\r
+END:STANDARD\r
+END:VTIMEZONE\r
+BEGIN:VEVENT\r
+UID:1@example.com\r
+DTSTART;TZID=Europe/Warsaw:20170315T130000\r
+DTEND;TZID=Europe/Warsaw:20170315T140000\r
+SUMMARY:Meeting\\, first\r
+DESCRIPTION:Long description that is folded because it is longer than seven\r
+ ty five octets\r
+BEGIN:VALARM\r
+TRIGGER:-PT15M\r
+DESCRIPTION:Reminder\r
+END:VALARM\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+DTSTART;VALUE=DATE:20170320\r
+DTEND;VALUE=DATE:20170322\r
+SUMMARY:Trip\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+DTSTART:20170316T100000Z\r
+DURATION:PT30M\r
+SUMMARY:Standup\r
+RRULE:FREQ=DAILY;COUNT=5\r
+EXDATE:20170317T100000Z\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+DTSTART:20170316T100000Z\r
+DTEND:20170315T100000Z\r
+SUMMARY:Backwards\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+DTSTART;TZID=Mars/Olympus:20170316T100000\r
+SUMMARY:Far away\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+DTSTART:20170316T100000Z\r
+SUMMARY:Every monday\r
+RRULE:FREQ=WEEKLY;BYDAY=MO\r
+END:VEVENT\r
+END:VCALENDAR\r
+'''
+
+
+class ImportTest(IcsTestCase):
+
+    def import_lines(self, text=ICS, **kwargs):
+        return import_events(text.splitlines(True), self.calendar, **kwargs)
+
+    def test_imports_events(self):
+        result = self.import_lines(batch_size=2)
+        self.assertEqual(result.created, 3)
+        meeting = Event.objects.get(title='Meeting, first')
+        self.assertEqual(meeting.get_timezone_display(), 'Europe/Warsaw')
+        self.assertEqual(meeting.start,
+            pytz.utc.localize(datetime.datetime(2017, 3, 15, 12)))
+        self.assertEqual(meeting.desc, 'Long description that is folded '
+            'because it is longer than seventy five octets')
+        trip = Event.objects.get(title='Trip')
+        self.assertTrue(trip.all_day)
+        # dates without timezone are in the default one
+        self.assertEqual(trip.start.date(), datetime.date(2017, 3, 20))
+        self.assertEqual(trip.end.date(), datetime.date(2017, 3, 21))
+        days = get_events_from_days([datetime.date(2017, 3, day)
+            for day in range(19, 23)], [trip], pytz.utc, self.profile)
+        self.assertEqual([len(day['events']) for day in days], [0, 1, 1, 0])
+        standup = Event.objects.get(title='Standup')
+        self.assertEqual(standup.recurrence, Event.DAILY)
+        self.assertEqual(standup.end - standup.start,
+            datetime.timedelta(minutes=30))
+        self.assertEqual(len(list(standup.get_occurrences())), 4)
+        self.assertEqual(standup.series_end, pytz.utc.localize(
+            datetime.datetime(2017, 3, 20, 10, 30)))
+
+    def test_reports_errors_of_skipped_events(self):
+        result = self.import_lines()
+        self.assertEqual([(summary, messages[0])
+            for line, summary, messages in result.errors], [
+            ('Backwards', END_BEFORE_START_ERROR),
+            ('Far away', UNKNOWN_TIMEZONE_ERROR.format('Mars/Olympus')),
+            ('Every monday', UNSUPPORTED_RECURRENCE_ERROR.format(
+                'FREQ=WEEKLY;BYDAY=MO')),
+        ])
+        self.assertEqual(result.errors[0][0], 33)
+
+    def test_skips_recurrence_without_occurrences(self):
+        event = ICS[ICS.index('BEGIN:VEVENT\r\nDTSTART:20170316T100000Z'):]
+        event = event[:event.index('END:VEVENT') + len('END:VEVENT\r\n')]
+        text = ('BEGIN:VCALENDAR\r\n'
+            + event.replace('COUNT=5', 'COUNT=0') + 'END:VCALENDAR\r\n')
+        result = self.import_lines(text)
+        self.assertEqual(result.created, 0)
+        self.assertEqual([(summary, messages[0])
+            for line, summary, messages in result.errors],
+            [('Standup', RECURRENCE_COUNT_ERROR)])
+
+    def test_exported_events_are_imported_back(self):
+        event = self.create_event(desc='Room 1; floor 2',
+            recurrence=Event.MONTHLY, recurrence_count=3)
+        EventException.objects.create(event=event,
+            date=datetime.date(2017, 4, 15))
+        self.create_event(title='Trip', all_day=True)
+        result = self.import_lines(self.export())
+        self.assertEqual(result.created, 2)
+        copy = Event.objects.exclude(pk=event.pk).get(title='Meeting')
+        for field in ('start', 'end', 'desc', 'timezone', 'recurrence',
+                'recurrence_interval', 'recurrence_count', 'series_end'):
+            self.assertEqual(getattr(copy, field), getattr(event, field))
+        self.assertEqual(list(copy.exceptions.values_list('date', flat=True)),
+            [datetime.date(2017, 4, 15)])
+        trips = Event.objects.filter(title='Trip').order_by('pk')
+        warsaw = pytz.timezone('Europe/Warsaw')
+        for field in ('start', 'end'):
+            # imported into the default timezone
+            self.assertEqual(getattr(trips[1], field).date(),
+                getattr(trips[0], field).astimezone(warsaw).date())
+
+    def test_import_view(self):
+        self.calendar.modifiers.add(self.profile)
+        upload = SimpleUploadedFile('events.ics', ICS.encode('utf-8'))
+        response = self.client.post(
+            '/calendar/{}/import'.format(self.calendar.pk), {'file': upload})
+        self.assertTemplateUsed(response, 'my_calendar/import.html')
+        self.assertEqual(response.context['result'].created, 3)
+        self.assertEqual(Event.objects.filter(calendar=self.calendar).count(), 3)
+
+    def test_file_read_partly_is_not_imported(self):
+        lines = ICS.encode('utf-8').splitlines(True)
+        # the last event can't be decoded, after earlier batches were saved
+        lines.insert(-2, 'DESCRIPTION:zażółć\r\n'.encode('iso-8859-2'))
+        with self.assertRaises(UnicodeDecodeError):
+            import_events(lines, self.calendar, batch_size=1)
+        self.assertFalse(Event.objects.filter(calendar=self.calendar).exists())
+
+    def test_import_view_reports_file_read_partly(self):
+        self.calendar.modifiers.add(self.profile)
+        upload = SimpleUploadedFile('events.ics',
+            ICS.encode('utf-8').replace(b'Every monday', b'\xff'))
+        response = self.client.post(
+            '/calendar/{}/import'.format(self.calendar.pk), {'file': upload})
+        self.assertIn(NOT_UTF8_FILE_ERROR,
+            response.context['import_form'].errors['file'])
+        self.assertNotIn('result', response.context)
+        self.assertFalse(Event.objects.filter(calendar=self.calendar).exists())
+
+    def test_import_view_denied_without_access(self):
+        response = self.client.get(
+            '/calendar/{}/import'.format(self.calendar.pk))
+        self.assertIn('access_denied', response.context)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ics',
+                encoding='utf-8') as file_:
+            file_.write(ICS)
+            file_.flush()
+            out = io.StringIO()
+            call_command('import_ics', str(self.calendar.pk), file_.name,
+                batch_size=2, stdout=out, stderr=io.StringIO())
+        self.assertIn("Imported 3 events, skipped 3.", out.getvalue())
+
+    @override_settings(EVENT_VISIBILITY_INDEX=True)
+    def test_imported_events_are_visible_in_index(self):
+        self.import_lines()
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 1))
+        events = self.profile.get_events_between(start,
+            start + datetime.timedelta(days=31))
+        self.assertEqual(events.count(), 3)
+
+    @override_settings(EVENT_VISIBILITY_INDEX=True)
+    def test_import_adds_rows_only_of_new_events(self):
+        existing = self.create_event()
+        rows = set(EventVisibility.objects.filter(
+            event=existing).values_list('pk', flat=True))
+        self.import_lines(batch_size=2)
+        self.assertEqual(set(EventVisibility.objects.filter(
+            event=existing).values_list('pk', flat=True)), rows)
+        for event in Event.objects.exclude(pk=existing.pk):
+            self.assertEqual(EventVisibility.objects.filter(
+                event=event).count(), len(rows))
+
+    def test_imports_batches_bigger_than_database_limits(self):
+        event = ICS[ICS.index('BEGIN:VEVENT'):ICS.index('BEGIN:VEVENT', 200)]
+        text = 'BEGIN:VCALENDAR\r\n' + event * 300 + 'END:VCALENDAR\r\n'
+        result = self.import_lines(text, batch_size=1000)
+        self.assertEqual(result.created, 300)
@@ -1,12 +1,17 @@
 import datetime
+import itertools
 import pytz
+import unittest
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 
-from my_calendar.models import (UserProfile, MyCalendar, Event, Guest)
+from my_calendar.models import (UserProfile, MyCalendar, Event, Guest,
+    EventException, FOREVER)
 
 
 class UserProfileTest(TestCase):
@@ -22,6 +27,173 @@ class UserProfileTest(TestCase):
         self.assertEqual(profile.get_timezone_display(), 'UTC')
 
 
+class UserProfileEventsTest(TestCase):
+
+    def setUp(self):
+        self.profile = UserProfile.objects.create(
+            user=User.objects.create(username='John'))
+        owner = UserProfile.objects.create(
+            user=User.objects.create(username='Owner'))
+        self.calendar = MyCalendar.objects.create(owner=owner,
+            name="Cindirella", color="#E81AD4")
+        self.start = pytz.utc.localize(datetime.datetime(2016, 12, 13, 12))
+        self.end = self.start + datetime.timedelta(days=1)
+
+    def create_event(self, start, end, calendar=None):
+        return Event.objects.create(calendar=calendar or self.calendar,
+            title="Some title", start=start, end=end)
+
+    def test_events_between_from_readable_and_modifiable_calendars(self):
+        event = self.create_event(self.start, self.end)
+        self.assertNotIn(event, self.profile.get_events_between(
+            self.start, self.end))
+        self.calendar.readers.add(self.profile)
+        self.assertIn(event, self.profile.get_events_between(
+            self.start, self.end))
+        self.calendar.readers.remove(self.profile)
+        self.calendar.modifiers.add(self.profile)
+        self.assertIn(event, self.profile.get_events_between(
+            self.start, self.end))
+
+    def test_events_between_contains_events_user_is_invited_to(self):
+        event = self.create_event(self.start, self.end)
+        Guest.objects.create(event=event, user=self.profile)
+        self.assertIn(event, self.profile.get_events_between(
+            self.start, self.end))
+
+    def test_events_between_returns_only_overlapping_events(self):
+        self.calendar.readers.add(self.profile)
+        hour = datetime.timedelta(hours=1)
+        before = self.create_event(self.start - 2 * hour, self.start)
+        overlapping = self.create_event(self.start - hour, self.start + hour)
+        long_one = self.create_event(self.start - hour, self.end + hour)
+        after = self.create_event(self.end, self.end + hour)
+        events = self.profile.get_events_between(self.start, self.end)
+        self.assertEqual(set(events), {overlapping, long_one})
+
+    def test_events_between_contains_series_overlapping_range(self):
+        self.calendar.readers.add(self.profile)
+        week = datetime.timedelta(weeks=1)
+        hour = datetime.timedelta(hours=1)
+        ended = self.create_event(self.start - 3 * week,
+            self.start - 3 * week + hour)
+        ended.recurrence = Event.WEEKLY
+        ended.recurrence_count = 2
+        ended.save()
+        lasting = self.create_event(self.start - 3 * week,
+            self.start - 3 * week + hour)
+        lasting.recurrence = Event.WEEKLY
+        lasting.recurrence_count = 5
+        lasting.save()
+        endless = self.create_event(self.start - 3 * week,
+            self.start - 3 * week + hour)
+        endless.recurrence = Event.DAILY
+        endless.save()
+        self.assertEqual(endless.series_end, FOREVER)
+        events = self.profile.get_events_between(self.start, self.end)
+        self.assertEqual(set(events), {lasting, endless})
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "plan of SQLite")
+    def test_events_between_bounded_by_range_indexes(self):
+        self.calendar.readers.add(self.profile)
+        with CaptureQueriesContext(connection) as context:
+            list(self.profile.get_events_between(self.start, self.end))
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN '
+                + context.captured_queries[-1]['sql'])
+            plan = [str(row[-1]) for row in cursor.fetchall()]
+        searches = [row for row in plan
+            if row.startswith('SEARCH my_calendar_event USING INDEX')]
+        self.assertTrue(any('AND end>?' in row for row in searches))
+        self.assertTrue(any('AND series_end>?' in row for row in searches))
+        for row in searches:
+            self.assertIn('recurrence=?', row)
+
+    def test_events_between_without_duplicates(self):
+        self.calendar.readers.add(self.profile)
+        self.calendar.modifiers.add(self.profile)
+        event = self.create_event(self.start, self.end)
+        Guest.objects.create(event=event, user=self.profile)
+        events = self.profile.get_events_between(self.start, self.end)
+        self.assertEqual(list(events), [event])
+
+    def test_can_read_event(self):
+        event = self.create_event(self.start, self.end)
+        self.assertFalse(self.profile.can_read_event(event))
+        self.calendar.readers.add(self.profile)
+        self.assertTrue(self.profile.can_read_event(event))
+        self.calendar.readers.remove(self.profile)
+        Guest.objects.create(event=event, user=self.profile)
+        self.assertTrue(self.profile.can_read_event(event))
+
+    def test_can_read_event_with_single_query(self):
+        event = self.create_event(self.start, self.end)
+        self.calendar.modifiers.add(self.profile)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.profile.can_read_event(event))
+
+    def test_upcoming_events_are_the_nearest_ones(self):
+        self.calendar.readers.add(self.profile)
+        now = pytz.utc.localize(datetime.datetime.utcnow())
+        hour = datetime.timedelta(hours=1)
+        past = self.create_event(now - 2 * hour, now - hour)
+        events = [self.create_event(now + i * hour, now + (i + 1) * hour)
+            for i in range(1, 8)]
+        upcoming = list(self.profile.get_upcoming_events(5))
+        self.assertEqual(upcoming, events[:5])
+
+    def test_all_day_event_from_today_is_upcoming(self):
+        self.calendar.readers.add(self.profile)
+        timezone = pytz.timezone(self.profile.get_timezone_display())
+        today = datetime.datetime.now(timezone).date()
+        start = timezone.localize(datetime.datetime.combine(today,
+            datetime.time(0)))
+        event = Event.objects.create(calendar=self.calendar, title="Today",
+            start=start, end=start, all_day=True)
+        not_all_day = Event.objects.create(calendar=self.calendar,
+            title="Today", start=start, end=start, all_day=False)
+        upcoming = self.profile.get_upcoming_events(5)
+        self.assertIn(event, upcoming)
+        self.assertNotIn(not_all_day, upcoming)
+
+
+class UserProfilePermissionsTest(TestCase):
+
+    def setUp(self):
+        self.profile = UserProfile.objects.create(
+            user=User.objects.create(username='John'))
+        owner = UserProfile.objects.create(
+            user=User.objects.create(username='Owner'))
+        self.readable = MyCalendar.objects.create(owner=owner,
+            name="Readable", color="#E81AD4")
+        self.readable.readers.add(self.profile)
+        self.modifiable = MyCalendar.objects.create(owner=owner,
+            name="Modifiable", color="#E81AD4")
+        self.modifiable.modifiers.add(self.profile)
+        self.other = MyCalendar.objects.create(owner=owner,
+            name="Other", color="#E81AD4")
+
+    def test_can_read_calendars_shared_in_any_way(self):
+        self.assertTrue(self.profile.can_read_calendar(self.readable))
+        self.assertTrue(self.profile.can_read_calendar(self.modifiable))
+        self.assertFalse(self.profile.can_read_calendar(self.other))
+
+    def test_can_modify_only_calendars_shared_to_modify(self):
+        self.assertFalse(self.profile.can_modify_calendar(self.readable))
+        self.assertTrue(self.profile.can_modify_calendar(self.modifiable))
+        self.assertFalse(self.profile.can_modify_calendar(self.other))
+
+    def test_accessible_calendars(self):
+        self.assertEqual(set(self.profile.get_accessible_calendars()),
+            {self.readable, self.modifiable})
+
+    def test_permissions_computed_once_per_profile(self):
+        with self.assertNumQueries(2):
+            for calendar in (self.readable, self.modifiable, self.other):
+                self.profile.can_read_calendar(calendar)
+                self.profile.can_modify_calendar(calendar)
+
+
 class MyCalendarTest(TestCase):
 
     def test_no_duplicates_in_readers_and_modifiers(self):
@@ -61,5 +233,116 @@ class EventTest(TestCase):
         self.assertEqual(event.get_timezone_display(), str(pytz.utc))
 
 
+class EventRecurrenceTest(TestCase):
+
+    def setUp(self):
+        profile = UserProfile.objects.create(
+            user=User.objects.create(username='John'))
+        self.profile = profile
+        self.calendar = MyCalendar.objects.create(owner=profile,
+            name="Cindirella", color="#E81AD4")
+        self.calendar.readers.add(profile)
+        self.warsaw = pytz.timezone('Europe/Warsaw')
+        warsaw_index = next(x[0] for x in Event.TIMEZONES
+            if x[1] == 'Europe/Warsaw')
+        self.start = self.warsaw.localize(datetime.datetime(2016, 10, 3, 9))
+        self.event = Event(calendar=self.calendar, title="Meeting",
+            timezone=warsaw_index, start=self.start,
+            end=self.start + datetime.timedelta(hours=1))
+
+    def local_starts(self, occurrences):
+        return [ev.start.astimezone(self.warsaw).replace(tzinfo=None)
+            for ev in occurrences]
+
+    def test_weekly_keeps_local_hour_across_time_change(self):
+        self.event.recurrence = Event.WEEKLY
+        self.event.recurrence_count = 5
+        self.event.save()
+        starts = self.local_starts(self.event.get_occurrences())
+        self.assertEqual(starts, [datetime.datetime(2016, 10, day, 9)
+            for day in (3, 10, 17, 24, 31)])
+        self.assertEqual(self.event.series_end,
+            self.warsaw.localize(datetime.datetime(2016, 10, 31, 10)))
+
+    def test_monthly_skips_months_without_the_day(self):
+        self.event.start = self.warsaw.localize(
+            datetime.datetime(2017, 1, 31, 9))
+        self.event.end = self.event.start + datetime.timedelta(hours=1)
+        self.event.recurrence = Event.MONTHLY
+        self.event.recurrence_until = datetime.date(2017, 6, 1)
+        self.event.save()
+        starts = self.local_starts(self.event.get_occurrences())
+        self.assertEqual([start.date() for start in starts],
+            [datetime.date(2017, 1, 31), datetime.date(2017, 3, 31),
+             datetime.date(2017, 5, 31)])
+
+    def test_exceptions_removed_but_counted(self):
+        self.event.recurrence = Event.DAILY
+        self.event.recurrence_count = 3
+        self.event.save()
+        EventException.objects.create(event=self.event,
+            date=datetime.date(2016, 10, 4))
+        starts = self.local_starts(self.event.get_occurrences())
+        self.assertEqual(starts, [datetime.datetime(2016, 10, 3, 9),
+            datetime.datetime(2016, 10, 5, 9)])
+
+    def test_series_without_occurrences_ends_with_event(self):
+        self.event.recurrence = Event.DAILY
+        self.event.recurrence_count = 0
+        with self.assertRaises(ValidationError):
+            self.event.full_clean()
+        self.assertEqual(self.event.get_series_end(), self.event.end)
+
+    def test_occurs_on_dates_of_occurrences(self):
+        self.assertFalse(self.event.occurs_on(datetime.date(2016, 10, 3)))
+        self.event.recurrence = Event.WEEKLY
+        self.event.recurrence_count = 5
+        self.assertTrue(self.event.occurs_on(datetime.date(2016, 10, 3)))
+        self.assertTrue(self.event.occurs_on(datetime.date(2016, 10, 31)))
+        self.assertFalse(self.event.occurs_on(datetime.date(2016, 10, 4)))
+        self.assertFalse(self.event.occurs_on(datetime.date(2016, 11, 7)))
+        self.assertFalse(self.event.occurs_on(datetime.date(2016, 9, 26)))
+
+    def test_occurrences_only_inside_range(self):
+        self.event.recurrence = Event.DAILY
+        self.event.recurrence_interval = 2
+        self.event.save()
+        range_start = self.warsaw.localize(datetime.datetime(2018, 1, 1))
+        range_end = range_start + datetime.timedelta(days=7)
+        occurrences = list(self.event.get_occurrences(range_start, range_end))
+        self.assertEqual(len(occurrences), 3)
+        for occurrence in occurrences:
+            self.assertTrue(range_start <= occurrence.start < range_end)
+            self.assertEqual(occurrence.pk, self.event.pk)
+        # skipping ahead doesn't lose any occurrence
+        all_starts = [ev.start for ev in itertools.takewhile(
+            lambda ev: ev.start < range_end, self.event.get_occurrences())]
+        self.assertEqual([ev.start for ev in occurrences],
+            [start for start in all_starts if start >= range_start])
+
+    def test_series_started_long_ago_found_in_range(self):
+        self.event.recurrence = Event.WEEKLY
+        self.event.save()
+        range_start = self.warsaw.localize(datetime.datetime(2018, 1, 1))
+        range_end = range_start + datetime.timedelta(days=7)
+        self.assertIn(self.event, self.profile.get_events_between(
+            range_start, range_end))
+        self.event.recurrence_count = 2
+        self.event.save()
+        self.assertNotIn(self.event, self.profile.get_events_between(
+            range_start, range_end))
+
+    def test_upcoming_events_contain_next_occurrences(self):
+        self.event.recurrence = Event.DAILY
+        self.event.save()
+        upcoming = self.profile.get_upcoming_events(3)
+        now = pytz.utc.localize(datetime.datetime.utcnow())
+        self.assertEqual(len(upcoming), 3)
+        for occurrence in upcoming:
+            self.assertEqual(occurrence.pk, self.event.pk)
+            self.assertGreaterEqual(occurrence.start, now)
+        self.assertLess(upcoming[0].start, now + datetime.timedelta(days=1))
+
+
 if __name__ == '__main__':
     unittest.main()
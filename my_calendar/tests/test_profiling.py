@@ -0,0 +1,53 @@
+import os
+import pstats
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from .test_views_base import register
+
+
+class ProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        register(self.client)
+        self.url = '/month/2017-03-15'
+
+    def get(self, **settings):
+        settings.setdefault('REQUEST_PROFILING_SLOW_MS', 0)
+        settings.setdefault('REQUEST_PROFILING_RATE', 0)
+        with override_settings(REQUEST_PROFILING=True,
+                REQUEST_PROFILING_DIR=self.directory, **settings):
+            self.client.handler.load_middleware()
+            try:
+                return self.client.get(self.url)
+            finally:
+                self.client.handler.load_middleware()
+
+    def test_profiles_chosen_url_names(self):
+        with self.assertLogs('my_calendar.profiling') as logs:
+            self.get(REQUEST_PROFILING_URL_NAMES=['my_calendar:month'])
+        files = os.listdir(self.directory)
+        self.assertEqual(len(files), 1)
+        self.assertIn('my_calendar-month', files[0])
+        stats = pstats.Stats(os.path.join(self.directory, files[0]))
+        self.assertTrue(any(function == 'get_events_from_days'
+            for filename, line, function in stats.stats))
+        self.assertIn('(month)', logs.output[0])
+
+    def test_profiles_fraction_of_requests(self):
+        with self.assertLogs('my_calendar.profiling'):
+            self.get(REQUEST_PROFILING_RATE=1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_skips_other_url_names(self):
+        self.get(REQUEST_PROFILING_URL_NAMES=['my_calendar:search'])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_skips_fast_requests(self):
+        self.get(REQUEST_PROFILING_URL_NAMES=['my_calendar:month'],
+            REQUEST_PROFILING_SLOW_MS=60 * 1000)
+        self.assertEqual(os.listdir(self.directory), [])
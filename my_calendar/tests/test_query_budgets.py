@@ -0,0 +1,116 @@
+import datetime
+import pytz
+
+from django.contrib.auth import get_user
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from my_calendar.models import UserProfile, MyCalendar, Event, Guest
+from my_calendar.search import uses_fts_tables
+from my_calendar.timeline_cache import get_cache
+from .test_views_base import register
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Base of tests that limit numbers of queries of views.
+    Every view is requested on a small dataset and again after the data
+    has grown, with the same budget, so queries issued per event,
+    calendar or guest make the test fail.
+    """
+
+    def setUp(self):
+        # checked once per process, not by every request
+        uses_fts_tables()
+        register(self.client)
+        self.profile = UserProfile.objects.get(user=get_user(self.client))
+        self.calendars = []
+        self.events = []
+        self.add_calendars(1)
+
+    def add_calendars(self, number, events_per_calendar=2, guests_per_event=2):
+        """
+        Adds calendars of new users, shared with the registered user,
+        with events in the shown week, some of them lasting several days.
+        """
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 15, 12))
+        for i in range(number):
+            owner = UserProfile.objects.create(user=User.objects.create(
+                username='owner{}'.format(len(self.calendars))))
+            calendar = MyCalendar.objects.create(owner=owner,
+                name='Calendar {}'.format(len(self.calendars)), color='#000FFF')
+            calendar.readers.add(owner, self.profile)
+            calendar.modifiers.add(owner, self.profile)
+            self.calendars.append(calendar)
+            for j in range(events_per_calendar):
+                event = Event.objects.create(calendar=calendar,
+                    title='Meeting {}'.format(len(self.events)),
+                    start=start + datetime.timedelta(hours=j),
+                    end=start + datetime.timedelta(days=j % 3, hours=j + 1))
+                self.events.append(event)
+                guests = [self.profile] + list(UserProfile.objects.exclude(
+                    pk=self.profile.pk)[:guests_per_event - 1])
+                for guest in guests:
+                    Guest.objects.create(event=event, user=guest)
+
+    def assertMaxQueries(self, budget, url):
+        """
+        Requests url with an empty timeline cache and checks that
+        the response was made with at most budget queries.
+        """
+        get_cache().clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(len(context), budget,
+            "{} made {} queries, budget is {}:\n{}".format(
+                url, len(context), budget, queries))
+        return response
+
+    def assertBudgetDoesNotGrow(self, budget, get_url):
+        """
+        Checks the budget on the initial data and after adding calendars,
+        events and guests. get_url is called after each step.
+        """
+        self.assertMaxQueries(budget, get_url())
+        self.add_calendars(10, events_per_calendar=5, guests_per_event=4)
+        self.assertMaxQueries(budget, get_url())
+
+
+class TimelineQueryBudgetTest(QueryBudgetTest):
+
+    def test_month(self):
+        self.assertBudgetDoesNotGrow(12, lambda: '/month/2017-03-15')
+
+    def test_week(self):
+        self.assertBudgetDoesNotGrow(12, lambda: '/week/2017-03-15')
+
+    def test_day(self):
+        self.assertBudgetDoesNotGrow(12, lambda: '/day/2017-03-15')
+
+    def test_timeline_json(self):
+        self.assertBudgetDoesNotGrow(11,
+            lambda: '/timeline.json?view=month&date=2017-03-15')
+
+
+class PagesQueryBudgetTest(QueryBudgetTest):
+
+    def test_profile(self):
+        self.assertBudgetDoesNotGrow(12, lambda: '/profile/John123')
+
+    def test_calendar_view(self):
+        self.assertBudgetDoesNotGrow(16,
+            lambda: '/calendar/{}'.format(self.calendars[-1].pk))
+
+    def test_event_view(self):
+        self.assertBudgetDoesNotGrow(14,
+            lambda: '/event/{}'.format(self.events[-1].pk))
+
+    def test_new_event(self):
+        self.assertBudgetDoesNotGrow(4, lambda: '/event/new')
+
+    def test_search(self):
+        self.assertBudgetDoesNotGrow(10, lambda: '/search/?phrase=Meeting')
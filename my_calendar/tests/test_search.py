@@ -0,0 +1,129 @@
+import datetime
+import pytz
+import unittest
+
+from django.contrib.auth import get_user
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from my_calendar.views import search
+from my_calendar.models import UserProfile, MyCalendar, Event, Guest
+from my_calendar.search import (search_events, search_calendars,
+    search_users, lookup_users, uses_fts_tables, get_missing_sqlite_names,
+    reinstall_missing, RESULTS_PER_PAGE)
+from .test_views_base import BaseViewTest
+
+
+class SearchTest(BaseViewTest):
+
+    def setUp(self):
+        self.user_registers()
+        self.profile = UserProfile.objects.get(user=get_user(self.client))
+        self.other = UserProfile.objects.create(user=User.objects.create(
+            username='jane', first_name='Jane', last_name='Meetingham'))
+        self.calendar = MyCalendar.objects.create(owner=self.profile,
+            name='Team meetings', color='#000FFF')
+        self.calendar.readers.add(self.profile)
+        self.calendar.modifiers.add(self.profile)
+        self.hidden_calendar = MyCalendar.objects.create(owner=self.other,
+            name='Secret meetings', color='#000FFF')
+        self.hidden_calendar.readers.add(self.other)
+        self.url = '/search/?phrase=meeting'
+        self.template = 'my_calendar/search.html'
+        self.function = search
+
+    def create_event(self, calendar, title, desc=''):
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 15, 12))
+        return Event.objects.create(calendar=calendar, title=title, desc=desc,
+            start=start, end=start + datetime.timedelta(hours=1))
+
+    def test_finds_words_by_prefixes(self):
+        event = self.create_event(self.calendar, 'Weekly meeting')
+        self.create_event(self.calendar, 'Lunch')
+        self.assertEqual(list(search_events(self.profile, 'MEET')), [event])
+
+    def test_all_words_must_match(self):
+        event = self.create_event(self.calendar, 'Planning',
+            desc='Meeting about the budget')
+        self.create_event(self.calendar, 'Meeting about holidays')
+        self.assertEqual(list(search_events(self.profile, 'budget meeting')),
+            [event])
+
+    def test_better_matches_first(self):
+        once = self.create_event(self.calendar, 'Lunch',
+            desc='Some words and a single meeting in a long description')
+        twice = self.create_event(self.calendar, 'Meeting', desc='Meeting')
+        self.assertEqual(list(search_events(self.profile, 'meeting')),
+            [twice, once])
+
+    def test_only_accessible_events_and_calendars(self):
+        event = self.create_event(self.calendar, 'Meeting')
+        self.create_event(self.hidden_calendar, 'Meeting')
+        invited = self.create_event(self.hidden_calendar, 'Meeting with me')
+        Guest.objects.create(event=invited, user=self.profile)
+        self.assertEqual(set(search_events(self.profile, 'meeting')),
+            {event, invited})
+        self.assertEqual(list(search_calendars(self.profile, 'meetings')),
+            [self.calendar])
+
+    def test_changes_are_searchable(self):
+        event = self.create_event(self.calendar, 'Meeting')
+        event.title = 'Lunch'
+        event.save()
+        self.assertEqual(list(search_events(self.profile, 'meeting')), [])
+        self.assertEqual(list(search_events(self.profile, 'lunch')), [event])
+        event.delete()
+        self.assertEqual(list(search_events(self.profile, 'lunch')), [])
+
+    def test_users_by_names(self):
+        self.assertEqual(list(search_users('jan')), [self.other])
+        self.assertEqual(list(search_users('meetingham')), [self.other])
+        self.assertEqual(list(search_users('john123')), [self.profile])
+
+    def test_empty_phrase(self):
+        self.create_event(self.calendar, 'Meeting')
+        self.assertEqual(list(search_events(self.profile, ' "* ')), [])
+        response = self.client.get('/search/')
+        self.assertEqual(list(response.context['events']), [])
+
+    def test_results_are_paginated(self):
+        for i in range(RESULTS_PER_PAGE + 5):
+            self.create_event(self.calendar, 'Meeting {}'.format(i))
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.context['events']), RESULTS_PER_PAGE)
+        self.assertEqual(response.context['events'].paginator.count,
+            RESULTS_PER_PAGE + 5)
+        self.assertEqual(response.context['active'], 'users')
+        self.assertContains(response, 'events_page=2')
+        response = self.client.get(self.url + '&events_page=2')
+        self.assertEqual(len(response.context['events']), 5)
+        self.assertEqual(response.context['active'], 'events')
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "triggers of SQLite")
+    def test_triggers_dropped_by_migrations_are_reinstalled(self):
+        # like after a migration remaking the table of events
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER my_calendar_event_search_insert')
+        uses_fts_tables.databases.clear()
+        self.assertIn('my_calendar_event_search_insert',
+            get_missing_sqlite_names(connection))
+        self.assertFalse(uses_fts_tables())
+        # substring matching finds events saved without triggers
+        event = self.create_event(self.calendar, 'Weekly meeting')
+        self.assertEqual(list(search_events(self.profile, 'meeting')), [event])
+        reinstall_missing(sender=None, using='default')
+        self.assertEqual(get_missing_sqlite_names(connection), [])
+        self.assertTrue(uses_fts_tables())
+        self.assertEqual(list(search_events(self.profile, 'meeting')), [event])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "plan of SQLite")
+    def test_user_lookup_uses_prefix_indexes(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(lookup_users('JO')[0], [self.profile])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN '
+                + context.captured_queries[0]['sql'])
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        for column in ('username', 'first_name', 'last_name'):
+            self.assertIn('my_calendar_user_{}_prefix'.format(column), plan)
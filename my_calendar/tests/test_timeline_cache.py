@@ -0,0 +1,94 @@
+import datetime
+import pytz
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from my_calendar.models import UserProfile, MyCalendar, Event, Guest
+from my_calendar.additional_functions import fill_week
+from my_calendar.timeline_cache import get_timeline_days
+
+
+class TimelineCacheTest(TestCase):
+
+    def setUp(self):
+        self.owner = UserProfile.objects.create(
+            user=User.objects.create(username='owner'))
+        self.other = UserProfile.objects.create(
+            user=User.objects.create(username='other'))
+        self.calendar = MyCalendar.objects.create(owner=self.owner,
+            name='Work', color='#000FFF')
+        self.calendar.readers.add(self.owner)
+        self.calendar.modifiers.add(self.owner)
+        self.days = fill_week(datetime.date(2017, 3, 15))
+        self.start = pytz.utc.localize(datetime.datetime(2017, 3, 15, 12))
+        self.event = Event.objects.create(calendar=self.calendar,
+            title='Meeting', start=self.start,
+            end=self.start + datetime.timedelta(hours=1))
+
+    def get_titles(self, profile):
+        # fresh profile, as in a new request
+        profile = UserProfile.objects.get(pk=profile.pk)
+        days = get_timeline_days(profile, 'week', self.days, pytz.utc)
+        return [event['title'] for day in days for event in day['events']]
+
+    def test_second_call_reads_cache(self):
+        self.assertEqual(self.get_titles(self.owner), ['Meeting'])
+        profile = UserProfile.objects.get(pk=self.owner.pk)
+        # only ids of accessible calendars and their updated_at are read
+        with self.assertNumQueries(3):
+            get_timeline_days(profile, 'week', self.days, pytz.utc)
+
+    def test_versions_are_read_from_database(self):
+        self.get_titles(self.owner)
+        # as saved by another process, which can't reach this cache
+        Event.objects.filter(pk=self.event.pk).update(title='Lunch')
+        MyCalendar.objects.filter(pk=self.calendar.pk).update(
+            updated_at=self.calendar.updated_at + datetime.timedelta(
+                seconds=1))
+        self.assertEqual(self.get_titles(self.owner), ['Lunch'])
+
+    def test_changed_event_is_not_served_from_cache(self):
+        self.get_titles(self.owner)
+        self.event.title = 'Lunch'
+        self.event.save()
+        self.assertEqual(self.get_titles(self.owner), ['Lunch'])
+        self.event.delete()
+        self.assertEqual(self.get_titles(self.owner), [])
+
+    def test_event_moved_to_other_calendar(self):
+        other_calendar = MyCalendar.objects.create(owner=self.other,
+            name='Home', color='#FFF000')
+        other_calendar.readers.add(self.other)
+        self.assertEqual(self.get_titles(self.other), [])
+        event = Event.objects.get(pk=self.event.pk)
+        event.calendar = other_calendar
+        event.save()
+        self.assertEqual(self.get_titles(self.other), ['Meeting'])
+        self.assertEqual(self.get_titles(self.owner), [])
+
+    def test_guest_changes_invalidate_cache(self):
+        self.assertEqual(self.get_titles(self.other), [])
+        guest = Guest.objects.create(event=self.event, user=self.other)
+        self.assertEqual(self.get_titles(self.other), ['Meeting'])
+        self.event.title = 'Lunch'
+        self.event.save()
+        self.assertEqual(self.get_titles(self.other), ['Lunch'])
+        guest.delete()
+        self.assertEqual(self.get_titles(self.other), [])
+
+    def test_sharing_changes_invalidate_cache(self):
+        self.assertEqual(self.get_titles(self.other), [])
+        self.calendar.readers.add(self.other)
+        self.assertEqual(self.get_titles(self.other), ['Meeting'])
+        self.other.calendars_to_read.clear()
+        self.assertEqual(self.get_titles(self.other), [])
+
+    def test_calendar_color_change_invalidates_cache(self):
+        self.get_titles(self.owner)
+        self.calendar.color = '#FF0000'
+        self.calendar.save()
+        profile = UserProfile.objects.get(pk=self.owner.pk)
+        days = get_timeline_days(profile, 'week', self.days, pytz.utc)
+        colors = [event['color'] for day in days for event in day['events']]
+        self.assertEqual(colors, ['#FF0000'])
@@ -0,0 +1,74 @@
+import re
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from my_calendar.timing import RequestTiming
+from .test_views_base import register
+
+
+SERVER_TIMING_RE = re.compile(
+    r'^db;dur=[0-9.]+;desc="(\d+) queries", tpl;dur=([0-9.]+), '
+    r'total;dur=([0-9.]+)$')
+
+
+@override_settings(REQUEST_TIMING=True)
+class RequestTimingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        with self.assertLogs('my_calendar.timing', 'INFO') as logs:
+            register(self.client)
+        self.assertIn('method=POST path=/register', logs.output[0])
+        self.url = '/month/2017-03-15'
+
+    def test_server_timing_header(self):
+        with self.assertLogs('my_calendar.timing'):
+            response = self.client.get(self.url)
+        match = SERVER_TIMING_RE.match(response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        queries, template, total = match.groups()
+        self.assertGreater(int(queries), 0)
+        self.assertGreater(float(template), 0)
+        self.assertGreaterEqual(float(total), float(template))
+
+    def test_logs_request(self):
+        with self.assertLogs('my_calendar.timing', 'INFO') as logs:
+            self.client.get(self.url)
+        self.assertEqual(len(logs.records), 1)
+        record = logs.records[0]
+        self.assertEqual(record.levelname, 'INFO')
+        self.assertEqual(record.timing['path'], self.url)
+        self.assertEqual(record.timing['status'], 200)
+        self.assertFalse(record.timing['slow'])
+        self.assertIn('path=/month/2017-03-15 status=200', record.getMessage())
+
+    @override_settings(REQUEST_TIMING_MAX_QUERIES=1)
+    def test_request_with_many_queries_is_slow(self):
+        with self.assertLogs('my_calendar.timing', 'INFO') as logs:
+            self.client.get(self.url)
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+        self.assertTrue(logs.records[0].timing['slow'])
+
+
+class RequestTimingTest(TestCase):
+
+    def test_measures_queries_shorter_than_millisecond(self):
+        timing = RequestTiming()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        timing.finish()
+        self.assertEqual(timing.queries, 1)
+        self.assertGreater(timing.db, 0)
+        self.assertLess(timing.db, 0.001)
+        self.assertNotIn('make_cursor', connection.__dict__)
+
+
+class RequestTimingDisabledTest(TestCase):
+
+    def setUp(self):
+        register(self.client)
+        self.url = '/month/2017-03-15'
+
+    def test_no_server_timing_header(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('Server-Timing', response)
@@ -4,6 +4,22 @@ from django.test import TestCase
 from my_calendar.views import index
 
 
+def register(client, username="John123"):
+    """
+    Registers a user through the view, which also logs the client in.
+    """
+    response = client.post(
+        '/register', data={
+            'username': username,
+            'password': 'password',
+            'email': 'example@email.com',
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'timezone': '374',
+    })
+    return response
+
+
 class BaseViewTest(TestCase):
 
     def setUp(self):
@@ -25,16 +41,7 @@ class BaseViewTest(TestCase):
         self.assertTemplateUsed(response, 'my_calendar/base.html')
 
     def user_registers(self, username="John123"):
-        response = self.client.post(
-            '/register', data={
-                'username': username,
-                'password': 'password',
-                'email': 'example@email.com',
-                'first_name': 'John',
-                'last_name': 'Doe',
-                'timezone': '374',
-        })
-        return response
+        return register(self.client, username)
 
 
 class ClassViewTest():
@@ -5,7 +5,10 @@ from django.contrib.auth.models import User
 from django.contrib.auth import get_user
 
 from my_calendar.views import new_calendar, calendar_view, event_view, new_event
-from my_calendar.models import (UserProfile, MyCalendar, Event, Guest)
+from my_calendar.models import (UserProfile, MyCalendar, Event, Guest,
+    EventException)
+from my_calendar.forms import NO_OCCURRENCE_ERROR
+from my_calendar.additional_functions import EVENTS_PER_PAGE
 from .test_views_base import BaseViewTest
 
 
@@ -57,6 +60,20 @@ class NewCalendarViewTest(BaseViewTest):
         self.assertTrue(response.context['calendar_form'].errors)
         self.assertEqual(MyCalendar.objects.count(), calendars_amount)
 
+    def test_wrong_reader_is_form_error(self):
+        calendars_amount = MyCalendar.objects.count()
+        response = self.client.post(
+            self.url, data={
+                'name': 'Name',
+                'color': '#FF0000',
+                'readers': ['abc'],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('readers', response.context['calendar_form'].errors)
+        # the form is rendered again
+        self.assertContains(response, 'name="readers"')
+        self.assertEqual(MyCalendar.objects.count(), calendars_amount)
+
     def test_after_saving_calendar_goes_to_its_site(self):
         response = self.client.post(
             self.url, data={
@@ -168,6 +185,87 @@ class CalendarViewTest(NewCalendarViewTest):
         self.assertIn(event, response.context['events'])
         self.assertFalse(other_event in response.context['events'])
 
+    def create_events(self, number):
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 1, 12))
+        return [Event.objects.create(calendar=self.calendar,
+            start=start + datetime.timedelta(days=i),
+            end=start + datetime.timedelta(days=i, hours=1),
+            title="Event {}".format(i)) for i in range(number)]
+
+    def test_events_are_paginated_with_cursors(self):
+        events = self.create_events(EVENTS_PER_PAGE + 5)
+        response = self.client.get(self.url, {'from': '2017-03-01'})
+        self.assertEqual(response.context['events'], events[:EVENTS_PER_PAGE])
+        self.assertNotIn('older_query', response.context)
+        response = self.client.get(
+            self.url + '?' + response.context['newer_query'])
+        self.assertEqual(response.context['events'], events[EVENTS_PER_PAGE:])
+        self.assertNotIn('newer_query', response.context)
+        response = self.client.get(
+            self.url + '?' + response.context['older_query'])
+        self.assertEqual(response.context['events'], events[:EVENTS_PER_PAGE])
+
+    def test_events_between_dates(self):
+        events = self.create_events(10)
+        response = self.client.get(self.url,
+            {'from': '2017-03-03', 'to': '2017-03-05'})
+        self.assertEqual(response.context['events'], events[2:5])
+        response = self.client.get(self.url,
+            {'from': '2017-03-01', 'to': 'wrong'})
+        self.assertEqual(response.context['events'], events)
+        self.assertIn('date_errors', response.context)
+
+    def test_wrong_cursor_shows_first_page(self):
+        events = self.create_events(3)
+        response = self.client.get(self.url,
+            {'from': '2017-03-01', 'newer': 'wrong'})
+        self.assertEqual(response.context['events'], events)
+
+    def test_first_page_begins_today(self):
+        today = datetime.datetime.combine(datetime.datetime.utcnow().date(),
+            datetime.time(0))
+        events = [Event.objects.create(calendar=self.calendar,
+            start=pytz.utc.localize(today + datetime.timedelta(days=i)),
+            end=pytz.utc.localize(today + datetime.timedelta(days=i, hours=1)),
+            title="Event {}".format(i)) for i in range(-2, 2)]
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['events'], events[2:])
+        self.assertNotIn('newer_query', response.context)
+        response = self.client.get(
+            self.url + '?' + response.context['older_query'])
+        self.assertEqual(response.context['events'], events[:2])
+        self.assertNotIn('older_query', response.context)
+        response = self.client.get(
+            self.url + '?' + response.context['newer_query'])
+        self.assertEqual(response.context['events'], events[2:])
+
+    def test_older_events_without_upcoming_ones(self):
+        events = self.create_events(3)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['events'], [])
+        response = self.client.get(
+            self.url + '?' + response.context['older_query'])
+        self.assertEqual(response.context['events'], events)
+
+    def test_fragment_with_more_events(self):
+        events = self.create_events(EVENTS_PER_PAGE + 5)
+        newer = self.client.get(self.url, {'from': '2017-03-01'}).context[
+            'newer_query']
+        self.assertIn('from=2017-03-01', newer)
+        response = self.client.get('/calendar/1/events?' + newer)
+        self.assertTemplateUsed(response, 'my_calendar/calendar_events.html')
+        self.assertTemplateNotUsed(response, 'my_calendar/base.html')
+        self.assertEqual(response.context['events'], events[EVENTS_PER_PAGE:])
+        self.assertNotContains(response, 'more_events')
+
+    def test_fragment_of_not_accessible_calendar(self):
+        other = UserProfile.objects.create(
+            user=User.objects.create(username='other'))
+        calendar = MyCalendar.objects.create(owner=other, name="Other",
+            color="#E81AD4")
+        response = self.client.get('/calendar/{}/events'.format(calendar.pk))
+        self.assertEqual(response.status_code, 403)
+
 
 class NewEventViewTest(BaseViewTest):
 
@@ -470,6 +568,64 @@ class EventViewTest(NewEventViewTest):
         self.assertIn('user_is_guest', response.context)
         self.assertIn('attending_status_form', response.context)
 
+    def test_others_cannot_see_event(self):
+        self.client.get('/logout')
+        self.user_registers(username="Human")
+        response = self.client.get(self.url)
+        self.assertIn('access_denied', response.context)
+        self.assertNotIn('event', response.context)
+
+    def test_readers_of_calendar_can_see_event(self):
+        self.client.get('/logout')
+        self.user_registers(username="Human")
+        profile = UserProfile.objects.get(user=get_user(self.client))
+        self.calendar.readers.add(profile)
+        response = self.client.get(self.url)
+        self.assertNotIn('access_denied', response.context)
+        self.assertEqual(response.context['event'], self.event)
+        self.assertFalse(response.context['can_modify'])
+
+    def make_weekly(self):
+        self.event.recurrence = Event.WEEKLY
+        self.event.recurrence_count = 3
+        self.event.save()
+        tz = pytz.timezone(self.event.get_timezone_display())
+        return [occurrence.start.astimezone(tz).date()
+            for occurrence in self.event.get_occurrences()]
+
+    def test_deletes_occurrence(self):
+        self.assertNotIn('exception_form', self.client.get(self.url).context)
+        dates = self.make_weekly()
+        response = self.client.get(self.url)
+        self.assertIn('exception_form', response.context)
+        self.assertContains(response, 'Delete this occurrence')
+        response = self.client.post('/delete_occurrence/1',
+            data={'date': dates[1].isoformat()})
+        self.assertRedirects(response, self.url)
+        self.assertEqual(list(EventException.objects.values_list('date',
+            flat=True)), [dates[1]])
+        self.assertEqual(len(list(self.event.get_occurrences())), 2)
+
+    def test_cannot_delete_date_without_occurrence(self):
+        dates = self.make_weekly()
+        response = self.client.post('/delete_occurrence/1',
+            data={'date': (dates[0] + datetime.timedelta(days=1)).isoformat()},
+            follow=True)
+        self.assertEqual(response.context['form_errors']['date'],
+            [NO_OCCURRENCE_ERROR])
+        self.assertEqual(EventException.objects.count(), 0)
+
+    def test_readers_cannot_delete_occurrence(self):
+        dates = self.make_weekly()
+        self.client.get('/logout')
+        self.user_registers(username="Human")
+        profile = UserProfile.objects.get(user=get_user(self.client))
+        self.calendar.readers.add(profile)
+        response = self.client.post('/delete_occurrence/1',
+            data={'date': dates[1].isoformat()})
+        self.assertIn('access_denied', response.context)
+        self.assertEqual(EventException.objects.count(), 0)
+
     def test_saves_attending_status(self):
         response = self.client.post(
             self.rsvp_url, data={
@@ -2,8 +2,10 @@ import datetime
 import pytz
 
 from django.contrib.auth import get_user
+from django.test import TestCase
+from django.urls import resolve
 
-from my_calendar.views import month, week, day
+from my_calendar.views import month, week, day, timeline_json
 from my_calendar.models import (UserProfile, MyCalendar, Event, Guest)
 from .test_views_base import BaseViewTest
 
@@ -94,6 +96,20 @@ class DayViewTest(BaseViewTest):
         height = (4 * 3600) / (24 * 60 * 60)
         self.assertEqual(height, dict_['height'])
 
+    def test_passes_occurrences_of_repeating_events(self):
+        profile = UserProfile.objects.get(user=get_user(self.client))
+        calendar_ = MyCalendar.objects.create(owner=profile, color="#000FFF")
+        calendar_.readers.add(calendar_.owner)
+        start = datetime.datetime.combine(
+            self.today - datetime.timedelta(days=400), datetime.time(13, 30))
+        start = pytz.utc.localize(start)
+        event = Event.objects.create(calendar=calendar_, start=start,
+            end=start + datetime.timedelta(minutes=30),
+            recurrence=Event.DAILY)
+        response = self.client.get(self.url)
+        for dict_ in response.context['days']:
+            self.assertEqual([ev['pk'] for ev in dict_['events']], [event.pk])
+
     def test_passes_correct_earlier_and_later(self):
         response = self.client.get(self.url)
         earlier = self.today - datetime.timedelta(days=1)
@@ -144,6 +160,19 @@ class MonthViewTest(DayViewTest):
         later = datetime.date(year=2016, month=2, day=1)
         self.assertEqual(response.context['later'], later)
 
+    def test_renders_multi_day_event_once_per_week(self):
+        profile = UserProfile.objects.get(user=get_user(self.client))
+        calendar_ = MyCalendar.objects.create(owner=profile, color="#000FFF")
+        calendar_.readers.add(profile)
+        # from Thursday to Tuesday of the next week
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 9, 9))
+        event = Event.objects.create(calendar=calendar_, title='Conference',
+            start=start, end=start + datetime.timedelta(days=5))
+        response = self.client.get(self.base_url + '/2017-03-15')
+        self.assertContains(response, 'Conference', count=2)
+        self.assertContains(response, 'colspan="4"')
+        self.assertContains(response, 'colspan="2"')
+
 class WeekViewTest(DayViewTest):
 
     def setUp(self):
@@ -189,3 +218,83 @@ class WeekViewTest(DayViewTest):
 
 if __name__ == '__main__':
     unittest.main()
+
+
+class TimelineJsonTest(TestCase):
+
+    def setUp(self):
+        self.client.post(
+            '/register', data={
+                'username': 'John123',
+                'password': 'password',
+                'email': 'example@email.com',
+                'first_name': 'John',
+                'last_name': 'Doe',
+                'timezone': '374',
+        })
+        self.profile = UserProfile.objects.get(user=get_user(self.client))
+        self.calendar = MyCalendar.objects.create(owner=self.profile,
+            color="#000FFF")
+        self.calendar.readers.add(self.profile)
+        start = pytz.utc.localize(datetime.datetime(2017, 3, 15, 12))
+        self.event = Event.objects.create(calendar=self.calendar,
+            title='Meeting', start=start,
+            end=start + datetime.timedelta(hours=1))
+
+    def test_url_resoves_to_correct_view(self):
+        found = resolve('/timeline.json')
+        self.assertEqual(found.func, timeline_json)
+
+    def test_returns_days_of_view_with_adjacent_periods(self):
+        response = self.client.get('/timeline.json',
+            {'view': 'month', 'date': '2017-03-15'})
+        data = response.json()
+        self.assertEqual(data['days'][0]['day'], '2017-02-27')
+        self.assertEqual(data['days'][-1]['day'], '2017-04-02')
+        self.assertEqual(data['earlier'], '2017-02-01')
+        self.assertEqual(data['later'], '2017-04-01')
+        self.assertEqual(data['title'], 'March 2017')
+        events = [event for day in data['days'] for event in day['events']]
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['pk'], self.event.pk)
+        self.assertEqual(events[0]['calendar'], self.calendar.pk)
+        self.assertEqual(events[0]['color'], self.calendar.color)
+        self.assertEqual(events[0]['url'], '/event/{}'.format(self.event.pk))
+        self.assertIn('top', events[0])
+        self.assertIn('height', events[0])
+        self.assertEqual(events[0]['left'], 0)
+        self.assertEqual(events[0]['width'], 1)
+        self.assertEqual(len(data['weeks']), 5)
+        self.assertEqual(data['weeks'][2], [{
+            'pk': self.event.pk,
+            'title': 'Meeting',
+            'calendar': self.calendar.pk,
+            'color': self.calendar.color,
+            'url': '/event/{}'.format(self.event.pk),
+            'column': 2,
+            'span': 1,
+            'lane': 0,
+        }])
+
+    def test_returns_days_of_range(self):
+        response = self.client.get('/timeline.json',
+            {'start': '2017-03-14', 'end': '2017-03-16'})
+        data = response.json()
+        self.assertEqual([day['day'] for day in data['days']],
+            ['2017-03-14', '2017-03-15', '2017-03-16'])
+        self.assertEqual(data['days'][1]['events'][0]['title'], 'Meeting')
+        self.assertEqual(data['earlier'], '2017-03-11')
+        self.assertEqual(data['later'], '2017-03-19')
+
+    def test_wrong_parameters(self):
+        wrong = [
+            {'view': 'year', 'date': '2017-03-15'},
+            {'view': 'month', 'date': '2017-13-15'},
+            {'start': '2017-03-15', 'end': '2017-03-14'},
+            {'start': '2017-01-01', 'end': '2017-12-31'},
+            {},
+        ]
+        for params in wrong:
+            response = self.client.get('/timeline.json', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('errors', response.json())
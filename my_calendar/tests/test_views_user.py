@@ -136,3 +136,52 @@ class LogoutViewTest(TestCase):
 
 if __name__ == '__main__':
     unittest.main()
+
+
+class UserLookupTest(TestCase):
+
+    def setUp(self):
+        self.client.post(
+            '/register', data={
+                'username': 'John123',
+                'password': 'password',
+                'email': 'example@email.com',
+                'first_name': 'John',
+                'last_name': 'Doe',
+                'timezone': '374'
+        })
+        for i in range(12):
+            UserProfile.objects.create(user=User.objects.create(
+                username='anna{:02}'.format(i), first_name='Anna',
+                last_name='Smith'))
+        UserProfile.objects.create(user=User.objects.create(
+            username='jsmith', first_name='Jane', last_name='Annaford'))
+
+    def test_prefixes_of_names_ignoring_case(self):
+        data = self.client.get('/users.json', {'q': 'joh'}).json()
+        self.assertEqual([user['username'] for user in data['results']],
+            ['John123'])
+        self.assertEqual(data['results'][0]['text'], 'John Doe')
+        data = self.client.get('/users.json', {'q': 'ANNAF'}).json()
+        self.assertEqual([user['username'] for user in data['results']],
+            ['jsmith'])
+        data = self.client.get('/users.json', {'q': 'smi'}).json()
+        self.assertEqual(len(data['results']), 10)
+
+    def test_pages(self):
+        data = self.client.get('/users.json', {'q': 'ann'}).json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertTrue(data['more'])
+        data = self.client.get('/users.json', {'q': 'ann', 'page': 2}).json()
+        self.assertEqual([user['username'] for user in data['results']],
+            ['anna10', 'anna11', 'jsmith'])
+        self.assertFalse(data['more'])
+
+    def test_empty_prefix(self):
+        data = self.client.get('/users.json', {'q': ' '}).json()
+        self.assertEqual(data, {'results': [], 'more': False})
+
+    def test_anonymous_user(self):
+        self.client.logout()
+        response = self.client.get('/users.json', {'q': 'joh'})
+        self.assertEqual(response.status_code, 302)
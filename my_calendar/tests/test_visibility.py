@@ -0,0 +1,81 @@
+import datetime
+import pytz
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from my_calendar.models import (UserProfile, MyCalendar, Event, Guest,
+    EventVisibility)
+
+
+@override_settings(EVENT_VISIBILITY_INDEX=True)
+class EventVisibilityTest(TestCase):
+
+    def setUp(self):
+        self.owner = UserProfile.objects.create(
+            user=User.objects.create(username='Owner'))
+        self.profile = UserProfile.objects.create(
+            user=User.objects.create(username='John'))
+        self.calendar = MyCalendar.objects.create(owner=self.owner,
+            name="Cindirella", color="#E81AD4")
+        self.calendar.readers.add(self.owner)
+        self.calendar.modifiers.add(self.owner)
+        self.start = pytz.utc.localize(datetime.datetime(2016, 12, 13, 12))
+        self.end = self.start + datetime.timedelta(hours=1)
+        self.event = Event.objects.create(calendar=self.calendar,
+            title="Some title", start=self.start, end=self.end)
+
+    def rows(self):
+        return set(EventVisibility.objects.values_list(
+            'user_id', 'event_id', 'calendar_id', 'start', 'end', 'via'))
+
+    def visible_for(self, profile):
+        return set(profile.get_events_between(self.start, self.end))
+
+    def test_saving_event_indexes_calendar_users(self):
+        self.assertEqual(self.visible_for(self.owner), {self.event})
+        self.assertEqual(EventVisibility.objects.filter(
+            user=self.owner).count(), 2)
+
+    def test_sharing_calendar_adds_and_removes_rows(self):
+        self.calendar.readers.add(self.profile)
+        self.assertEqual(self.visible_for(self.profile), {self.event})
+        self.calendar.readers.remove(self.profile)
+        self.assertEqual(self.visible_for(self.profile), set())
+        self.profile.calendars_to_modify.add(self.calendar)
+        self.assertEqual(self.visible_for(self.profile), {self.event})
+        self.profile.calendars_to_modify.clear()
+        self.assertEqual(self.visible_for(self.profile), set())
+
+    def test_guests_are_indexed(self):
+        guest = Guest.objects.create(event=self.event, user=self.profile)
+        self.assertEqual(self.visible_for(self.profile), {self.event})
+        guest.delete()
+        self.assertEqual(self.visible_for(self.profile), set())
+
+    def test_moving_event_updates_rows(self):
+        self.event.start += datetime.timedelta(days=2)
+        self.event.end += datetime.timedelta(days=2)
+        self.event.save()
+        self.assertEqual(self.visible_for(self.owner), set())
+
+    def test_rebuild_recreates_the_same_rows(self):
+        self.calendar.readers.add(self.profile)
+        Guest.objects.create(event=self.event, user=self.profile)
+        Event.objects.create(calendar=self.calendar, title="Other",
+            start=self.start, end=self.end)
+        rows = self.rows()
+        EventVisibility.objects.all().delete()
+        call_command('rebuild_event_visibility', batch_size=1,
+            stdout=StringIO())
+        self.assertEqual(self.rows(), rows)
+
+    def test_rebuild_with_batches_bigger_than_database_limits(self):
+        # SQLite accepts at most 999 parameters in a single insert
+        Event.objects.bulk_create([Event(calendar=self.calendar, title="Many",
+            start=self.start, end=self.end) for i in range(300)])
+        call_command('rebuild_event_visibility', batch_size=1000,
+            stdout=StringIO())
+        self.assertEqual(EventVisibility.objects.count(), 301 * 2)
@@ -0,0 +1,146 @@
+"""
+Cache of the days structure computed for month, week and day views.
+
+Entries are keyed by user, view type, range of days and versions
+of the data read from the database: ids and updated_at of calendars
+that user can access and updated_at of the user. Signals touch them
+whenever events, guests or calendars change, so stale entries are never
+read again, by any process, and simply expire.
+Handlers are connected in MyCalendarConfig.ready().
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max
+from django.db.models.signals import (post_init, post_save, post_delete,
+    m2m_changed)
+from django.utils.timezone import now
+
+from .models import UserProfile, MyCalendar, Event, EventException, Guest
+from .additional_functions import get_events_from_days, get_timeline_events
+
+
+KEY_PREFIX = 'my_calendar:timeline'
+# changed whenever cached days are built differently,
+# so entries of the previous format aren't read
+DAYS_FORMAT = 2
+
+def get_cache():
+    return caches[getattr(settings, 'TIMELINE_CACHE', 'default')]
+
+def get_timeout():
+    return getattr(settings, 'TIMELINE_CACHE_TIMEOUT', 60 * 60)
+
+def touch_calendars(pks):
+    pks = [pk for pk in pks if pk is not None]
+    if pks:
+        MyCalendar.objects.filter(pk__in=pks).update(updated_at=now())
+
+def touch_users(pks):
+    """
+    pks are ids of profiles or a queryset of them.
+    """
+    UserProfile.objects.filter(pk__in=pks).update(updated_at=now())
+
+def get_user_versions(profile):
+    """
+    Returns versions of the data shown to the user as a list of strings:
+    ids of calendars the user can access, updated_at of the last changed
+    of them and updated_at of the profile, read with it in the request.
+    """
+    calendars_ids = sorted(profile.accessible_calendars_ids)
+    latest = None
+    if calendars_ids:
+        latest = MyCalendar.objects.filter(pk__in=calendars_ids).aggregate(
+            latest=Max('updated_at'))['latest']
+    return ['calendars={}'.format(','.join(map(str, calendars_ids))),
+        'calendars_updated={}'.format(latest),
+        'user={}:{}'.format(profile.pk, profile.updated_at)]
+
+def get_timeline_version(profile, view_type, days, timezone):
+    """
+    Returns a string that changes whenever the timeline of the user
+    for the given days could change.
+    """
+    parts = [view_type, days[0].isoformat(), days[-1].isoformat(),
+        timezone.zone, str(profile.pk)]
+    parts += get_user_versions(profile)
+    return hashlib.md5(' '.join(parts).encode('utf-8')).hexdigest()
+
+def get_timeline_days(profile, view_type, days, timezone):
+    """
+    Returns the result of get_events_from_days for the user's timeline,
+    computed once per version of the data.
+    """
+    key = '{}:days{}:{}'.format(KEY_PREFIX, DAYS_FORMAT,
+        get_timeline_version(profile, view_type, days, timezone))
+    cache = get_cache()
+    final_days = cache.get(key)
+    if final_days is None:
+        events = get_timeline_events(profile, days, timezone)
+        final_days = get_events_from_days(days, events, timezone, profile)
+        cache.set(key, final_days, get_timeout())
+    return final_days
+
+
+def event_loaded(sender, instance, **kwargs):
+    # reading a deferred field would query the database
+    # for every loaded event
+    if 'calendar_id' in instance.__dict__:
+        instance._loaded_calendar_id = instance.calendar_id
+
+def event_changed(sender, instance, **kwargs):
+    # the calendar the event was moved from changes too
+    touch_calendars({instance.calendar_id,
+        getattr(instance, '_loaded_calendar_id', None)})
+    # guests see the event even if they can't access its calendar
+    touch_users(Guest.objects.filter(event_id=instance.pk).values('user_id'))
+    instance._loaded_calendar_id = instance.calendar_id
+
+def exception_changed(sender, instance, **kwargs):
+    touch_calendars(Event.objects.filter(pk=instance.event_id).values_list(
+        'calendar_id', flat=True))
+
+def guest_changed(sender, instance, **kwargs):
+    touch_users([instance.user_id])
+
+def calendar_users_changed(sender, instance, action, reverse, pk_set,
+        **kwargs):
+    """
+    instance is a calendar and pk_set are users or, if reverse,
+    instance is a user and pk_set are calendars.
+    Calendar pages list their readers and modifiers,
+    so both sides are touched.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if action == 'pre_clear':
+        if reverse:
+            pk_set = sender.objects.filter(userprofile=instance).values_list(
+                'mycalendar_id', flat=True)
+        else:
+            pk_set = sender.objects.filter(mycalendar=instance).values_list(
+                'userprofile_id', flat=True)
+        pk_set = list(pk_set)
+    if reverse:
+        touch_users([instance.pk])
+        touch_calendars(pk_set)
+    else:
+        touch_users(pk_set)
+        touch_calendars([instance.pk])
+
+def connect_signals():
+    post_init.connect(event_loaded, sender=Event,
+        dispatch_uid='timeline_cache_event_loaded')
+    for signal in (post_save, post_delete):
+        signal.connect(event_changed, sender=Event,
+            dispatch_uid='timeline_cache_event_changed')
+        signal.connect(exception_changed, sender=EventException,
+            dispatch_uid='timeline_cache_exception_changed')
+        signal.connect(guest_changed, sender=Guest,
+            dispatch_uid='timeline_cache_guest_changed')
+    for through in (MyCalendar.readers.through, MyCalendar.modifiers.through):
+        m2m_changed.connect(calendar_users_changed, sender=through,
+            dispatch_uid='timeline_cache_users_changed_{}'.format(
+                through.__name__))
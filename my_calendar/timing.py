@@ -0,0 +1,153 @@
+"""
+Measurements of single requests: SQL queries, time spent in the database,
+in rendering templates and in the whole view.
+
+RequestTimingMiddleware starts a RequestTiming for every request,
+templates rendered by the DjangoTemplates backend from this module
+add their time to it. Everything is turned on with the REQUEST_TIMING setting.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.template.backends import django as django_backend
+
+
+logger = logging.getLogger('my_calendar.timing')
+
+def is_enabled():
+    return getattr(settings, 'REQUEST_TIMING', False)
+
+def get_thresholds():
+    """
+    Returns duration in milliseconds and number of queries
+    above which requests are reported as slow.
+    """
+    return (getattr(settings, 'REQUEST_TIMING_SLOW_MS', 500),
+        getattr(settings, 'REQUEST_TIMING_MAX_QUERIES', 50))
+
+
+class TimedCursorWrapper(CursorWrapper):
+    """
+    Cursor adding numbers and durations of its queries to a RequestTiming.
+    Durations are measured with perf_counter, as queries_log keeps them
+    rounded to milliseconds.
+    """
+
+    def __init__(self, cursor, db, timing):
+        super().__init__(cursor, db)
+        self.timing = timing
+
+    def timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.timing.add_query_time(time.perf_counter() - started)
+
+    def callproc(self, procname, params=None):
+        return self.timed(super().callproc, procname, params)
+
+    def execute(self, sql, params=None):
+        return self.timed(super().execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.timed(super().executemany, sql, param_list)
+
+
+class RequestTiming:
+    """
+    Measures a request from its creation to finish().
+    Cursors of all database connections are wrapped
+    in TimedCursorWrapper for the time of the request.
+    """
+
+    def __init__(self):
+        self.template = 0.0
+        self.queries = 0
+        self.db = 0.0
+        self.connections = []
+        for connection in connections.all():
+            self.connections.append(connection)
+            for name in ('make_cursor', 'make_debug_cursor'):
+                setattr(connection, name, self.timed_cursor_factory(
+                    connection, getattr(connection, name)))
+        self.started = time.perf_counter()
+
+    def timed_cursor_factory(self, connection, make_cursor):
+        def make_timed_cursor(cursor):
+            return TimedCursorWrapper(make_cursor(cursor), connection, self)
+        return make_timed_cursor
+
+    def add_query_time(self, seconds):
+        self.queries += 1
+        self.db += seconds
+
+    def add_template_time(self, seconds):
+        self.template += seconds
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        for connection in self.connections:
+            # methods of the class are used again
+            for name in ('make_cursor', 'make_debug_cursor'):
+                connection.__dict__.pop(name, None)
+
+    def is_slow(self):
+        slow_ms, max_queries = get_thresholds()
+        return self.total * 1000 > slow_ms or self.queries > max_queries
+
+    def server_timing(self):
+        """
+        Returns value of the Server-Timing header.
+        """
+        return ('db;dur={:.1f};desc="{} queries", tpl;dur={:.1f}, '
+            'total;dur={:.1f}').format(self.db * 1000, self.queries,
+            self.template * 1000, self.total * 1000)
+
+    def log(self, request, response):
+        level = logging.WARNING if self.is_slow() else logging.INFO
+        logger.log(level, 'method=%s path=%s status=%s total_ms=%.1f '
+            'db_ms=%.1f queries=%d template_ms=%.1f slow=%s',
+            request.method, request.path, response.status_code,
+            self.total * 1000, self.db * 1000, self.queries,
+            self.template * 1000, self.is_slow(),
+            extra={'timing': {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': self.total * 1000,
+                'db_ms': self.db * 1000,
+                'queries': self.queries,
+                'template_ms': self.template * 1000,
+                'slow': self.is_slow(),
+            }})
+
+
+class Template(django_backend.Template):
+
+    def render(self, context=None, request=None):
+        timing = getattr(request, 'timing', None)
+        if timing is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.add_template_time(time.perf_counter() - started)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    Django template backend, which adds time of rendering templates
+    to timing of the request they are rendered for.
+    Templates included by other templates are counted with them.
+    """
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
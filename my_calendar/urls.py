@@ -14,13 +14,24 @@ urlpatterns = [
     url(r'^month/(?P<date>[0-9-]+)$', views.month, name='month'),
     url(r'^week/(?P<date>[0-9-]+)$', views.week, name='week'),
     url(r'^day/(?P<date>[0-9-]+)$', views.day, name='day'),
+    url(r'^timeline\.json$', views.timeline_json, name='timeline_json'),
+    url(r'^users\.json$', views.user_lookup, name='user_lookup'),
     url(r'^calendar/new$', views.new_calendar, name='new_calendar'),
     url(r'^calendar/(?P<cal_pk>\d+)$',
         views.calendar_view, name='calendar_view'),
+    url(r'^calendar/(?P<cal_pk>\d+)/events$', views.calendar_events,
+        name='calendar_events'),
+    url(r'^calendar/(?P<cal_pk>\d+)/export\.ics$', views.calendar_export,
+        name='calendar_export'),
+    url(r'^calendar/(?P<cal_pk>\d+)/import$', views.calendar_import,
+        name='calendar_import'),
+    url(r'^export\.ics$', views.events_export, name='events_export'),
     url(r'^event/new$', views.new_event, name='new_event'),
     url(r'^event/(?P<event_pk>\d+)$', views.event_view, name='event_view'),
     url(r'^edit_event/(?P<event_pk>\d+)$', views.edit_event, name='edit_event'),
     url(r'^add_guest/(?P<event_pk>\d+)$', views.add_guest, name='add_guest'),
+    url(r'^delete_occurrence/(?P<event_pk>\d+)$', views.delete_occurrence,
+        name='delete_occurrence'),
     url(r'^rsvp_to_event/(?P<event_pk>\d+)$', views.rsvp_to_event, name='rsvp_to_event'),
     url(r'^search/', views.search, name='search'),
 ]
@@ -2,18 +2,32 @@ import datetime
 import pytz
 import re
 
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.shortcuts import get_object_or_404, render, redirect, reverse
+from django.http import (JsonResponse, StreamingHttpResponse,
+    HttpResponseForbidden, QueryDict)
+from django.utils.dateformat import format as format_date
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.postgres.search import SearchVector
 from django.contrib.auth.models import User
 from django.views import View
+from django.views.decorators.http import condition
 
 from .models import UserProfile, MyCalendar, Event, Guest
 from .forms import (RegisterForm, EventForm, AttendingStatusForm, ProfileForm,
-    CalendarForm, GuestForm)
+    CalendarForm, GuestForm, EventExceptionForm, ImportForm,
+    NOT_UTF8_FILE_ERROR)
 from .additional_functions import (COLORS, fill_month, fill_week,
-    get_events_from_days, get_number_and_name_of_timezone)
+    get_number_and_name_of_timezone, get_days_of_view, get_earlier_and_later,
+    days_to_json, weeks_to_json, get_weeks_of_month, MAX_RANGE_OF_DAYS,
+    get_range_of_days, get_page_of_events)
+from .timeline_cache import get_timeline_days
+from .ics import export_events, import_events
+from .conditional import (timeline_etag, timeline_json_etag, calendar_etag,
+    event_etag, event_last_modified)
+from .timing import RequestTiming, is_enabled as timing_is_enabled
+from . import profiling, search as full_text
 
 
 class AuthRequiredMiddleware(MiddlewareMixin):
@@ -29,6 +43,47 @@ class AuthRequiredMiddleware(MiddlewareMixin):
             return None
         return redirect('my_calendar:index')
 
+class RequestTimingMiddleware:
+    """
+    Adds numbers of queries, time spent in the database, in templates
+    and in the whole request to the Server-Timing header and logs them.
+    Used only with REQUEST_TIMING = True.
+    Streamed responses are measured until the view returns them,
+    before their content is iterated.
+    """
+
+    def __init__(self, get_response):
+        if not timing_is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.timing = RequestTiming()
+        try:
+            response = self.get_response(request)
+        finally:
+            request.timing.finish()
+        response['Server-Timing'] = request.timing.server_timing()
+        request.timing.log(request, response)
+        return response
+
+class ProfilingMiddleware:
+    """
+    Runs cProfile on a fraction of requests and on requests
+    to REQUEST_PROFILING_URL_NAMES, saves profiles of the slow ones.
+    Used only with REQUEST_PROFILING = True.
+    """
+
+    def __init__(self, get_response):
+        if not profiling.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if profiling.should_profile(request):
+            return profiling.profile_request(self.get_response, request)
+        return self.get_response(request)
+
 
 def index(request):
     if request.user.is_authenticated():
@@ -74,8 +129,8 @@ def profile(request, username):
     context['profile'] = profile
     calendars = profile.get_own_calendars()
     context['calendars'] = calendars
-    context['other_calendars'] = (profile.get_calendars_to_read()
-        | profile.get_calendars_to_modify()).exclude(owner=profile).distinct()
+    context['other_calendars'] = profile.get_accessible_calendars().exclude(
+        owner=profile)
     context['upcoming_events'] = profile.get_upcoming_events(5)
 
     return render(request, 'my_calendar/profile.html', context)
@@ -97,6 +152,7 @@ def user_logout(request):
     logout(request)
     return redirect('my_calendar:index')
 
+@condition(etag_func=timeline_etag('month'))
 def month(request, date):
     context = {}
     if request.user.is_authenticated():
@@ -107,25 +163,16 @@ def month(request, date):
             context['date_errors'] = "You enetered wrong date."
         days = fill_month(date_)
         profile = get_object_or_404(UserProfile, user=request.user)
-        events = profile.get_all_events()
         timezone = pytz.timezone(profile.get_timezone_display())
-        context['days'] = get_events_from_days(days, events, timezone, profile)
-        context['calendars'] = (profile.get_calendars_to_modify()
-            | profile.get_calendars_to_read()).distinct()
+        context['days'] = get_timeline_days(profile, 'month', days, timezone)
+        context['weeks'] = get_weeks_of_month(context['days'])
+        context['calendars'] = profile.get_accessible_calendars()
         context['chosen_date'] = date_
-        chosen_month = date_.month
-        decreasing_date = date_
-        while decreasing_date.month == chosen_month:
-            decreasing_date -= datetime.timedelta(days=1)
-        decreasing_date = decreasing_date.replace(day=1)
-        context['earlier'] = decreasing_date
-        increasing_date = date_
-        while increasing_date.month == chosen_month:
-            increasing_date += datetime.timedelta(days=1)
-        increasing_date = increasing_date.replace(day=1)
-        context['later'] = increasing_date
+        context['earlier'], context['later'] = get_earlier_and_later(
+            'month', date_)
     return render(request, 'my_calendar/month.html', context)
 
+@condition(etag_func=timeline_etag('week'))
 def week(request, date):
     context = {}
     if request.user.is_authenticated():
@@ -136,19 +183,18 @@ def week(request, date):
             context['date_errors'] = "You enetered wrong date."
         days = fill_week(date_)
         profile = get_object_or_404(UserProfile, user=request.user)
-        events = profile.get_all_events()
         timezone = pytz.timezone(profile.get_timezone_display())
-        context['days'] = get_events_from_days(days, events, timezone, profile)
-        context['calendars'] = (profile.get_calendars_to_modify()
-            | profile.get_calendars_to_read()).distinct()
+        context['days'] = get_timeline_days(profile, 'week', days, timezone)
+        context['calendars'] = profile.get_accessible_calendars()
         context['chosen_date'] = date_
-        context['earlier'] = date_ - datetime.timedelta(days=7)
-        context['later'] = date_ + datetime.timedelta(days=7)
+        context['earlier'], context['later'] = get_earlier_and_later(
+            'week', date_)
         context['range'] = range(24)
         context['Monday'] = date_ - datetime.timedelta(days=date_.weekday())
         context['Sunday'] = context['Monday'] + datetime.timedelta(days=6)
     return render(request, 'my_calendar/week.html', context)
 
+@condition(etag_func=timeline_etag('day'))
 def day(request, date):
     context = {}
     if request.user.is_authenticated():
@@ -158,19 +204,88 @@ def day(request, date):
             date_ = datetime.datetime.now().date()
             context['date_errors'] = "You enetered wrong date."
         context['chosen_date'] = date_
-        context['earlier'] = date_ - datetime.timedelta(days=1)
-        context['later'] = date_ + datetime.timedelta(days=1)
+        context['earlier'], context['later'] = get_earlier_and_later(
+            'day', date_)
 
         profile = get_object_or_404(UserProfile, user=request.user)
-        events = profile.get_all_events()
         timezone = pytz.timezone(profile.get_timezone_display())
-        context['days'] = get_events_from_days([date_], events,
-            timezone, profile)
-        context['calendars'] = (profile.get_calendars_to_modify()
-            | profile.get_calendars_to_read()).distinct()
+        context['days'] = get_timeline_days(profile, 'day', [date_], timezone)
+        context['calendars'] = profile.get_accessible_calendars()
         context['range'] = range(24)
     return render(request, 'my_calendar/day.html', context)
 
+TIMELINE_TITLES = {
+    'month': "F Y",
+    'week': "d F",
+    'day': "l - d F, Y",
+}
+
+@condition(etag_func=timeline_json_etag)
+def timeline_json(request):
+    """
+    Returns events visible in month, week or day view of the given date
+    or in the given range of days, with dates of adjacent periods.
+    """
+    if not request.user.is_authenticated():
+        return JsonResponse({'errors': ["You are not logged in."]}, status=403)
+    data = {}
+    try:
+        if 'view' in request.GET:
+            view_type = request.GET['view']
+            if view_type not in TIMELINE_TITLES:
+                raise ValueError
+            date_ = datetime.datetime.strptime(
+                request.GET.get('date', ''), "%Y-%m-%d").date()
+            days = get_days_of_view(view_type, date_)
+            data['view'] = view_type
+            data['date'] = date_
+            data['earlier'], data['later'] = get_earlier_and_later(
+                view_type, date_)
+            data['title'] = format_date(date_, TIMELINE_TITLES[view_type])
+            if view_type == 'week':
+                data['title'] = "{} - {}".format(
+                    format_date(days[0], "d F"), format_date(days[-1], "d F Y"))
+        else:
+            view_type = 'range'
+            start = datetime.datetime.strptime(
+                request.GET.get('start', ''), "%Y-%m-%d").date()
+            end = datetime.datetime.strptime(
+                request.GET.get('end', ''), "%Y-%m-%d").date()
+            if not 0 <= (end - start).days < MAX_RANGE_OF_DAYS:
+                raise ValueError
+            days = [start + datetime.timedelta(days=i)
+                for i in range((end - start).days + 1)]
+            length = datetime.timedelta(days=len(days))
+            data['earlier'], data['later'] = start - length, end + length
+    except ValueError:
+        return JsonResponse({'errors': [
+            "You entered wrong view or range of dates."]}, status=400)
+    profile = get_object_or_404(UserProfile, user=request.user)
+    timezone = pytz.timezone(profile.get_timezone_display())
+    timeline_days = get_timeline_days(profile, view_type, days, timezone)
+    data['days'] = days_to_json(timeline_days)
+    if view_type == 'month':
+        data['weeks'] = weeks_to_json(timeline_days)
+    return JsonResponse(data)
+
+def user_lookup(request):
+    """
+    Returns a page of users whose names start with the q parameter,
+    for autocompletion in forms.
+    """
+    if not request.user.is_authenticated():
+        return JsonResponse({'errors': ["You are not logged in."]}, status=403)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    profiles, more = full_text.lookup_users(request.GET.get('q'), page)
+    return JsonResponse({
+        'results': [{'id': profile.pk, 'text': str(profile),
+            'username': profile.user.username} for profile in profiles],
+        'more': more,
+    })
+
 def new_calendar(request):
     context = {}
     if request.user.is_authenticated():
@@ -185,15 +300,15 @@ def new_calendar(request):
         context['calendar_form'] = calendar_form
     return render(request, 'my_calendar/new_calendar.html', context)
 
+@condition(etag_func=calendar_etag)
 def calendar_view(request, cal_pk):
     context = {}
     if request.user.is_authenticated():
         calendar_ = get_object_or_404(MyCalendar, pk=cal_pk)
         profile = get_object_or_404(UserProfile, user=request.user)
         context['profile'] = profile
-        if (profile in calendar_.readers.all()
-            or profile in calendar_.modifiers.all()):
-            if profile == calendar_.owner:
+        if profile.can_read_calendar(calendar_):
+            if profile.pk == calendar_.owner_id:
                 context['colors'] = COLORS
                 calendar_form = CalendarForm(data=request.POST or None,
                     instance=calendar_, owner=profile)
@@ -204,12 +319,115 @@ def calendar_view(request, cal_pk):
                             cal_pk=calendar_.pk)
                 context['calendar_form'] = calendar_form
             context['calendar'] = calendar_
-            events = Event.objects.filter(calendar=calendar_)
-            context['events'] = events
+            context['can_modify'] = profile.can_modify_calendar(calendar_)
+            context['readers'] = calendar_.readers.select_related('user')
+            context['modifiers'] = calendar_.modifiers.select_related('user')
+            context.update(get_calendar_events(request, calendar_, profile))
         else:
             context['access_denied'] = "You don't have access to this calendar."
     return render(request, 'my_calendar/calendar.html', context)
 
+def get_calendar_events(request, calendar_, profile):
+    """
+    Returns context with a page of events of the calendar chosen by
+    newer or older cursor and optionally limited to events beginning
+    between from and to dates, and with query strings of adjacent pages.
+    Without a cursor and dates the page begins today, in user's timezone,
+    and earlier events are on older pages.
+    """
+    context = {}
+    # only fields shown in the list
+    events = Event.objects.filter(calendar=calendar_).only('calendar', 'title',
+        'start')
+    timezone = pytz.timezone(profile.get_timezone_display())
+    range_ = {}
+    try:
+        for key in ('from', 'to'):
+            if request.GET.get(key):
+                range_[key] = datetime.datetime.strptime(
+                    request.GET[key], "%Y-%m-%d").date()
+                context[key] = range_[key]
+    except ValueError:
+        context['date_errors'] = "You enetered wrong date."
+    if 'from' in range_:
+        events = events.filter(
+            start__gte=get_range_of_days([range_['from']], timezone)[0])
+    if 'to' in range_:
+        events = events.filter(
+            start__lt=get_range_of_days([range_['to']], timezone)[1])
+    since = None
+    if not range_:
+        since = get_range_of_days([profile.get_today()], timezone)[0]
+    try:
+        page = get_page_of_events(events, newer=request.GET.get('newer'),
+            older=request.GET.get('older'), since=since)
+    except ValueError:
+        page = get_page_of_events(events, since=since)
+    context['events'] = page['events']
+    for direction in ('newer', 'older'):
+        if page[direction] is not None:
+            query = QueryDict(mutable=True)
+            query.update(dict((key, request.GET[key]) for key in range_))
+            query[direction] = page[direction]
+            context[direction + '_query'] = query.urlencode()
+    return context
+
+def calendar_events(request, cal_pk):
+    """
+    Returns a fragment of the calendar page with the next page of events,
+    loaded by the "More events" link.
+    """
+    calendar_ = get_object_or_404(MyCalendar, pk=cal_pk)
+    profile = get_object_or_404(UserProfile, user=request.user)
+    if not profile.can_read_calendar(calendar_):
+        return HttpResponseForbidden("You don't have access to this calendar.")
+    context = get_calendar_events(request, calendar_, profile)
+    context['calendar'] = calendar_
+    return render(request, 'my_calendar/calendar_events.html', context)
+
+def ics_response(lines, filename):
+    response = StreamingHttpResponse(lines,
+        content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+        filename)
+    return response
+
+def calendar_export(request, cal_pk):
+    calendar_ = get_object_or_404(MyCalendar, pk=cal_pk)
+    profile = get_object_or_404(UserProfile, user=request.user)
+    if not profile.can_read_calendar(calendar_):
+        return HttpResponseForbidden("You don't have access to this calendar.")
+    events = Event.objects.filter(calendar=calendar_)
+    return ics_response(export_events(events, name=calendar_.name),
+        'calendar-{}.ics'.format(calendar_.pk))
+
+def events_export(request):
+    profile = get_object_or_404(UserProfile, user=request.user)
+    return ics_response(export_events(profile.get_accessible_events(),
+        name=str(profile)), 'events.ics')
+
+def calendar_import(request, cal_pk):
+    context = {}
+    if request.user.is_authenticated():
+        calendar_ = get_object_or_404(MyCalendar, pk=cal_pk)
+        profile = get_object_or_404(UserProfile, user=request.user)
+        if profile.can_modify_calendar(calendar_):
+            context['calendar'] = calendar_
+            import_form = ImportForm(data=request.POST or None,
+                files=request.FILES or None)
+            if request.method == "POST" and import_form.is_valid():
+                timezone = pytz.timezone(profile.get_timezone_display())
+                try:
+                    context['result'] = import_events(
+                        import_form.cleaned_data['file'], calendar_,
+                        default_timezone=timezone)
+                except UnicodeDecodeError:
+                    import_form.add_error('file', NOT_UTF8_FILE_ERROR)
+            context['import_form'] = import_form
+        else:
+            context['access_denied'] = "You don't have access to modify this calendar."
+    return render(request, 'my_calendar/import.html', context)
+
 def new_event(request):
     context = {}
     if request.user.is_authenticated():
@@ -220,7 +438,7 @@ def new_event(request):
         if request.GET.get('cal_pk'):
             cal_pk = request.GET.get('cal_pk')
             calendar = MyCalendar.objects.filter(pk=cal_pk).first()
-            if calendar and profile in calendar.modifiers.all():
+            if calendar and profile.can_modify_calendar(calendar):
                 event.calendar = calendar
         timezone = get_number_and_name_of_timezone(profile)
         event_form = EventForm(data=request.POST or None, user=profile,
@@ -238,12 +456,14 @@ def new_event(request):
         context['attending_status_form'] = attending_status_form
     return render(request, 'my_calendar/new_event.html', context)
 
+@condition(etag_func=event_etag, last_modified_func=event_last_modified)
 def event_view(request, event_pk, event_form=None):
     context = {}
     if not request.user.is_authenticated():
         return render(request, 'my_calendar/event.html', context)
 
-    event = get_object_or_404(Event, pk=event_pk)
+    event = get_object_or_404(Event.objects.select_related('calendar'),
+        pk=event_pk)
     profile = get_object_or_404(UserProfile, user=request.user)
     context['profile'] = profile
     try:
@@ -258,13 +478,17 @@ def event_view(request, event_pk, event_form=None):
         context['non_field_errors'] = request.session.pop('non_field_errors')
         context['invalid_form'] = request.session.pop('invalid_form')
 
-    if event in profile.get_all_events():
+    if context.get('user_is_guest') or profile.can_read_event(event):
         context['event'] = event
-        context['guests'] = Guest.objects.filter(event=event)
-        if profile in event.calendar.modifiers.all():
+        context['guests'] = Guest.objects.filter(event=event).select_related(
+            'user__user')
+        context['can_modify'] = profile.can_modify_event(event)
+        if context['can_modify']:
             timezone = get_number_and_name_of_timezone(event)
             context['event_form'] = EventForm(user=profile, instance=event, timezone=timezone)
             context['guest_form'] = GuestForm(event=event)
+            if event.is_recurring:
+                context['exception_form'] = EventExceptionForm(event=event)
     else:
         context['access_denied'] = "You don't have access to this event."
     return render(request, 'my_calendar/event.html', context)
@@ -274,7 +498,7 @@ def edit_event(request, event_pk):
     if request.user.is_authenticated():
         event = get_object_or_404(Event, pk=event_pk)
         profile = get_object_or_404(UserProfile, user=request.user)
-        if profile in event.calendar.modifiers.all():
+        if profile.can_modify_event(event):
             if request.method == "POST":
                 form = EventForm(data=request.POST, user=profile, instance=event)
                 if form.is_valid(user=profile):
@@ -293,7 +517,7 @@ def add_guest(request, event_pk):
     if request.user.is_authenticated():
         event = get_object_or_404(Event, pk=event_pk)
         profile = get_object_or_404(UserProfile, user=request.user)
-        if profile in event.calendar.modifiers.all():
+        if profile.can_modify_event(event):
             if request.method == "POST":
                 form = GuestForm(data=request.POST, event=event)
                 if form.is_valid():
@@ -307,6 +531,25 @@ def add_guest(request, event_pk):
             context['access_denied'] = "You don't have access to modify this event."
     return render(request, 'my_calendar/event.html', context)
 
+def delete_occurrence(request, event_pk):
+    context = {}
+    if request.user.is_authenticated():
+        event = get_object_or_404(Event, pk=event_pk)
+        profile = get_object_or_404(UserProfile, user=request.user)
+        if profile.can_modify_event(event):
+            if request.method == "POST":
+                form = EventExceptionForm(data=request.POST, event=event)
+                if form.is_valid():
+                    form.save()
+                else:
+                    request.session['form_errors'] = form.errors
+                    request.session['non_field_errors'] = form.non_field_errors()
+                    request.session['invalid_form'] = 'deleting occurrence'
+                return redirect('my_calendar:event_view', event_pk=event.pk)
+        else:
+            context['access_denied'] = "You don't have access to modify this event."
+    return render(request, 'my_calendar/event.html', context)
+
 def rsvp_to_event(request, event_pk):
     context = {}
     if request.user.is_authenticated():
@@ -328,15 +571,31 @@ def rsvp_to_event(request, event_pk):
     return render(request, 'my_calendar/event.html', context)
 
 
+SEARCH_KINDS = ('users', 'calendars', 'events')
+
+def get_page(queryset, number):
+    paginator = Paginator(queryset, full_text.RESULTS_PER_PAGE)
+    try:
+        return paginator.page(number)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
 def search(request):
-    phrase = request.GET.get('phrase')
+    phrase = request.GET.get('phrase', '')
     context = {'phrase': phrase}
-    context['users'] = (UserProfile.objects.filter(
-        user__first_name__startswith=phrase) |
-        UserProfile.objects.filter(
-        user__last_name__startswith=phrase)).distinct()
-    context['calendars'] = MyCalendar.objects.filter(
-        name__contains=phrase)
-    context['events'] = Event.objects.filter(
-        title__contains=phrase)
+    profile = get_object_or_404(UserProfile, user=request.user)
+    results = {
+        'users': full_text.search_users(phrase),
+        'calendars': full_text.search_calendars(profile, phrase),
+        'events': full_text.search_events(profile, phrase),
+    }
+    # the tab of the last turned page stays open
+    context['active'] = 'users'
+    for kind in SEARCH_KINDS:
+        number = request.GET.get(kind + '_page')
+        if number:
+            context['active'] = kind
+        context[kind] = get_page(results[kind], number or 1)
     return render(request, 'my_calendar/search.html', context)
@@ -0,0 +1,190 @@
+"""
+Maintenance of the denormalized EventVisibility table.
+Handlers are connected in MyCalendarConfig.ready()
+and do nothing unless EVENT_VISIBILITY_INDEX setting is on.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from .models import (MyCalendar, Event, Guest, EventVisibility,
+    event_visibility_index_enabled)
+
+
+CALENDAR_RELATIONS = (
+    (MyCalendar.readers.through, EventVisibility.READER),
+    (MyCalendar.modifiers.through, EventVisibility.MODIFIER),
+)
+
+def visible_until(end, recurrence, series_end):
+    """
+    Returns the end stored in visibility rows:
+    end of the event or end of the last occurrence of repeating event.
+    """
+    if recurrence == Event.NEVER:
+        return end
+    return series_end
+
+def rows_for_events(events):
+    """
+    Returns unsaved EventVisibility rows for the given events.
+    Events must have calendar_id, start, end, recurrence
+    and series_end loaded.
+    """
+    calendars_ids = set(event.calendar_id for event in events)
+    users_of_calendars = {}
+    for through, via in CALENDAR_RELATIONS:
+        pairs = through.objects.filter(
+            mycalendar_id__in=calendars_ids).values_list(
+            'mycalendar_id', 'userprofile_id')
+        for calendar_id, user_id in pairs:
+            users_of_calendars.setdefault(calendar_id, []).append(
+                (user_id, via))
+    guests = Guest.objects.filter(
+        event__in=[event.pk for event in events]).values_list(
+        'event_id', 'user_id')
+    guests_of_events = {}
+    for event_id, user_id in guests:
+        guests_of_events.setdefault(event_id, []).append(
+            (user_id, EventVisibility.GUEST))
+
+    rows = []
+    for event in events:
+        for user_id, via in (users_of_calendars.get(event.calendar_id, [])
+                + guests_of_events.get(event.pk, [])):
+            rows.append(EventVisibility(user_id=user_id, event_id=event.pk,
+                calendar_id=event.calendar_id, start=event.start,
+                end=visible_until(event.end, event.recurrence,
+                    event.series_end),
+                via=via))
+    return rows
+
+def refresh_event(event):
+    EventVisibility.objects.filter(event=event).delete()
+    EventVisibility.objects.bulk_create(rows_for_events([event]))
+
+def add_users_of_calendars(calendars_ids, users_ids, via, batch_size=1000):
+    """
+    Adds rows for all events of the calendars and all given users.
+    """
+    events = Event.objects.filter(calendar__in=calendars_ids).values_list(
+        'pk', 'calendar_id', 'start', 'end', 'recurrence', 'series_end')
+    rows = []
+    for (event_id, calendar_id, start, end, recurrence,
+            series_end) in events.iterator():
+        end = visible_until(end, recurrence, series_end)
+        for user_id in users_ids:
+            rows.append(EventVisibility(user_id=user_id, event_id=event_id,
+                calendar_id=calendar_id, start=start, end=end, via=via))
+        if len(rows) >= batch_size:
+            EventVisibility.objects.bulk_create(rows)
+            rows = []
+    EventVisibility.objects.bulk_create(rows)
+
+def add_events_after(calendar, last_pk):
+    """
+    Adds rows of events of the calendar with primary key greater
+    than last_pk, e.g. events just created with bulk_create,
+    which doesn't send signals.
+    Returns the greatest primary key of the added events or last_pk.
+    """
+    if not event_visibility_index_enabled():
+        return last_pk
+    events = list(Event.objects.filter(calendar=calendar,
+        pk__gt=last_pk).order_by('pk').only('pk', 'calendar_id', 'start',
+        'end', 'recurrence', 'series_end'))
+    if not events:
+        return last_pk
+    # events saved one by one already have rows from event_saved
+    EventVisibility.objects.filter(
+        event__in=[event.pk for event in events]).delete()
+    EventVisibility.objects.bulk_create(rows_for_events(events))
+    return events[-1].pk
+
+def rebuild(batch_size=1000, stdout=None):
+    """
+    Recreates the whole table, batch_size events at a time.
+    Returns number of created rows.
+    """
+    EventVisibility.objects.all().delete()
+    created = 0
+    last_pk = 0
+    while True:
+        events = list(Event.objects.filter(pk__gt=last_pk).order_by(
+            'pk').only('pk', 'calendar_id', 'start', 'end', 'recurrence',
+            'series_end')[:batch_size])
+        if not events:
+            break
+        with transaction.atomic():
+            # Django splits rows into statements small enough for the backend
+            rows = EventVisibility.objects.bulk_create(rows_for_events(events))
+        created += len(rows)
+        last_pk = events[-1].pk
+        if stdout is not None:
+            stdout.write("Indexed events up to {} ({} rows).".format(
+                last_pk, created))
+    return created
+
+
+def event_saved(sender, instance, **kwargs):
+    if event_visibility_index_enabled():
+        refresh_event(instance)
+
+def guest_saved(sender, instance, created, **kwargs):
+    if event_visibility_index_enabled():
+        event = instance.event
+        EventVisibility.objects.get_or_create(user_id=instance.user_id,
+            event=event, via=EventVisibility.GUEST, defaults={
+                'calendar_id': event.calendar_id,
+                'start': event.start,
+                'end': visible_until(event.end, event.recurrence,
+                    event.series_end),
+            })
+
+def guest_deleted(sender, instance, **kwargs):
+    if event_visibility_index_enabled():
+        EventVisibility.objects.filter(user_id=instance.user_id,
+            event_id=instance.event_id, via=EventVisibility.GUEST).delete()
+
+def calendar_users_changed(sender, instance, action, reverse, pk_set,
+        via, **kwargs):
+    """
+    instance is a calendar and pk_set are users or, if reverse,
+    instance is a user and pk_set are calendars.
+    """
+    if not event_visibility_index_enabled():
+        return
+    if reverse:
+        rows = EventVisibility.objects.filter(user=instance, via=via)
+    else:
+        rows = EventVisibility.objects.filter(calendar=instance, via=via)
+    if action == 'post_add':
+        if reverse:
+            add_users_of_calendars(pk_set, [instance.pk], via)
+        else:
+            add_users_of_calendars([instance.pk], pk_set, via)
+    elif action == 'post_remove':
+        if reverse:
+            rows.filter(calendar__in=pk_set).delete()
+        else:
+            rows.filter(user__in=pk_set).delete()
+    elif action == 'post_clear':
+        rows.delete()
+
+def readers_changed(**kwargs):
+    calendar_users_changed(via=EventVisibility.READER, **kwargs)
+
+def modifiers_changed(**kwargs):
+    calendar_users_changed(via=EventVisibility.MODIFIER, **kwargs)
+
+def connect_signals():
+    post_save.connect(event_saved, sender=Event,
+        dispatch_uid='visibility_event_saved')
+    post_save.connect(guest_saved, sender=Guest,
+        dispatch_uid='visibility_guest_saved')
+    post_delete.connect(guest_deleted, sender=Guest,
+        dispatch_uid='visibility_guest_deleted')
+    m2m_changed.connect(readers_changed, sender=MyCalendar.readers.through,
+        dispatch_uid='visibility_readers_changed')
+    m2m_changed.connect(modifiers_changed,
+        sender=MyCalendar.modifiers.through,
+        dispatch_uid='visibility_modifiers_changed')
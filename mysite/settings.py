@@ -29,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'my_calendar.views.RequestTimingMiddleware',
+    'my_calendar.views.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,7 +45,7 @@ ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'my_calendar.timing.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -71,6 +73,89 @@ DATABASES = {
 }
 
 
+# Keep the denormalized my_calendar.EventVisibility table up to date and use
+# it for timeline queries. After turning it on for existing data run
+# `manage.py rebuild_event_visibility`.
+
+EVENT_VISIBILITY_INDEX = False
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.10/topics/cache/
+# The days of month, week and day views are cached in TIMELINE_CACHE.
+# Entries are keyed by versions read from the database, so every process
+# sees changes, also with a per-process backend like locmem; a shared
+# backend (memcached, file or database) lets processes reuse entries.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'my_calendar',
+    }
+}
+
+TIMELINE_CACHE = 'default'
+
+TIMELINE_CACHE_TIMEOUT = 60 * 60
+
+
+# Numbers of queries and times of database, templates and whole requests
+# are sent in the Server-Timing header and logged by
+# my_calendar.views.RequestTimingMiddleware. Requests longer than
+# REQUEST_TIMING_SLOW_MS milliseconds or with more than
+# REQUEST_TIMING_MAX_QUERIES queries are logged as warnings.
+
+REQUEST_TIMING = False
+
+REQUEST_TIMING_SLOW_MS = 500
+
+REQUEST_TIMING_MAX_QUERIES = 50
+
+
+# my_calendar.views.ProfilingMiddleware runs cProfile on
+# REQUEST_PROFILING_RATE of all requests and on every request to
+# REQUEST_PROFILING_URL_NAMES. Profiles of requests longer than
+# REQUEST_PROFILING_SLOW_MS milliseconds are saved to REQUEST_PROFILING_DIR
+# and REQUEST_PROFILING_TOP functions with the longest cumulative time
+# are logged.
+
+REQUEST_PROFILING = False
+
+REQUEST_PROFILING_RATE = 0.01
+
+REQUEST_PROFILING_URL_NAMES = ()
+
+REQUEST_PROFILING_SLOW_MS = 1000
+
+REQUEST_PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+
+REQUEST_PROFILING_TOP = 20
+
+
+# Logging
+# https://docs.djangoproject.com/en/1.10/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'my_calendar.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'my_calendar.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
 